@@ -37,6 +37,8 @@ SITE_ID = 1
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'apps.middleware.StaticFilesMiddleware',
+    'apps.middleware.PerformanceMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.locale.LocaleMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -59,6 +61,8 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'apps.context_processors.site_settings',
+                'apps.context_processors.catalogue',
             ],
         },
     },
@@ -78,6 +82,22 @@ DATABASES = {
         'PORT': os.getenv('POSTGRES_PORT'),
     }
 }
+
+# Общий кэш между воркерами (Redis), без REDIS_URL — локальный кэш процесса
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
     {'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator'},
@@ -93,8 +113,20 @@ USE_TZ = True
 STATIC_URL = 'static/'
 STATIC_ROOT = BASE_DIR / 'static'
 
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    # collectstatic кладёт хэшированные имена и .gz/.br рядом
+    'staticfiles': {'BACKEND': 'apps.storage.CompressedManifestStaticFilesStorage'},
+}
+
+# Без CDN статику из STATIC_ROOT отдаёт сам Django (apps.middleware.StaticFilesMiddleware)
+SERVE_STATIC = os.getenv('SERVE_STATIC') == '1'
+STATIC_MAX_AGE = 60 * 60 * 24 * 365
+
 MEDIA_URL = 'media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+# Импорт каталога берёт картинки только из этого каталога (пути в файле — относительно него)
+CATALOGUE_IMPORT_DIR = os.getenv('CATALOGUE_IMPORT_DIR', BASE_DIR / 'import')
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -120,4 +152,68 @@ PARLER_LANGUAGES = {
 
 AUTH_USER_MODEL = 'apps.User'
 
+# Сессии: cached_db читает из кэша и пишет в БД только при изменении, signed_cookies не трогает БД вовсе.
+# Просроченные строки django_session чистит manage.py purge_sessions (make purge-sessions, по крону)
+SESSION_ENGINES = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cache': 'django.contrib.sessions.backends.cache',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+}
+SESSION_ENGINE = SESSION_ENGINES.get(os.getenv('SESSION_ENGINE', 'cached_db'), os.getenv('SESSION_ENGINE'))
+SESSION_COOKIE_AGE = int(os.getenv('SESSION_COOKIE_AGE', 60 * 60 * 24 * 14))
+
+# Визиты по потокам копятся в памяти и сбрасываются в БД раз в N секунд
+VISIT_FLUSH_INTERVAL = int(os.getenv('VISIT_FLUSH_INTERVAL', 5))
+
+# В тестах включаем, чтобы вьюхи с query_budget падали при N+1
+QUERY_BUDGET_ENFORCE = os.getenv('QUERY_BUDGET_ENFORCE') == '1'
+
+WISHLIST_CACHE_TIMEOUT = 600
+SITE_SETTINGS_TTL = 300
+# Список категорий и кэш карточек товаров; сбрасываются версией каталога при сохранении
+CATALOGUE_CACHE_TIMEOUT = 60 * 60 * 24
+LEADERBOARD_SIZE = 100
+# Поиск (apps.search) возвращает не больше стольких лучших по рангу товаров; страница поиска без
+# пагинации, совпадения ниже порога не показываются — покупателю остаётся уточнить запрос
+SEARCH_RESULT_LIMIT = int(os.getenv('SEARCH_RESULT_LIMIT', 200))
+
+# Сколько секунд заказ закреплён за оператором, открывшим его
+ORDER_CLAIM_LEASE = 600
+ORDER_CLAIM_BATCH = 10
+
+# Сколько часов новый заказ держит товар на складе, пока оператор его не обработал
+STOCK_RESERVATION_TTL = int(os.getenv('STOCK_RESERVATION_TTL', 48))
+
+# Повторный заказ того же товара с того же номера в течение N секунд показывает прежний заказ
+# и оформляется только после подтверждения покупателем
+ORDER_DEDUPE_WINDOW = 600
+ORDER_DEDUPE_CACHE = 'default'
+
+# Ограничение частоты POST на вход, оформление и захват заказов (apps.ratelimit): скользящие окна по IP,
+# номеру телефона и пользователю. Повтор уже принятой формы заказа лимит не тратит.
+# Бэкенды: LocalBackend (память процесса), CacheBackend (кэш Django), RedisBackend (пакет redis)
+RATELIMIT_ENABLED = os.getenv('RATELIMIT_ENABLED', '1') == '1'
+RATELIMIT_BACKEND = os.getenv('RATELIMIT_BACKEND', 'apps.ratelimit.CacheBackend')
+RATELIMIT_REDIS_URL = os.getenv('RATELIMIT_REDIS_URL', os.getenv('REDIS_URL', 'redis://localhost:6379/0'))
+# включать только за прокси, который сам выставляет X-Forwarded-For
+RATELIMIT_TRUST_FORWARDED = os.getenv('RATELIMIT_TRUST_FORWARDED') == '1'
+RATELIMITS = {
+    'auth': [('ip', '20/m'), ('phone', '5/m')],
+    'order': [('ip', '10/m'), ('phone', '3/10m')],
+    'claim': [('user', '30/m')],
+}
+
+# Ширины превью картинок (media/thumbs/), WebP если Pillow его умеет, иначе JPEG
+THUMBNAIL_WIDTHS = (240, 480, 960)
+THUMBNAIL_QUALITY = 80
+
+# Замеры запросов (apps.middleware.PerformanceMiddleware), включаются явно: Server-Timing видят
+# только staff и DEBUG, доля PERF_SAMPLE_RATE пишется в PERF_LOG_PATH, сводка — manage.py perf_summary.
+# Файл больше PERF_LOG_MAX_BYTES переименовывается в .1, старый .1 удаляется
+PERF_ENABLED = os.getenv('PERF_ENABLED', '0') == '1'
+PERF_SAMPLE_RATE = float(os.getenv('PERF_SAMPLE_RATE', 0.05))
+PERF_LOG_PATH = os.getenv('PERF_LOG_PATH', BASE_DIR / 'perf.jsonl')
+PERF_LOG_MAX_BYTES = int(os.getenv('PERF_LOG_MAX_BYTES', 10 * 1024 * 1024))
+
 # Удалена секция SOCIALACCOUNT_PROVIDERS с Twitter
@@ -1,19 +1,83 @@
-from django.contrib import admin
+import io
+
+from django import forms
+from django.contrib import admin, messages
 from django.contrib.admin import ModelAdmin
 from django.contrib.sites.models import Site
+from django.http import StreamingHttpResponse
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path
 from parler.admin import TranslatableAdmin
 
-from apps.models import Category, Product, SiteSettings, Order, Withdraw
+from apps.catalogue import guess_format, read_rows, export_rows, serialize_rows, import_products, \
+    import_categories
+from apps.models import Category, Product, SiteSettings, Order, Withdraw, BalanceTransaction, StockReservation
+
+
+class CatalogueImportForm(forms.Form):
+    file = forms.FileField()
+
+
+# админка модели задаёт importer — функцию импорта из apps.catalogue
+class CatalogueAdminMixin:
+    change_list_template = 'admin/apps/catalogue_change_list.html'
+    actions = ('export_csv', 'export_jsonl')
+
+    def _export(self, queryset, fmt):
+        model = self.model
+        response = StreamingHttpResponse(serialize_rows(model, export_rows(model, queryset), fmt),
+                                         content_type='text/csv' if fmt == 'csv' else 'application/x-ndjson')
+        response['Content-Disposition'] = f'attachment; filename="{model._meta.model_name}s.{fmt}"'
+        return response
+
+    @admin.action(description='Export selected to CSV')
+    def export_csv(self, request, queryset):
+        return self._export(queryset, 'csv')
+
+    @admin.action(description='Export selected to JSONL')
+    def export_jsonl(self, request, queryset):
+        return self._export(queryset, 'jsonl')
+
+    def get_urls(self):
+        info = self.model._meta.app_label, self.model._meta.model_name
+        return [
+            path('import/', self.admin_site.admin_view(self.import_view), name='%s_%s_import' % info),
+            *super().get_urls(),
+        ]
+
+    def import_view(self, request):
+        if not self.has_add_permission(request) or not self.has_change_permission(request):
+            return redirect('admin:index')
+        form = CatalogueImportForm(request.POST or None, request.FILES or None)
+        if form.is_valid():
+            upload = form.cleaned_data['file']
+            stream = io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline='')
+            try:
+                created, updated = self.importer(read_rows(stream, guess_format(upload.name)))
+            except ValueError as e:
+                messages.error(request, str(e))
+            else:
+                messages.success(request, f'Created {created}, updated {updated}')
+                return redirect(f'admin:{self.model._meta.app_label}_{self.model._meta.model_name}_changelist')
+        return TemplateResponse(request, 'admin/apps/catalogue_import.html', {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'form': form,
+            'title': f'Import {self.model._meta.verbose_name_plural}',
+        })
 
 
 # Register your models here.
 @admin.register(Category)
-class CategoryAdmin(TranslatableAdmin):
+class CategoryAdmin(CatalogueAdminMixin, TranslatableAdmin):
     exclude = ('slug',)
+    importer = staticmethod(import_categories)
 
 @admin.register(Product)
-class ProductAdmin(TranslatableAdmin):
+class ProductAdmin(CatalogueAdminMixin, TranslatableAdmin):
     exclude = ('slug',)
+    importer = staticmethod(import_products)
 
 @admin.register(SiteSettings)
 class SiteSettingsAdmin(ModelAdmin):
@@ -25,4 +89,34 @@ class OrderAdmin(ModelAdmin):
 
 @admin.register(Withdraw)
 class WithdrawAdmin(ModelAdmin):
-    list_display = 'card_number','user','amount','status','pay_check'
\ No newline at end of file
+    list_display = 'card_number','user','amount','status','pay_check'
+
+@admin.register(BalanceTransaction)
+class BalanceTransactionAdmin(ModelAdmin):
+    list_display = 'user', 'kind', 'amount', 'balance_after', 'withdraw', 'created_at'
+    list_filter = 'kind',
+    list_select_related = 'user', 'withdraw'
+
+    # журнал только дописывается: правки — через новую запись ADJUSTMENT
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(StockReservation)
+class StockReservationAdmin(ModelAdmin):
+    list_display = 'order', 'product', 'quantity', 'expires_at', 'updated_at'
+    list_select_related = 'order', 'product'
+    raw_id_fields = 'order', 'product'
+
+    # резерв меняется только вместе с заказом, иначе остаток на складе разойдётся
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,104 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import get_language
+
+WISHLIST_KEY = 'wishlist:{}'
+SITE_SETTINGS_VERSION_KEY = 'site-settings:version'
+CATALOGUE_VERSION_KEY = 'catalogue:version'
+CATEGORIES_KEY = 'categories:{}:{}'
+DISTRICTS_VERSION_KEY = 'districts:version'
+
+_site_settings = {'version': None, 'value': None, 'expires': 0}
+_site_settings_lock = threading.Lock()
+# region_id -> [{'id', 'name'}]; регионы и районы почти не меняются
+_districts = {'version': None, 'value': None}
+
+
+def get_wishlist_ids(user_id):
+    from apps.models import WishList
+
+    key = WISHLIST_KEY.format(user_id)
+    product_ids = cache.get(key)
+    if product_ids is None:
+        product_ids = frozenset(WishList.objects.filter(user_id=user_id).values_list('product_id', flat=True))
+        cache.set(key, product_ids, getattr(settings, 'WISHLIST_CACHE_TIMEOUT', 600))
+    return product_ids
+
+
+def invalidate_wishlist(user_id):
+    cache.delete(WISHLIST_KEY.format(user_id))
+
+
+def get_site_settings():
+    # копия в памяти процесса живёт SITE_SETTINGS_TTL секунд, версия в общем кэше сбрасывает её во всех воркерах
+    from apps.models import SiteSettings
+
+    version = cache.get_or_set(SITE_SETTINGS_VERSION_KEY, 1, None)
+    with _site_settings_lock:
+        if _site_settings['version'] == version and _site_settings['expires'] > time.monotonic():
+            return _site_settings['value']
+
+    value = SiteSettings.objects.order_by('pk').first()
+    with _site_settings_lock:
+        _site_settings.update(version=version, value=value,
+                              expires=time.monotonic() + getattr(settings, 'SITE_SETTINGS_TTL', 300))
+    return value
+
+
+def invalidate_site_settings():
+    with _site_settings_lock:
+        _site_settings['expires'] = 0
+    try:
+        cache.incr(SITE_SETTINGS_VERSION_KEY)
+    except ValueError:
+        cache.set(SITE_SETTINGS_VERSION_KEY, 1, None)
+
+
+def get_catalogue_version():
+    return cache.get_or_set(CATALOGUE_VERSION_KEY, 1, None)
+
+
+def invalidate_catalogue():
+    # старые ключи категорий и карточек товаров просто перестают читаться и вытесняются по таймауту
+    try:
+        cache.incr(CATALOGUE_VERSION_KEY)
+    except ValueError:
+        cache.set(CATALOGUE_VERSION_KEY, 1, None)
+
+
+def get_categories(language_code=None):
+    from apps.models import Category
+
+    language_code = language_code or get_language() or settings.LANGUAGE_CODE
+    key = CATEGORIES_KEY.format(language_code, get_catalogue_version())
+    categories = cache.get(key)
+    if categories is None:
+        categories = list(Category.objects.prefetch_related('translations').order_by('pk'))
+        for category in categories:
+            category.set_current_language(language_code)
+        cache.set(key, categories, getattr(settings, 'CATALOGUE_CACHE_TIMEOUT', 60 * 60 * 24))
+    return categories
+
+
+async def aget_districts(region_id):
+    from apps.models import District
+
+    version = await cache.aget_or_set(DISTRICTS_VERSION_KEY, 1, None)
+    mapping = _districts['value']
+    if _districts['version'] != version or mapping is None:
+        mapping = {}
+        async for district in District.objects.order_by('pk').values('id', 'name', 'region_id'):
+            mapping.setdefault(district.pop('region_id'), []).append(district)
+        _districts.update(version=version, value=mapping)
+    return mapping.get(region_id, [])
+
+
+def invalidate_districts():
+    _districts['value'] = None
+    try:
+        cache.incr(DISTRICTS_VERSION_KEY)
+    except ValueError:
+        cache.set(DISTRICTS_VERSION_KEY, 1, None)
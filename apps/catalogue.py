@@ -0,0 +1,284 @@
+import csv
+import io
+import json
+import os
+from decimal import Decimal
+from itertools import islice
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+
+from apps.cache import invalidate_catalogue
+from apps.models import Product, Category
+from apps.search import index_products
+from apps.slugs import assign_slugs
+
+CATEGORY_FIELDS = ('slug', 'icon')
+CATEGORY_TRANSLATED = ('name',)
+PRODUCT_FIELDS = ('slug', 'category', 'price', 'seller_prise', 'quantity', 'message_id', 'image')
+PRODUCT_TRANSLATED = ('name', 'description')
+
+
+def languages():
+    return [code for code, _name in settings.LANGUAGES]
+
+
+def columns(model):
+    fields, translated = (PRODUCT_FIELDS, PRODUCT_TRANSLATED) if model is Product else \
+        (CATEGORY_FIELDS, CATEGORY_TRANSLATED)
+    return [*fields, *(f'{field}_{code}' for field in translated for code in languages())]
+
+
+def guess_format(path, fmt=None):
+    if fmt:
+        return fmt
+    return 'jsonl' if str(path).endswith(('.jsonl', '.json')) else 'csv'
+
+
+def read_rows(stream, fmt):
+    if fmt == 'jsonl':
+        for line in stream:
+            if line.strip():
+                yield json.loads(line)
+    else:
+        yield from csv.DictReader(stream)
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def _import_path(value, image_dir):
+    # путь из файла импорта — только относительный и только внутри каталога импорта,
+    # иначе строка image=/root/package/.env скопировала бы любой файл сервера в публичный media/
+    if os.path.isabs(value) or '..' in value.replace('\\', '/').split('/'):
+        raise ValueError(f'Image path {value!r} must be relative to the import directory')
+    root = os.path.realpath(image_dir or settings.CATALOGUE_IMPORT_DIR)
+    source = os.path.realpath(os.path.join(root, value))
+    if os.path.commonpath([root, source]) != root:
+        raise ValueError(f'Image path {value!r} points outside the import directory')
+    return source
+
+
+def _store_image(value, image_dir, stored):
+    # файл копируем в media/products/ один раз, повторный импорт берёт уже лежащий.
+    # Скопированное пишем в stored: при откате импорта эти файлы удаляются
+    if not value:
+        return ''
+    source = _import_path(value, image_dir)
+    if default_storage.exists(value):
+        return value
+    target = f'products/{os.path.basename(value)}'
+    if default_storage.exists(target):
+        return target
+    if not os.path.isfile(source):
+        raise ValueError(f'Image {value!r} not found in the import directory')
+    with open(source, 'rb') as fh:
+        name = default_storage.save(target, File(fh))
+    stored.append(name)
+    return name
+
+
+def _number(row, field, convert):
+    value = row.get(field) or 0
+    try:
+        number = convert(value)
+    except (ArithmeticError, ValueError):
+        number = None
+    # Decimal('NaN') и Decimal('Infinity') разбираются без ошибки, но в DecimalField не лягут
+    if number is None or (isinstance(number, Decimal) and not number.is_finite()):
+        raise ValueError(f'Bad {field} {value!r} for {row.get("slug")!r}')
+    return number
+
+
+def _save_translations(model, objects, rows, translated):
+    translation_model = model._parler_meta.root_model
+    existing = {
+        (translation.master_id, translation.language_code): translation
+        for translation in translation_model.objects.filter(master__in=objects)
+    }
+    new, changed = [], []
+    for obj, row in zip(objects, rows):
+        for code in languages():
+            values = {field: row.get(f'{field}_{code}') for field in translated}
+            if not any(values.values()):
+                continue
+            translation = existing.get((obj.pk, code))
+            if translation is None:
+                new.append(translation_model(master_id=obj.pk, language_code=code,
+                                             **{field: value or '' for field, value in values.items()}))
+            else:
+                for field, value in values.items():
+                    if value is not None:
+                        setattr(translation, field, value)
+                changed.append(translation)
+    translation_model.objects.bulk_create(new)
+    if changed:
+        translation_model.objects.bulk_update(changed, list(translated))
+
+
+def _set_translation_cache(obj, row, translated):
+    # assign_slugs берёт имя из перевода — заполняем его до bulk_create
+    for code in languages():
+        if row.get(f'name_{code}'):
+            obj.set_current_language(code)
+            for field in translated:
+                setattr(obj, field, row.get(f'{field}_{code}') or '')
+
+
+def _upsert(model, chunk, fields, translated, build):
+    # повтор одного slug внутри пачки — побеждает последняя строка
+    by_slug = {row['slug']: row for row in chunk if row.get('slug')}
+    existing = model.objects.in_bulk(list(by_slug), field_name='slug')
+
+    pairs, new, changed = [], [], []
+    for row in [*by_slug.values(), *(row for row in chunk if not row.get('slug'))]:
+        obj = existing.get(row.get('slug'))
+        if obj is None:
+            obj = model(slug=row.get('slug') or '')
+            new.append(obj)
+        else:
+            changed.append(obj)
+        build(obj, row)
+        pairs.append((obj, row))
+
+    assign_slugs(model, new)
+    with transaction.atomic():
+        model.objects.bulk_create(new)
+        if changed:
+            model.objects.bulk_update(changed, fields)
+        _save_translations(model, [obj for obj, _row in pairs], [row for _obj, row in pairs], translated)
+    return [obj for obj, _row in pairs], len(new), len(changed)
+
+
+@transaction.atomic
+def _import_products(rows, chunk_size, image_dir, progress, stored):
+    created = updated = 0
+    now = timezone.now()
+    for chunk in chunked(rows, chunk_size):
+        categories = Category.objects.in_bulk({row.get('category') for row in chunk}, field_name='slug')
+
+        def build(product, row):
+            category = categories.get(row.get('category'))
+            if category is None:
+                raise ValueError(f'Unknown category {row.get("category")!r} for product {row.get("slug")!r}')
+            product.category = category
+            product.price = _number(row, 'price', Decimal)
+            product.seller_prise = _number(row, 'seller_prise', Decimal)
+            product.quantity = _number(row, 'quantity', int)
+            product.message_id = row.get('message_id') or ''
+            try:
+                product.image = _store_image(row.get('image'), image_dir, stored) or product.image
+            except ValueError as e:
+                raise ValueError(f'{e} for {row.get("slug")!r}')
+            product.update_at = now
+            _set_translation_cache(product, row, PRODUCT_TRANSLATED)
+
+        products, new, changed = _upsert(
+            Product, chunk, ['category', 'price', 'seller_prise', 'quantity', 'message_id', 'image', 'update_at'],
+            PRODUCT_TRANSLATED, build)
+        index_products(Product.objects.filter(pk__in=[product.pk for product in products]))
+        created += new
+        updated += changed
+        if progress:
+            progress(created + updated)
+    return created, updated
+
+
+def import_products(rows, chunk_size=1000, image_dir=None, progress=None):
+    """Upserts products by slug; a bad row rolls back the whole file and raises ValueError."""
+    stored = []
+    try:
+        created, updated = _import_products(rows, chunk_size, image_dir, progress, stored)
+    except BaseException:
+        # транзакция откатилась, а файлы в media/ остались бы без товаров
+        for name in stored:
+            default_storage.delete(name)
+        raise
+    invalidate_catalogue()
+    return created, updated
+
+
+@transaction.atomic
+def _import_categories(rows, chunk_size, progress):
+    created = updated = 0
+    for chunk in chunked(rows, chunk_size):
+        def build(category, row):
+            category.icon = row.get('icon') or category.icon or ''
+            _set_translation_cache(category, row, CATEGORY_TRANSLATED)
+
+        categories, new, changed = _upsert(Category, chunk, ['icon'], CATEGORY_TRANSLATED, build)
+        index_products(Product.objects.filter(category__in=categories))
+        created += new
+        updated += changed
+        if progress:
+            progress(created + updated)
+    return created, updated
+
+
+def import_categories(rows, chunk_size=1000, progress=None):
+    created, updated = _import_categories(rows, chunk_size, progress)
+    invalidate_catalogue()
+    return created, updated
+
+
+def _product_row(product):
+    row = {
+        'slug': product.slug,
+        'category': product.category.slug,
+        'price': product.price,
+        'seller_prise': product.seller_prise,
+        'quantity': product.quantity,
+        'message_id': product.message_id,
+        'image': product.image.name,
+    }
+    translations = {translation.language_code: translation for translation in product.translations.all()}
+    for code in languages():
+        translation = translations.get(code)
+        row[f'name_{code}'] = translation.name if translation else ''
+        row[f'description_{code}'] = translation.description if translation else ''
+    return row
+
+
+def _category_row(category):
+    row = {'slug': category.slug, 'icon': category.icon}
+    translations = {translation.language_code: translation for translation in category.translations.all()}
+    for code in languages():
+        translation = translations.get(code)
+        row[f'name_{code}'] = translation.name if translation else ''
+    return row
+
+
+def export_rows(model, queryset=None, chunk_size=1000):
+    if model is Product:
+        queryset = (queryset if queryset is not None else Product.objects.all()) \
+            .select_related('category').prefetch_related('translations').order_by('pk')
+        to_row = _product_row
+    else:
+        queryset = (queryset if queryset is not None else Category.objects.all()) \
+            .prefetch_related('translations').order_by('pk')
+        to_row = _category_row
+    for obj in queryset.iterator(chunk_size=chunk_size):
+        yield to_row(obj)
+
+
+def serialize_rows(model, rows, fmt):
+    # построчно, чтобы 10k+ строк не держать в памяти
+    if fmt == 'jsonl':
+        for row in rows:
+            yield json.dumps(row, ensure_ascii=False, default=str) + '\n'
+        return
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns(model))
+    writer.writeheader()
+    for row in rows:
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
@@ -0,0 +1,52 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from apps.models import Order
+
+
+def _lease_until(now):
+    return now + timedelta(seconds=getattr(settings, 'ORDER_CLAIM_LEASE', 600))
+
+
+def unclaimed(now=None):
+    now = now or timezone.now()
+    return Q(claimed_until__isnull=True) | Q(claimed_until__lt=now)
+
+
+def claim_order(operator, order_id):
+    # условный UPDATE атомарен на любой БД: заказ достанется только одному оператору.
+    # Обработанный заказ (не NEW) остаётся за тем, кто его вёл: другой оператор его не перехватит
+    now = timezone.now()
+    free = unclaimed(now) & (Q(status=Order.StatusType.NEW) | Q(operator__isnull=True))
+    claimed = Order.objects.filter(Q(operator=operator) | free, pk=order_id) \
+        .update(operator=operator, claimed_until=_lease_until(now))
+    return claimed == 1
+
+
+def release_order(operator, order_id):
+    Order.objects.filter(pk=order_id, operator=operator).update(claimed_until=None)
+
+
+def claim_next(operator, count=None):
+    count = max(count or getattr(settings, 'ORDER_CLAIM_BATCH', 10), 1)
+    now = timezone.now()
+    queue = Order.objects.filter(unclaimed(now), status=Order.StatusType.NEW).order_by('created_at', 'id')
+
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            order_ids = list(queue.select_for_update(skip_locked=True).values_list('pk', flat=True)[:count])
+            Order.objects.filter(pk__in=order_ids).update(operator=operator, claimed_until=_lease_until(now))
+        return order_ids
+
+    # SQLite: SKIP LOCKED нет, забираем заказы по одному условным UPDATE
+    order_ids = []
+    while len(order_ids) < count:
+        candidates = list(queue.exclude(pk__in=order_ids).values_list('pk', flat=True)[:count - len(order_ids)])
+        if not candidates:
+            break
+        order_ids += [order_id for order_id in candidates if claim_order(operator, order_id)]
+    return order_ids
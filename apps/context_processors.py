@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.utils.functional import SimpleLazyObject
+
+from apps.cache import get_site_settings, get_catalogue_version
+
+
+def site_settings(request):
+    return {'site': SimpleLazyObject(get_site_settings)}
+
+
+def catalogue(request):
+    # версия каталога входит в ключ {% cache %} карточек товаров
+    return {
+        'catalogue_version': SimpleLazyObject(get_catalogue_version),
+        'catalogue_cache_timeout': getattr(settings, 'CATALOGUE_CACHE_TIMEOUT', 60 * 60 * 24),
+    }
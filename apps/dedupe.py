@@ -0,0 +1,48 @@
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+
+from apps.models import Order
+
+FINGERPRINT_KEY = 'order-dedupe:{}:{}:{}'
+
+
+def new_idempotency_key():
+    return uuid.uuid4().hex
+
+
+def order_fingerprint(phone_number, product_id, thread_id):
+    # последние 9 цифр: +998 90 111 22 33 и 90 111 22 33 — один и тот же покупатель
+    digits = ''.join(ch for ch in phone_number or '' if ch.isdigit())
+    return FINGERPRINT_KEY.format(digits[-9:], product_id, thread_id or '-')
+
+
+def _cache():
+    return caches[getattr(settings, 'ORDER_DEDUPE_CACHE', 'default')]
+
+
+def order_by_key(idempotency_key):
+    if not idempotency_key:
+        return None
+    return Order.objects.select_related('product', 'thread').filter(idempotency_key=idempotency_key).first()
+
+
+def is_resubmission(order, product_id, thread_id):
+    """Same form key counts as a repeat only for the same product and thread."""
+    return order is not None and order.product_id == product_id and order.thread_id == thread_id
+
+
+def recent_order(fingerprint):
+    """Same buyer, product and thread within ORDER_DEDUPE_WINDOW seconds; may be a genuine second order,
+    so the buyer is asked instead of silently getting the old receipt."""
+    order_id = _cache().get(fingerprint)
+    if order_id is None:
+        return None
+    # заказ могли удалить или отменить за это время — тогда это уже новый заказ
+    return Order.objects.select_related('product', 'thread') \
+        .filter(pk=order_id).exclude(status=Order.StatusType.CANCELED).first()
+
+
+def remember_order(fingerprint, order):
+    _cache().set(fingerprint, order.pk, settings.ORDER_DEDUPE_WINDOW)
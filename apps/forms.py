@@ -3,12 +3,12 @@ import datetime
 from django.contrib.auth.hashers import make_password, check_password
 from django.core.exceptions import ValidationError
 
-from django.forms import Form, PasswordInput, ModelForm, CharField
+from django.forms import Form, PasswordInput, ModelForm, CharField, HiddenInput, BooleanField
 import re
 
 from django.utils.translation import gettext as _
 
-from apps.models import User, Order, Thread, SiteSettings, Withdraw
+from apps.models import User, Order, Thread, Withdraw, StockReservation
 
 
 class AuthForm(Form):
@@ -59,6 +59,13 @@ class ProfileModelForm(ModelForm):
         model = User
         fields = 'first_name', 'last_name', 'district','address','telegram_id','about'
 
+    def save(self, commit=True):
+        user = super().save(commit=False)
+        if commit:
+            # request.user загружен в начале запроса: полный save затёр бы balance, списанный журналом
+            user.save(update_fields=self._meta.fields)
+        return user
+
 
 
 class ChangePasswordForm(Form):
@@ -77,7 +84,7 @@ class ChangePasswordForm(Form):
     def update(self,user):
         new_password = self.cleaned_data.get('new_password')
         user.set_password(new_password)
-        user.save()
+        user.save(update_fields=['password'])
 
 
 
@@ -85,6 +92,10 @@ class ChangePasswordForm(Form):
 
 
 class OrderModelForm(ModelForm):
+    idempotency_key = CharField(max_length=64, required=False, widget=HiddenInput)
+    # покупатель подтвердил второй такой же заказ после предупреждения на странице заказа
+    repeat = BooleanField(required=False, widget=HiddenInput)
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.fields['thread'].required = False
@@ -94,17 +105,6 @@ class OrderModelForm(ModelForm):
         model = Order
         fields = 'phone_number', 'fullname', 'product','total','thread'
 
-    def clean_phone_number(self):
-        product = self.cleaned_data.get('product')
-        thread_id = self.data.get('thread')
-        thread = Thread.objects.get(pk=thread_id)
-        site = SiteSettings.objects.first()
-        total_price = product.price
-        if thread:
-            total_price -= thread.discount + site.discount
-        return total_price
-
-
     def clean_phone_number(self):
         phone_number = self.cleaned_data.get('phone_number')
         return re.sub(r'\D', '', phone_number)
@@ -144,7 +144,10 @@ class WithdrawModelForm(ModelForm):
     def clean_amount(self):
         amount = self.cleaned_data.get('amount')
         user = self.user
-        if amount > user.balance:
+        if amount <= 0:
+            raise ValidationError(_("Amount must be positive."))
+        # окончательная проверка — атомарное списание в apps.ledger
+        if amount > (user.balance or 0):
             raise ValidationError(_("You don't have enough money."))
         return amount
 
@@ -177,22 +180,17 @@ class OrderUpdateModelForm(ModelForm):
         return None
 
     def clean_quantity(self):
+        # итог пересчитывает apps.pricing при сохранении, здесь только проверка
         order = self.order
         quantity = self.cleaned_data.get('quantity')
         if not quantity:
             quantity = order.quantity
-        site = SiteSettings.objects.first()
-        order = self.order
-
 
-        if order.product.quantity < quantity:
-            raise ValidationError(_("The quantity is incorrect."))
-
-        if order.thread:
-            order.total += order.thread.discount_price * quantity + site.discount_price
-        else:
-            order.total += order.product.price*quantity+site.discount_price
-        order.save()
+        if order.product:
+            # то, что уже списано под этот заказ, тоже доступно ему
+            reservation = StockReservation.objects.filter(order_id=order.pk).first()
+            if order.product.quantity + (reservation.quantity if reservation else 0) < quantity:
+                raise ValidationError(_("The quantity is incorrect."))
         return quantity
 
     def clean_delivered_date(self):
@@ -0,0 +1,140 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Now
+from django.utils import timezone
+
+from apps.models import Order, Product, StockReservation
+
+# заказ в этих статусах держит товар, в остальных (NOT_CALL, CANCELED) товар возвращается на склад
+HOLDING_STATUSES = {
+    Order.StatusType.NEW,
+    Order.StatusType.READY_TO_DELIVERY,
+    Order.StatusType.DELIVERING,
+    Order.StatusType.DELIVERED,
+    Order.StatusType.ARCHIVED,
+}
+
+
+class OutOfStock(Exception):
+    pass
+
+
+def take_stock(product_id, quantity):
+    # UPDATE ... WHERE quantity >= n: сотня параллельных заказов на распродаже не уведёт остаток в минус.
+    # update_at меняем сами — от него зависит ключ кэша карточки товара
+    if quantity <= 0:
+        return
+    updated = Product.objects.filter(pk=product_id, quantity__gte=quantity) \
+        .update(quantity=F('quantity') - quantity, update_at=Now())
+    if not updated:
+        raise OutOfStock
+
+
+def return_stock(product_id, quantity):
+    if quantity > 0:
+        Product.objects.filter(pk=product_id).update(quantity=F('quantity') + quantity, update_at=Now())
+
+
+def expiry_for(order):
+    # оператор подтверждает заказ — дальше товар держится до доставки или отмены
+    if order.status != Order.StatusType.NEW:
+        return None
+    return timezone.now() + timedelta(hours=settings.STOCK_RESERVATION_TTL)
+
+
+def held_quantity(order):
+    return order.quantity if order.product_id and order.status in HOLDING_STATUSES else 0
+
+
+@transaction.atomic
+def reserve(order):
+    """Takes the ordered quantity off the shelf for a new order; raises OutOfStock."""
+    take_stock(order.product_id, order.quantity)
+    return StockReservation.objects.create(order=order, product_id=order.product_id, quantity=order.quantity,
+                                           expires_at=expiry_for(order))
+
+
+@transaction.atomic
+def sync_reservation(order, allow_take=True):
+    """Brings the stock held for an order in line with its status and quantity; raises OutOfStock.
+
+    Orders created before stock tracking have no reservation and are left alone.
+    """
+    reservation = StockReservation.objects.select_for_update().filter(order_id=order.pk).first()
+    if reservation is None:
+        return None
+    wanted = held_quantity(order)
+    if order.product_id and reservation.product_id != order.product_id:
+        # товар в заказе заменили в админке: старый возвращаем целиком, новый списываем заново
+        if not allow_take:
+            return reservation
+        return_stock(reservation.product_id, reservation.quantity)
+        reservation.product_id, reservation.quantity = order.product_id, 0
+    delta = wanted - reservation.quantity
+    if delta > 0 and not allow_take:
+        return reservation
+    if delta > 0:
+        take_stock(reservation.product_id, delta)
+    else:
+        return_stock(reservation.product_id, -delta)
+    reservation.quantity = wanted
+    reservation.expires_at = expiry_for(order) if wanted else None
+    reservation.save(update_fields=['product', 'quantity', 'expires_at', 'updated_at'])
+    return reservation
+
+
+def release_reservation(order):
+    # из сигналов (админка, массовые правки): только возвращаем товар, списание там не обработать
+    return sync_reservation(order, allow_take=False)
+
+
+def expire_reservations(now=None):
+    """Returns stock held by NEW orders nobody confirmed in time; one UPDATE per product."""
+    now = now or timezone.now()
+    with transaction.atomic():
+        # блокируем сами резервы: оператор, открывший заказ в этот момент, подождёт и спишет заново
+        expired = list(StockReservation.objects.select_for_update(of=('self',)).filter(
+            quantity__gt=0, expires_at__lt=now, order__status=Order.StatusType.NEW)
+            .values_list('pk', 'product_id', 'quantity'))
+        totals = defaultdict(int)
+        for _pk, product_id, quantity in expired:
+            totals[product_id] += quantity
+        for product_id, total in totals.items():
+            return_stock(product_id, total)
+        StockReservation.objects.filter(pk__in=[pk for pk, _product_id, _quantity in expired]) \
+            .update(quantity=0, updated_at=now)
+    return len(expired)
+
+
+def reconcile(fix=False):
+    """Returns [(order_id, product_id, held, wanted)] for reservations that disagree with their order.
+
+    Expired NEW orders are expire_reservations' job and are not reported here.
+    """
+    mismatches = []
+    reservations = StockReservation.objects.select_related('order').order_by('pk')
+    for reservation in reservations.iterator(chunk_size=2000):
+        order = reservation.order
+        wanted = held_quantity(order)
+        if reservation.quantity == 0 and order.status == Order.StatusType.NEW and reservation.expires_at:
+            # истёкший резерв (expire_reservations оставляет expires_at): спишем заново, когда оператор возьмёт заказ
+            continue
+        if reservation.quantity != wanted or (order.product_id and reservation.product_id != order.product_id):
+            mismatches.append((order.pk, reservation.product_id, reservation.quantity, wanted))
+
+    failed = []
+    if fix:
+        for order_id, _product_id, _held, _wanted in mismatches:
+            try:
+                sync_reservation(Order.objects.get(pk=order_id))
+            except OutOfStock:
+                failed.append(order_id)
+    return mismatches, failed
+
+
+def negative_stock():
+    return list(Product.objects.filter(quantity__lt=0).values_list('pk', 'quantity'))
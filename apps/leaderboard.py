@@ -0,0 +1,78 @@
+from django.db import transaction
+from django.db.models import Count, F
+from django.db.models.functions import Coalesce, TruncDate
+
+from apps.cache import get_site_settings
+from apps.models import Order, Thread, SellerScore
+
+
+def delivery_day(delivered_date, created_at):
+    # дата доставки, если её указали, иначе дата создания заказа — так же считает rebuild_leaderboard
+    if delivered_date:
+        return delivered_date
+    return created_at.date() if created_at else None
+
+
+def in_competition(day, site=None):
+    site = site or get_site_settings()
+    if site is None:
+        return True
+    if site.competition_start and day < site.competition_start:
+        return False
+    if site.competition_end and day > site.competition_end:
+        return False
+    return True
+
+
+def _scoring_seller(thread_id, status, day):
+    if status != Order.StatusType.DELIVERED or not thread_id or not in_competition(day):
+        return None
+    return Thread.objects.filter(pk=thread_id).values_list('owner_id', flat=True).first()
+
+
+def _bump(seller_id, delta):
+    if not seller_id:
+        return
+    updated = SellerScore.objects.filter(seller_id=seller_id).update(delivered_count=F('delivered_count') + delta)
+    if not updated:
+        SellerScore.objects.get_or_create(seller_id=seller_id)
+        SellerScore.objects.filter(seller_id=seller_id).update(delivered_count=F('delivered_count') + delta)
+
+
+def record_delivery_change(old, new, created_at):
+    was_delivered = old.get('status') == Order.StatusType.DELIVERED
+    is_delivered = new.get('status') == Order.StatusType.DELIVERED
+    if not was_delivered and not is_delivered:
+        return
+
+    old_seller = _scoring_seller(old.get('thread_id'), old.get('status'),
+                                 delivery_day(old.get('delivered_date'), created_at))
+    new_seller = _scoring_seller(new.get('thread_id'), new.get('status'),
+                                 delivery_day(new.get('delivered_date'), created_at))
+    if old_seller != new_seller:
+        _bump(old_seller, -1)
+        _bump(new_seller, 1)
+
+
+def top_sellers(limit=100, minimum=2):
+    return SellerScore.objects.filter(delivered_count__gte=minimum).order_by('-delivered_count', 'seller_id') \
+        .annotate(order_count=F('delivered_count'), first_name=F('seller__first_name'),
+                  last_name=F('seller__last_name')) \
+        .values('order_count', 'first_name', 'last_name')[:limit]
+
+
+@transaction.atomic
+def rebuild_leaderboard(site=None):
+    site = site or get_site_settings()
+    orders = Order.objects.filter(status=Order.StatusType.DELIVERED, thread__isnull=False) \
+        .annotate(day=Coalesce('delivered_date', TruncDate('created_at')))
+    if site and site.competition_start:
+        orders = orders.filter(day__gte=site.competition_start)
+    if site and site.competition_end:
+        orders = orders.filter(day__lte=site.competition_end)
+
+    scores = [SellerScore(seller_id=row['thread__owner_id'], delivered_count=row['total'])
+              for row in orders.values('thread__owner_id').annotate(total=Count('pk'))]
+    SellerScore.objects.all().delete()
+    SellerScore.objects.bulk_create(scores, batch_size=1000)
+    return len(scores)
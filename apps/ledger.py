@@ -0,0 +1,68 @@
+from django.db import transaction, IntegrityError
+from django.db.models import F, Sum, Value
+from django.db.models.functions import Coalesce
+
+from apps.models import User, BalanceTransaction
+
+
+class InsufficientFunds(Exception):
+    pass
+
+
+def _record(user_id, amount, kind, withdraw=None, comment=''):
+    # строка пользователя заблокирована нашим UPDATE до конца транзакции, остаток читаем без гонки
+    balance = User.objects.filter(pk=user_id).values_list('balance', flat=True).get()
+    return BalanceTransaction.objects.create(user_id=user_id, amount=amount, balance_after=balance, kind=kind,
+                                             withdraw=withdraw, comment=comment)
+
+
+@transaction.atomic
+def debit(user_id, amount, kind, withdraw=None, comment=''):
+    # UPDATE ... WHERE balance >= amount: два параллельных списания не уведут баланс в минус
+    updated = User.objects.filter(pk=user_id, balance__gte=amount).update(balance=F('balance') - amount)
+    if not updated:
+        raise InsufficientFunds
+    return _record(user_id, -amount, kind, withdraw, comment)
+
+
+@transaction.atomic
+def credit(user_id, amount, kind, withdraw=None, comment=''):
+    User.objects.filter(pk=user_id).update(balance=Coalesce(F('balance'), Value(0)) + amount)
+    return _record(user_id, amount, kind, withdraw, comment)
+
+
+def withdraw_funds(withdraw):
+    return debit(withdraw.user_id, withdraw.amount, BalanceTransaction.Kind.WITHDRAW, withdraw=withdraw)
+
+
+def refund_withdraw(withdraw):
+    # отмена заявки возвращает деньги один раз, повторное сохранение в админке ничего не делает
+    if withdraw.user_id is None or \
+            BalanceTransaction.objects.filter(withdraw=withdraw, kind=BalanceTransaction.Kind.REFUND).exists():
+        return None
+    try:
+        return credit(withdraw.user_id, withdraw.amount, BalanceTransaction.Kind.REFUND, withdraw=withdraw)
+    except IntegrityError:
+        # параллельная отмена успела первой; savepoint credit() откатил и наше зачисление
+        return None
+
+
+def ledger_totals():
+    return dict(BalanceTransaction.objects.order_by().values('user_id')
+                .annotate(total=Sum('amount')).values_list('user_id', 'total'))
+
+
+def reconcile(fix=False):
+    """Returns [(user_id, cached balance, ledger total)] for users whose User.balance disagrees with the ledger."""
+    totals = ledger_totals()
+    mismatches = []
+    for user_id, balance in User.objects.order_by('pk').values_list('pk', 'balance').iterator(chunk_size=2000):
+        total = totals.get(user_id, 0)
+        if (balance or 0) != total:
+            mismatches.append((user_id, balance, total))
+
+    if fix:
+        # источник правды — журнал, кэш в User.balance выравниваем по нему
+        for user_id, _balance, total in mismatches:
+            User.objects.filter(pk=user_id).update(balance=total)
+    return mismatches
@@ -0,0 +1,198 @@
+import json
+import platform
+import statistics
+import time
+import tracemalloc
+from datetime import timedelta
+
+import django
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment, override_settings
+from django.urls import reverse, URLPattern
+from django.utils import timezone, translation
+
+from apps import urls as app_urls
+from apps.models import User, Region, Product, Thread, Order, Category
+
+# меняют данные при GET или требуют POST — в бенчмарк не берём: thread прибавляет визиты,
+# order-update забирает заказ оператору, а прогон идёт по живой базе
+SKIP = {'logout', 'wishlist', 'order-claim', 'thread', 'order-update'}
+# страницы оператора открываем под оператором, остальные под продавцом
+OPERATOR_VIEWS = {'operator-orders', 'order_diagram', 'region_order_counts'}
+
+
+class Command(BaseCommand):
+    help = 'Time every named page in apps/urls.py on the current database and compare against a JSON baseline'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=10)
+        parser.add_argument('--warmup', type=int, default=2)
+        parser.add_argument('--only', nargs='*', help='URL names to run, default all')
+        parser.add_argument('--cold', action='store_true', help='clear the cache before every request')
+        parser.add_argument('--seller', help='phone number of the seller to log in as')
+        parser.add_argument('--operator', help='phone number of the operator to log in as')
+        parser.add_argument('--language', default='en')
+        parser.add_argument('--session-engine', choices=sorted(settings.SESSION_ENGINES),
+                            help='run with this session engine instead of SESSION_ENGINE')
+        parser.add_argument('--output', help='write results to this JSON file')
+        parser.add_argument('--compare', help='baseline JSON written earlier with --output')
+        parser.add_argument('--threshold', type=float, default=0.2,
+                            help='relative wall-time growth counted as a regression (default 0.2)')
+        parser.add_argument('--fail-on-regression', action='store_true')
+
+    def login(self, phone, role):
+        users = User.objects.filter(is_active=True)
+        user = users.filter(phone_number=phone).first() if phone else \
+            users.filter(role=role).order_by('pk').first() if role != User.RoleType.USER else \
+            users.filter(threads__isnull=False, role=role).order_by('pk').first()
+        if user is None:
+            raise CommandError(f'No {role} to log in as; seed the database first (seed_marketplace)')
+        client = Client()
+        client.force_login(user)
+        return client, user
+
+    def scenarios(self, seller, operator):
+        product = Product.objects.order_by('-pk').first()
+        category = Category.objects.order_by('pk').first()
+        region = Region.objects.order_by('pk').first()
+        if product is None:
+            raise CommandError('The database has no products; seed it first (seed_marketplace)')
+
+        kwargs = {'product-detail': {'slug': product.slug}}
+        month_ago = (timezone.localdate() - timedelta(days=30)).isoformat()
+        extra = {
+            'home': ['?format=json'],
+            'product-list': [f'?category_slug={category.slug}'] if category else [],
+            'market-list': ['?category_slug=top'],
+            'search': ['?search=smart', '?search=soat'],
+            'district_list': [f'?region_id={region.pk}'] if region else [],
+            'operator-orders': ['?status=delivered'],
+            'region_order_counts': [f'?start={month_ago}&status=delivered'],
+        }
+        for pattern in app_urls.urlpatterns:
+            if not isinstance(pattern, URLPattern) or not pattern.name or pattern.name in SKIP:
+                continue
+            name = pattern.name
+            url = reverse(name, kwargs=kwargs.get(name))
+            queries = extra.get(name, [])
+            if name not in ('search', 'district_list'):
+                queries = [''] + queries
+            for query in queries:
+                yield f'{name}{query}', url + query, name in OPERATOR_VIEWS
+
+    def run_one(self, client, url, repeat, warmup, cold):
+        for _ in range(warmup):
+            client.get(url)
+        times, queries, status = [], [], None
+        for _ in range(repeat):
+            if cold:
+                cache.clear()
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                response = client.get(url)
+                times.append((time.perf_counter() - started) * 1000)
+            queries.append(len(captured.captured_queries))
+            status = response.status_code
+
+        # отдельный прогон: tracemalloc сам замедляет запрос в разы
+        if cold:
+            cache.clear()
+        tracemalloc.start()
+        try:
+            client.get(url)
+            _current, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        return {
+            'status': status,
+            'median_ms': round(statistics.median(times), 2),
+            'min_ms': round(min(times), 2),
+            'max_ms': round(max(times), 2),
+            'queries': max(queries),
+            'peak_kb': round(peak / 1024, 1),
+        }
+
+    def meta(self):
+        return {
+            'timestamp': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'django': django.get_version(),
+            'python': platform.python_version(),
+            'session_engine': settings.SESSION_ENGINE,
+            'rows': {model.__name__: model.objects.count() for model in (User, Product, Thread, Order)},
+        }
+
+    def handle(self, *args, **options):
+        # как в тестах: ALLOWED_HOSTS пускает testserver, шаблоны отдают context
+        try:
+            setup_test_environment()
+        except RuntimeError:
+            # уже внутри тест-раннера
+            pass
+        if options['session_engine']:
+            # вход заново под выбранным движком, чтобы сессия лежала там же, где её будут читать
+            with override_settings(SESSION_ENGINE=settings.SESSION_ENGINES[options['session_engine']]):
+                return self.bench(options)
+        return self.bench(options)
+
+    def bench(self, options):
+        seller_client, seller = self.login(options['seller'], User.RoleType.USER)
+        operator_client, operator = self.login(options['operator'], User.RoleType.OPERATOR)
+
+        results = {}
+        self.stdout.write(f'{"view":<56}{"code":>5}{"median":>10}{"min":>10}{"q":>6}{"peak kb":>10}')
+        with translation.override(options['language']):
+            for key, url, as_operator in self.scenarios(seller, operator):
+                if options['only'] and key.split('?')[0] not in options['only']:
+                    continue
+                client = operator_client if as_operator else seller_client
+                results[key] = {'url': url, **self.run_one(client, url, options['repeat'], options['warmup'],
+                                                           options['cold'])}
+                row = results[key]
+                self.stdout.write(f'{key:<56}{row["status"]:>5}{row["median_ms"]:>10.1f}{row["min_ms"]:>10.1f}'
+                                  f'{row["queries"]:>6}{row["peak_kb"]:>10.0f}')
+
+        report = {'meta': self.meta(), 'results': results}
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as fh:
+                json.dump(report, fh, indent=2, ensure_ascii=False)
+            self.stdout.write(f'written {options["output"]}')
+
+        if options['compare']:
+            regressions = self.compare(options['compare'], results, options['threshold'])
+            if regressions and options['fail_on_regression']:
+                raise CommandError(f'{len(regressions)} regressions: {", ".join(regressions)}')
+
+    def compare(self, path, results, threshold):
+        try:
+            with open(path, encoding='utf-8') as fh:
+                baseline = json.load(fh)
+        except FileNotFoundError:
+            raise CommandError(f'No baseline at {path}')
+
+        base_meta = baseline.get('meta', {})
+        if base_meta.get('database') != connection.vendor or base_meta.get('rows') != self.meta()['rows']:
+            self.stderr.write(self.style.WARNING(
+                f'baseline was taken on {base_meta.get("database")} with {base_meta.get("rows")}; '
+                'timings are only comparable on the same data set'))
+
+        self.stdout.write(f'\n{"view":<56}{"base ms":>10}{"now ms":>10}{"delta":>9}{"queries":>12}')
+        regressions = []
+        for key, row in results.items():
+            base = baseline['results'].get(key)
+            if base is None:
+                self.stdout.write(f'{key:<56}{"new":>10}{row["median_ms"]:>10.1f}')
+                continue
+            delta = (row['median_ms'] - base['median_ms']) / base['median_ms'] if base['median_ms'] else 0.0
+            # лишний запрос — регрессия при любом времени: на большой базе он станет N+1
+            regressed = delta > threshold or row['queries'] > base['queries']
+            if regressed:
+                regressions.append(key)
+            line = (f'{key:<56}{base["median_ms"]:>10.1f}{row["median_ms"]:>10.1f}{delta:>+9.0%}'
+                    f'{base["queries"]:>6}->{row["queries"]:<4}')
+            self.stdout.write(self.style.ERROR(line) if regressed else line)
+        return regressions
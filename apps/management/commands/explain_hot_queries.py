@@ -0,0 +1,88 @@
+import re
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import RequestFactory
+
+from apps.mixins import KeysetPaginationMixin
+from apps.models import User, Category, Order, District
+from apps.views import HomeListView, ProductListView, MarketListView, OrderListView, WishListView, \
+    OperatorOrderListView, StatisticListView, CompetitionListView
+
+HOT_TABLES = ('apps_order', 'apps_product', 'apps_wishlist', 'apps_thread', 'apps_productsearchterm')
+
+
+class Command(BaseCommand):
+    help = "Run EXPLAIN on the list views' querysets and report sequential scans on hot tables"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='phone number of the user the views are rendered for')
+        parser.add_argument('--verbose-plans', action='store_true', help='print every plan, not only scans')
+
+    def get_cases(self):
+        category = Category.objects.order_by('pk').first()
+        district = District.objects.order_by('pk').first()
+        cases = [
+            ('home', HomeListView, {}),
+            ('product-list', ProductListView, {}),
+            ('market-list', MarketListView, {}),
+            ('market-list top', MarketListView, {'category_slug': 'top'}),
+            ('order-list', OrderListView, {}),
+            ('wish-list', WishListView, {}),
+            ('operator-orders new', OperatorOrderListView, {}),
+            ('operator-orders delivered', OperatorOrderListView, {'status': Order.StatusType.DELIVERED}),
+            ('thread-statistic', StatisticListView, {}),
+            ('thread-competition', CompetitionListView, {}),
+        ]
+        if category:
+            cases.append(('product-list category', ProductListView, {'category_slug': category.slug}))
+            cases.append(('operator-orders category', OperatorOrderListView, {'category_id': category.pk}))
+        if district:
+            cases.append(('operator-orders district', OperatorOrderListView, {'district_id': district.pk}))
+        return cases
+
+    def build_queryset(self, view_class, params, user):
+        request = RequestFactory().get('/', params)
+        request.user = user
+        view = view_class()
+        view.setup(request)
+        queryset = view.get_queryset()
+        if isinstance(view, KeysetPaginationMixin):
+            queryset = queryset.order_by(*view.get_keyset_ordering())[:view.paginate_by + 1]
+        return queryset
+
+    def sequential_scans(self, plan):
+        if connection.vendor == 'postgresql':
+            pattern = re.compile(r'Seq Scan on (\w+)')
+        else:
+            pattern = re.compile(r'\bSCAN (\w+)(?! USING)')
+        return sorted({table for table in pattern.findall(plan) if table in HOT_TABLES})
+
+    def handle(self, *args, **options):
+        user = AnonymousUser()
+        if options['user']:
+            user = User.objects.get(phone_number=options['user'])
+        elif User.objects.exists():
+            user = User.objects.order_by('pk').first()
+
+        problems = 0
+        for name, view_class, params in self.get_cases():
+            try:
+                plan = self.build_queryset(view_class, params, user).explain()
+            except Exception as exc:
+                self.stdout.write(self.style.WARNING(f'{name}: skipped ({exc})'))
+                continue
+
+            scans = self.sequential_scans(plan)
+            if scans:
+                problems += 1
+                self.stdout.write(self.style.ERROR(f'{name}: sequential scan on {", ".join(scans)}'))
+            else:
+                self.stdout.write(self.style.SUCCESS(f'{name}: ok'))
+            if scans or options['verbose_plans']:
+                self.stdout.write(plan)
+                self.stdout.write('')
+
+        if problems:
+            self.stdout.write(self.style.WARNING(f'{problems} queries scan hot tables'))
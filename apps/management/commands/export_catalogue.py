@@ -0,0 +1,29 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from apps.catalogue import guess_format, export_rows, serialize_rows
+from apps.models import Product, Category
+
+
+class Command(BaseCommand):
+    help = 'Export products or categories with all translations to CSV/JSONL'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="output file, '-' for stdout")
+        parser.add_argument('--model', choices=('product', 'category'), default='product')
+        parser.add_argument('--format', choices=('csv', 'jsonl'))
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        model = Category if options['model'] == 'category' else Product
+        path = options['path']
+        fmt = guess_format(path, options['format'])
+        chunks = serialize_rows(model, export_rows(model, chunk_size=options['chunk_size']), fmt)
+        if path == '-':
+            for chunk in chunks:
+                sys.stdout.write(chunk)
+            return
+        with open(path, 'w', newline='', encoding='utf-8') as stream:
+            stream.writelines(chunks)
+        self.stdout.write(self.style.SUCCESS(f'Exported to {path}'))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from apps.models import Product, SiteSettings
+from apps.thumbnails import get_thumbnails
+
+
+class Command(BaseCommand):
+    help = 'Generate missing thumbnails for product images and the competition thumbnail'
+
+    def handle(self, *args, **options):
+        names = [*Product.objects.exclude(image='').values_list('image', flat=True).distinct(),
+                 *SiteSettings.objects.exclude(competition_thumbnail='')
+                 .values_list('competition_thumbnail', flat=True)]
+        failed = 0
+        for i, name in enumerate(names, 1):
+            if not get_thumbnails(name):
+                failed += 1
+                self.stderr.write(f'Cannot read {name}')
+            if i % 100 == 0:
+                self.stdout.write(f'{i}/{len(names)} images')
+        self.stdout.write(self.style.SUCCESS(f'Processed {len(names) - failed} images, {failed} failed'))
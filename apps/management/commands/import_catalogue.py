@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.catalogue import guess_format, read_rows, import_products, import_categories
+
+
+class Command(BaseCommand):
+    help = 'Import products or categories from CSV/JSONL, upserting by slug'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--model', choices=('product', 'category'), default='product')
+        parser.add_argument('--format', choices=('csv', 'jsonl'))
+        parser.add_argument('--images', help='directory the image column is relative to, default CATALOGUE_IMPORT_DIR')
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        fmt = guess_format(options['path'], options['format'])
+        progress = lambda done: self.stdout.write(f'{done} rows')
+        try:
+            with open(options['path'], newline='', encoding='utf-8-sig') as stream:
+                rows = read_rows(stream, fmt)
+                if options['model'] == 'category':
+                    created, updated = import_categories(rows, options['chunk_size'], progress=progress)
+                else:
+                    created, updated = import_products(rows, options['chunk_size'], options['images'],
+                                                       progress=progress)
+        except (OSError, ValueError) as e:
+            raise CommandError(e)
+        self.stdout.write(self.style.SUCCESS(f'Created {created}, updated {updated}'))
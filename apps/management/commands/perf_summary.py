@@ -0,0 +1,56 @@
+import time
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.profiling import read_records, percentile
+
+
+class Command(BaseCommand):
+    help = 'Summarize the sampled request log: p50/p95/p99 latency, queries and time split per view'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', help='JSONL log, defaults to PERF_LOG_PATH')
+        parser.add_argument('--since', type=float, help='only records from the last N hours')
+        parser.add_argument('--view', help='only this URL name')
+
+    def summarize(self, records):
+        views = defaultdict(list)
+        for record in records:
+            views[record['view']].append(record)
+
+        rows = []
+        for view, items in views.items():
+            totals = sorted(item['total_ms'] for item in items)
+            count = len(items)
+            rows.append({
+                'view': view,
+                'count': count,
+                'p50': percentile(totals, 0.50),
+                'p95': percentile(totals, 0.95),
+                'p99': percentile(totals, 0.99),
+                'queries': sum(item['queries'] for item in items) / count,
+                'db': sum(item['db_ms'] for item in items) / count,
+                'template': sum(item['template_ms'] for item in items) / count,
+                'python': sum(item['python_ms'] for item in items) / count,
+                'spent': sum(totals),
+            })
+        # сверху то, на что уходит больше всего суммарного времени
+        return sorted(rows, key=lambda row: row['spent'], reverse=True)
+
+    def handle(self, *args, **options):
+        since = time.time() - options['since'] * 3600 if options['since'] else None
+        try:
+            records = [record for record in read_records(options['path'])
+                       if (since is None or record['ts'] >= since)
+                       and (not options['view'] or record['view'] == options['view'])]
+        except FileNotFoundError as e:
+            raise CommandError(f'No log at {e.filename}')
+
+        header = f'{"view":<28}{"count":>7}{"p50":>9}{"p95":>9}{"p99":>9}{"queries":>9}{"db":>9}{"tpl":>9}{"py":>9}'
+        self.stdout.write(header)
+        for row in self.summarize(records):
+            self.stdout.write(
+                f'{row["view"]:<28}{row["count"]:>7}{row["p50"]:>9.1f}{row["p95"]:>9.1f}{row["p99"]:>9.1f}'
+                f'{row["queries"]:>9.1f}{row["db"]:>9.1f}{row["template"]:>9.1f}{row["python"]:>9.1f}')
+        self.stdout.write('times in ms; queries, db, tpl and py are per-request means')
@@ -0,0 +1,101 @@
+import os
+import posixpath
+import re
+
+from django.conf import settings
+from django.contrib.staticfiles.finders import get_finders
+from django.core.management.base import BaseCommand
+from django.template.utils import get_app_template_dirs
+
+STATIC_TAG = re.compile(r"""\{%\s*static\s+['"]([^'"]+)['"]""")
+# url(...) и @import в css, строки с путями в js/json
+ASSET_REFERENCE = re.compile(r"""url\(\s*['"]?([^'")?#]+)|@import\s+['"]([^'"]+)['"]|['"]([^'"\s?#]+\.\w{2,5})['"]""")
+SCANNED = ('.css', '.js', '.json', '.svg', '.webmanifest')
+
+
+class Command(BaseCommand):
+    help = 'List (or with --delete remove) static source files that no template references'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--delete', action='store_true', help='delete the files instead of listing them')
+        parser.add_argument('--keep', action='append', default=[], help='extra path prefix to keep, repeatable')
+
+    def static_files(self):
+        # только исходники проекта: статику admin и allauth из site-packages не трогаем
+        base_dir = os.path.join(str(settings.BASE_DIR), '')
+        files = {}
+        for finder in get_finders():
+            for path, storage in finder.list([]):
+                if not storage.path(path).startswith(base_dir) or 'site-packages' in storage.path(path):
+                    continue
+                prefix = getattr(storage, 'prefix', None)
+                name = posixpath.join(prefix, path) if prefix else path
+                files.setdefault(name.replace(os.sep, '/'), storage.path(path))
+        return files
+
+    def template_references(self):
+        static_url = settings.STATIC_URL.lstrip('/')
+        references = set()
+        for directory in [*settings.TEMPLATES[0]['DIRS'], *get_app_template_dirs('templates')]:
+            for root, _dirs, filenames in os.walk(directory):
+                for filename in filenames:
+                    with open(os.path.join(root, filename), encoding='utf-8', errors='ignore') as fh:
+                        content = fh.read()
+                    references.update(STATIC_TAG.findall(content))
+                    references.update(re.findall(rf"""['"(]/?{re.escape(static_url)}([^'")?#]+)""", content))
+        return references
+
+    def asset_references(self, name, path):
+        directory = posixpath.dirname(name)
+        with open(path, encoding='utf-8', errors='ignore') as fh:
+            content = fh.read()
+        for match in ASSET_REFERENCE.finditer(content):
+            target = next(group for group in match.groups() if group)
+            if target.startswith(('http:', 'https:', 'data:', '//')):
+                continue
+            yield posixpath.normpath(posixpath.join(directory, target.strip()))
+
+    @staticmethod
+    def package(name):
+        # из vendors/<пакет>/ плагины подгружают соседние файлы сами — такой пакет держим целиком
+        parts = name.split('/')
+        if 'vendors' in parts[:-2]:
+            return '/'.join(parts[:parts.index('vendors') + 2]) + '/'
+        return None
+
+    def used_files(self, files):
+        used = set()
+        pending = [name for name in self.template_references() if name in files]
+        while pending:
+            name = pending.pop()
+            if name in used:
+                continue
+            used.add(name)
+            if name.endswith(SCANNED):
+                pending.extend(target for target in self.asset_references(name, files[name])
+                               if target in files and target not in used)
+
+        packages = {self.package(name) for name in used} - {None}
+        return {name for name in files
+                if name in used or self.package(name) in packages}
+
+    def handle(self, *args, **options):
+        files = self.static_files()
+        used = self.used_files(files)
+        keep = tuple(options['keep'])
+        unused = sorted(name for name in files if name not in used and not (keep and name.startswith(keep)))
+
+        total = 0
+        for name in unused:
+            size = os.path.getsize(files[name])
+            total += size
+            if options['delete']:
+                os.remove(files[name])
+            elif options['verbosity'] > 1:
+                self.stdout.write(f'{size:>10}  {name}')
+
+        action = 'Deleted' if options['delete'] else 'Would delete'
+        self.stdout.write(self.style.SUCCESS(
+            f'{action} {len(unused)} of {len(files)} files, {total / 1024 / 1024:.1f} MB'))
+        if not options['delete'] and unused:
+            self.stdout.write('Run with -v 2 to list them, --delete to remove them')
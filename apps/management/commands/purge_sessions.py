@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = 'Delete expired rows from django_session in small batches (run from cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        if not settings.SESSION_ENGINE.endswith(('.db', '.cached_db')):
+            # у cache и signed_cookies своё истечение, таблица не используется
+            call_command('clearsessions')
+            self.stdout.write(f'{settings.SESSION_ENGINE} keeps no session table, nothing to purge')
+            return
+
+        # один DELETE на миллионы строк надолго держит блокировки; удаляем пачками по ключу
+        now, deleted = timezone.now(), 0
+        while True:
+            keys = list(Session.objects.filter(expire_date__lt=now)
+                        .values_list('session_key', flat=True)[:options['batch_size']])
+            if not keys:
+                break
+            deleted += Session.objects.filter(session_key__in=keys).delete()[0]
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} expired sessions'))
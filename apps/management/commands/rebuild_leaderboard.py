@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from apps.leaderboard import rebuild_leaderboard
+
+
+class Command(BaseCommand):
+    help = 'Recount delivered orders per seller for the current competition window'
+
+    def handle(self, *args, **options):
+        total = rebuild_leaderboard()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt scores for {total} sellers'))
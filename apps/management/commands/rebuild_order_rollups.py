@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from apps.stats import rebuild_order_rollups
+
+
+class Command(BaseCommand):
+    help = 'Recount the daily region/district/status order rollups from the orders table'
+
+    def handle(self, *args, **options):
+        total = rebuild_order_rollups()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {total} rollup rows'))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from apps.models import Product
+from apps.search import index_products
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the product search index'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        product_ids = list(Product.objects.order_by('pk').values_list('pk', flat=True))
+        total = 0
+        for start in range(0, len(product_ids), batch_size):
+            chunk = product_ids[start:start + batch_size]
+            total += index_products(Product.objects.filter(pk__in=chunk))
+            self.stdout.write(f'{min(start + batch_size, len(product_ids))}/{len(product_ids)} products')
+        self.stdout.write(self.style.SUCCESS(f'Indexed {total} terms'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from apps.stats import rebuild_thread_statistics
+
+
+class Command(BaseCommand):
+    help = 'Recount per-thread order statistics from the orders table'
+
+    def handle(self, *args, **options):
+        total = rebuild_thread_statistics()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt statistics for {total} threads'))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from apps.ledger import reconcile
+
+
+class Command(BaseCommand):
+    help = 'Compare cached User.balance with the balance ledger; --fix resets the cache to the ledger total'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true')
+
+    def handle(self, *args, **options):
+        mismatches = reconcile(fix=options['fix'])
+        for user_id, balance, total in mismatches:
+            self.stdout.write(f'user {user_id}: balance {balance}, ledger {total}')
+        if not mismatches:
+            self.stdout.write(self.style.SUCCESS('All balances match the ledger'))
+        elif options['fix']:
+            self.stdout.write(self.style.SUCCESS(f'Fixed {len(mismatches)} balances'))
+        else:
+            self.stdout.write(self.style.WARNING(f'{len(mismatches)} balances differ, run with --fix to reset them'))
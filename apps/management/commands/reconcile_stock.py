@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from apps.inventory import expire_reservations, reconcile, negative_stock
+
+
+class Command(BaseCommand):
+    help = 'Return stock held by expired NEW orders (--expire) and check reservations against order statuses'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--expire', action='store_true', help='release reservations past STOCK_RESERVATION_TTL')
+        parser.add_argument('--fix', action='store_true')
+
+    def handle(self, *args, **options):
+        if options['expire']:
+            self.stdout.write(f'Released {expire_reservations()} expired reservations')
+
+        mismatches, failed = reconcile(fix=options['fix'])
+        for order_id, product_id, held, wanted in mismatches:
+            self.stdout.write(f'order {order_id}: product {product_id} holds {held}, expected {wanted}')
+        for product_id, quantity in negative_stock():
+            self.stdout.write(self.style.WARNING(f'product {product_id}: negative stock {quantity}'))
+
+        if not mismatches:
+            self.stdout.write(self.style.SUCCESS('All reservations match their orders'))
+        elif options['fix']:
+            self.stdout.write(self.style.SUCCESS(f'Fixed {len(mismatches) - len(failed)} reservations'))
+            if failed:
+                self.stdout.write(self.style.WARNING(f'Not enough stock for orders: {", ".join(map(str, failed))}'))
+        else:
+            self.stdout.write(self.style.WARNING(f'{len(mismatches)} reservations differ, run with --fix to apply them'))
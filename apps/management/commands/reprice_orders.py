@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from apps.models import Order
+from apps.pricing import reprice_orders
+
+
+class Command(BaseCommand):
+    help = 'Recompute order totals from current product, thread and site prices'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--status', action='append', choices=Order.StatusType.values,
+                            help='only orders in this status (repeatable, default: new)')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        statuses = options['status'] or [Order.StatusType.NEW]
+        updated = reprice_orders(Order.objects.filter(status__in=statuses).order_by('pk'),
+                                 batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Repriced {updated} orders'))
@@ -0,0 +1,250 @@
+import os
+import random
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from apps.cache import invalidate_catalogue, invalidate_districts, invalidate_site_settings
+from apps.leaderboard import rebuild_leaderboard
+from apps.models import User, Region, District, Category, Product, Thread, Order, WishList, SiteSettings, \
+    BalanceTransaction
+from apps.pricing import order_total
+from apps.search import index_products
+from apps.stats import rebuild_thread_statistics, rebuild_order_rollups
+
+REGIONS = ('Toshkent', 'Toshkent viloyati', 'Andijon', 'Buxoro', 'Farg‘ona', 'Jizzax', 'Xorazm', 'Namangan',
+           'Navoiy', 'Qashqadaryo', 'Qoraqalpog‘iston', 'Samarqand', 'Sirdaryo', 'Surxondaryo')
+ADJECTIVES = (('Smart', 'Aqlli'), ('Wireless', 'Simsiz'), ('Kids', 'Bolalar'), ('Premium', 'Premium'),
+              ('Compact', 'Ixcham'), ('Steel', 'Po‘lat'), ('Cotton', 'Paxta'), ('Summer', 'Yozgi'))
+NOUNS = (('watch', 'soat'), ('headphones', 'quloqchin'), ('toy', 'o‘yinchoq'), ('kettle', 'choynak'),
+         ('backpack', 'ryukzak'), ('lamp', 'chiroq'), ('blender', 'blender'), ('sneakers', 'krossovka'),
+         ('phone case', 'telefon g‘ilofi'), ('towel', 'sochiq'))
+# примерное распределение статусов в живой базе
+STATUS_WEIGHTS = {
+    Order.StatusType.NEW: 10,
+    Order.StatusType.READY_TO_DELIVERY: 8,
+    Order.StatusType.DELIVERING: 7,
+    Order.StatusType.DELIVERED: 45,
+    Order.StatusType.NOT_CALL: 8,
+    Order.StatusType.CANCELED: 12,
+    Order.StatusType.ARCHIVED: 10,
+}
+FIRST_PHONE = 998_990_000_000
+
+
+@contextmanager
+def explicit_created_at(model):
+    # auto_now_add перезаписал бы разбросанные по году даты заказов
+    field = model._meta.get_field('created_at')
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+
+class Command(BaseCommand):
+    help = 'Fill an empty database with a synthetic marketplace for benchmarks (bench_views)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100_000)
+        parser.add_argument('--categories', type=int, default=20)
+        parser.add_argument('--products', type=int, default=10_000)
+        parser.add_argument('--threads', type=int, default=20_000)
+        parser.add_argument('--orders', type=int, default=1_000_000)
+        parser.add_argument('--wishlists', type=int, default=50_000)
+        parser.add_argument('--districts-per-region', type=int, default=12)
+        parser.add_argument('--days', type=int, default=365, help='spread orders over the last N days')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--append', action='store_true', help='allow seeding a database that has products')
+
+    def progress(self, label, done, total):
+        self.stdout.write(f'{label}: {done}/{total}')
+
+    def bulk(self, model, objects, label, total):
+        batch, done = [], 0
+        for obj in objects:
+            batch.append(obj)
+            if len(batch) >= self.batch_size:
+                model.objects.bulk_create(batch)
+                done += len(batch)
+                batch = []
+                if done < total and done % (self.batch_size * 20) == 0:
+                    self.progress(label, done, total)
+        if batch:
+            model.objects.bulk_create(batch)
+            done += len(batch)
+        self.progress(label, done, total)
+
+    def handle(self, *args, **options):
+        if Product.objects.exists() and not options['append']:
+            raise CommandError('The database already has products; seed an empty one or pass --append')
+        self.batch_size = options['batch_size']
+        self.random = random.Random(options['seed'])
+        self.now = timezone.now()
+
+        site = self.seed_site()
+        districts = self.seed_geography(options['districts_per_region'])
+        user_ids, seller_ids, operator_ids = self.seed_users(options['users'])
+        products = self.seed_catalogue(options['categories'], options['products'])
+        threads = self.seed_threads(options['threads'], seller_ids, products)
+        self.seed_orders(options['orders'], options['days'], site, user_ids, operator_ids, districts, products,
+                         threads)
+        self.seed_wishlists(options['wishlists'], user_ids, products)
+        self.rebuild()
+        self.stdout.write(self.style.SUCCESS('Marketplace seeded'))
+
+    def seed_site(self):
+        site = SiteSettings.objects.order_by('pk').first()
+        if site is None:
+            site = SiteSettings.objects.create(delivery_price=25_000, discount_price=0,
+                                               competition_thumbnail='site-settings/IMG_0025.jpeg')
+        return site
+
+    def seed_geography(self, per_region):
+        # при --append берём уже созданные области и районы по имени, иначе диаграмма и сводки задвоятся
+        existing = set(Region.objects.filter(name__in=REGIONS).values_list('name', flat=True))
+        Region.objects.bulk_create([Region(name=name) for name in REGIONS if name not in existing])
+        regions = Region.objects.filter(name__in=REGIONS)
+        districts = set(District.objects.filter(region__in=regions).values_list('region_id', 'name'))
+        District.objects.bulk_create([
+            District(name=name, region=region) for region in regions for name in
+            (f'{region.name} {i + 1}-tuman' for i in range(per_region)) if (region.pk, name) not in districts
+        ])
+        return list(District.objects.values_list('pk', flat=True))
+
+    def seed_users(self, count):
+        # хэш пароля считаем один раз: 100k вызовов make_password заняли бы часы
+        password = make_password('bench')
+        start = FIRST_PHONE + User.objects.filter(phone_number__startswith='99899').count()
+        district_ids = list(District.objects.values_list('pk', flat=True))
+
+        def users():
+            for i in range(count):
+                roll = self.random.random()
+                role = User.RoleType.OPERATOR if roll < 0.005 else \
+                    User.RoleType.DELIVER if roll < 0.01 else User.RoleType.USER
+                yield User(phone_number=str(start + i), password=password, role=role, first_name=f'User{i}',
+                           district_id=self.random.choice(district_ids),
+                           balance=self.random.randrange(0, 2_000_000, 1000))
+
+        self.bulk(User, users(), 'users', count)
+        users = User.objects.filter(phone_number__gte=str(start)).order_by('pk')
+        user_ids = list(users.values_list('pk', flat=True))
+        # баланс без записи в журнале reconcile_balances посчитал бы расхождением
+        self.bulk(BalanceTransaction, (
+            BalanceTransaction(user_id=pk, amount=balance, balance_after=balance, kind=BalanceTransaction.Kind.OPENING)
+            for pk, balance in users.filter(balance__gt=0).values_list('pk', 'balance').iterator()
+        ), 'opening balances', users.filter(balance__gt=0).count())
+        operator_ids = list(users.filter(role=User.RoleType.OPERATOR).values_list('pk', flat=True))
+        # продают примерно 10% пользователей
+        seller_ids = user_ids[:max(len(user_ids) // 10, 1)]
+        return user_ids, seller_ids, operator_ids or user_ids[:1]
+
+    def seed_catalogue(self, category_count, product_count):
+        translation = Product._parler_meta.root_model
+        category_translation = Category._parler_meta.root_model
+        images = sorted(os.listdir(os.path.join(settings.MEDIA_ROOT, 'products'))) \
+            if os.path.isdir(os.path.join(settings.MEDIA_ROOT, 'products')) else []
+
+        offset = Category.objects.count()
+        categories = Category.objects.bulk_create(
+            [Category(slug=f'bench-category-{offset + i}', icon='https://alijahon.uz/static/icon.png')
+             for i in range(category_count)])
+        category_translation.objects.bulk_create(
+            [category_translation(master_id=category.pk, language_code=code, name=f'{name} {category.pk}')
+             for category in categories for code, name in (('en', 'Category'), ('uz', 'Kategoriya'))])
+
+        offset = Product.objects.count()
+
+        def products():
+            for i in range(product_count):
+                price = Decimal(self.random.randrange(20_000, 2_000_000, 1000))
+                yield Product(slug=f'bench-product-{offset + i}', category=self.random.choice(categories),
+                              price=price, seller_prise=(price * self.random.randint(5, 20) // 100),
+                              quantity=self.random.randint(0, 500), message_id=str(i),
+                              image=f'products/{self.random.choice(images)}' if images else '')
+
+        self.bulk(Product, products(), 'products', product_count)
+        # при --append в базе уже есть товары прошлых прогонов с переводами, берём только новые
+        products = list(Product.objects.filter(slug__startswith='bench-product-', translations__isnull=True)
+                        .values_list('pk', 'price', 'seller_prise'))
+
+        def translations():
+            for pk, _price, _seller_prise in products:
+                adjective, noun = self.random.choice(ADJECTIVES), self.random.choice(NOUNS)
+                yield translation(master_id=pk, language_code='en', name=f'{adjective[0]} {noun[0]} {pk}',
+                                  description=f'<p>{adjective[0]} {noun[0]} with free delivery.</p>')
+                yield translation(master_id=pk, language_code='uz', name=f'{adjective[1]} {noun[1]} {pk}',
+                                  description=f'<p>{adjective[1]} {noun[1]}, yetkazib berish bepul.</p>')
+
+        self.bulk(translation, translations(), 'product translations', len(products) * 2)
+        return products
+
+    def seed_threads(self, count, seller_ids, products):
+        def threads():
+            for i in range(count):
+                pk, _price, seller_prise = self.random.choice(products)
+                yield Thread(owner_id=self.random.choice(seller_ids), product_id=pk, name=f'Oqim {i}',
+                             discount=seller_prise * self.random.randint(0, 50) // 100,
+                             visit_count=self.random.randint(0, 5000))
+
+        self.bulk(Thread, threads(), 'threads', count)
+        return list(Thread.objects.filter(product_id__in=[pk for pk, _price, _seller_prise in products])
+                    .values_list('pk', 'product_id', 'discount'))
+
+    def seed_orders(self, count, days, site, user_ids, operator_ids, district_ids, products, threads):
+        prices = {pk: price for pk, price, _seller_prise in products}
+        statuses, weights = list(STATUS_WEIGHTS), list(STATUS_WEIGHTS.values())
+
+        def orders():
+            for i in range(count):
+                # большинство заказов приходит по реферальным потокам
+                if threads and self.random.random() < 0.7:
+                    thread_id, product_id, discount = self.random.choice(threads)
+                else:
+                    thread_id, discount = None, 0
+                    product_id = self.random.choice(products)[0]
+                status = self.random.choices(statuses, weights)[0]
+                created_at = self.now - timedelta(seconds=self.random.randrange(days * 86400))
+                quantity = self.random.choice((1, 1, 1, 2, 3))
+                yield Order(
+                    product_id=product_id, thread_id=thread_id, quantity=quantity, status=status,
+                    total=order_total(prices[product_id], quantity, discount, site.discount_price, site.delivery_price),
+                    fullname=f'Mijoz {i}', phone_number=f'99890{i % 10_000_000:07d}',
+                    customer_id=self.random.choice(user_ids) if self.random.random() < 0.3 else None,
+                    district_id=self.random.choice(district_ids),
+                    operator_id=None if status == Order.StatusType.NEW else self.random.choice(operator_ids),
+                    created_at=created_at,
+                    delivered_date=(created_at + timedelta(days=self.random.randint(1, 5))).date()
+                    if status == Order.StatusType.DELIVERED else None,
+                )
+
+        with explicit_created_at(Order):
+            self.bulk(Order, orders(), 'orders', count)
+
+    def seed_wishlists(self, count, user_ids, products):
+        pairs = {(self.random.choice(user_ids), self.random.choice(products)[0]) for _ in range(count)}
+        self.bulk(WishList, (WishList(user_id=user_id, product_id=product_id) for user_id, product_id in pairs),
+                  'wishlists', len(pairs))
+
+    def rebuild(self):
+        # bulk_create обходит сигналы — производные таблицы пересчитываем целиком
+        self.stdout.write('rebuilding statistics, rollups, leaderboard and search index')
+        with transaction.atomic():
+            rebuild_thread_statistics()
+            rebuild_order_rollups()
+            rebuild_leaderboard()
+        product_ids = list(Product.objects.order_by('pk').values_list('pk', flat=True))
+        for start in range(0, len(product_ids), 1000):
+            index_products(Product.objects.filter(pk__in=product_ids[start:start + 1000]))
+        invalidate_catalogue()
+        invalidate_districts()
+        invalidate_site_settings()
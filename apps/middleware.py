@@ -0,0 +1,167 @@
+import mimetypes
+import os
+import threading
+import time
+from urllib.parse import urlparse
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import FileResponse, HttpResponseNotModified
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+from apps.profiling import measure, should_sample, write_record
+
+# порядок предпочтения, если клиент принимает оба
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+class StaticFile:
+    def __init__(self, path, immutable):
+        self.path = path
+        self.immutable = immutable
+        self.content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        self.variants = {None: self._stat(path)}
+        for encoding, extension in ENCODINGS:
+            if os.path.exists(path + extension):
+                self.variants[encoding] = self._stat(path + extension)
+
+    @staticmethod
+    def _stat(path):
+        stat = os.stat(path)
+        return path, stat.st_size, int(stat.st_mtime)
+
+    def choose(self, accept_encoding):
+        accepted = {token.split(';')[0].strip() for token in accept_encoding.split(',')
+                    if not token.replace(' ', '').endswith(';q=0')}
+        for encoding, _extension in ENCODINGS:
+            if encoding in accepted and encoding in self.variants:
+                return encoding
+        return None
+
+
+class StaticFilesMiddleware:
+    """Serves collected static files from STATIC_ROOT with precompressed variants when SERVE_STATIC is on."""
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'SERVE_STATIC', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.prefix = urlparse(settings.STATIC_URL).path
+        self.root = str(settings.STATIC_ROOT)
+        self._files = None
+        self._lock = threading.Lock()
+
+    def get_files(self):
+        # после collectstatic STATIC_ROOT не меняется, обходим его один раз на процесс
+        if self._files is None:
+            with self._lock:
+                if self._files is None:
+                    self._files = self.scan()
+        return self._files
+
+    def scan(self):
+        hashed = set(getattr(staticfiles_storage, 'hashed_files', {}).values())
+        files = {}
+        for directory, _dirs, filenames in os.walk(self.root):
+            for filename in filenames:
+                if filename.endswith(tuple(extension for _encoding, extension in ENCODINGS)):
+                    continue
+                path = os.path.join(directory, filename)
+                name = os.path.relpath(path, self.root).replace(os.sep, '/')
+                files[name] = StaticFile(path, name in hashed)
+        return files
+
+    def __call__(self, request):
+        if request.method in ('GET', 'HEAD') and request.path_info.startswith(self.prefix):
+            static_file = self.get_files().get(request.path_info[len(self.prefix):])
+            if static_file is not None:
+                return self.serve(request, static_file)
+        return self.get_response(request)
+
+    def serve(self, request, static_file):
+        encoding = static_file.choose(request.headers.get('Accept-Encoding', ''))
+        path, size, mtime = static_file.variants[encoding]
+        etag = f'"{mtime:x}-{size:x}{"-" + encoding if encoding else ""}"'
+
+        if request.headers.get('If-None-Match') == etag or (
+                'If-None-Match' not in request.headers
+                and not was_modified_since(request.headers.get('If-Modified-Since'), mtime)):
+            response = HttpResponseNotModified()
+        else:
+            response = FileResponse(open(path, 'rb'), content_type=static_file.content_type)
+            if encoding:
+                response.headers['Content-Encoding'] = encoding
+
+        response.headers['ETag'] = etag
+        response.headers['Last-Modified'] = http_date(mtime)
+        if len(static_file.variants) > 1:
+            response.headers['Vary'] = 'Accept-Encoding'
+        if static_file.immutable:
+            response.headers['Cache-Control'] = f'public, max-age={settings.STATIC_MAX_AGE}, immutable'
+        else:
+            # имя без хэша может смениться при следующем деплое
+            response.headers['Cache-Control'] = 'public, max-age=60'
+        return response
+
+
+class PerformanceMiddleware:
+    """Times DB, template and Python work per request; Server-Timing for staff or DEBUG plus sampled JSONL records."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'PERF_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        # под ASGI остаёмся асинхронными, иначе async-вьюхи снова уйдут в поток
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with measure() as profile:
+            request.profile = profile
+            response = self.get_response(request)
+        user = getattr(request, 'user', None)
+        self.finish(request, response, profile, user)
+        return response
+
+    async def __acall__(self, request):
+        with measure() as profile:
+            request.profile = profile
+            response = await self.get_response(request)
+        user = await request.auser() if hasattr(request, 'auser') else None
+        await sync_to_async(self.finish, thread_sensitive=False)(request, response, profile, user)
+        return response
+
+    def finish(self, request, response, profile, user):
+        match = request.resolver_match
+        if match is None:
+            return
+        # число запросов и время БД посторонним не показываем
+        if settings.DEBUG or (user is not None and user.is_staff):
+            response.headers['Server-Timing'] = profile.server_timing()
+        if should_sample():
+            try:
+                write_record({
+                    'ts': round(time.time(), 3),
+                    'view': match.view_name,
+                    'method': request.method,
+                    'status': response.status_code,
+                    **profile.as_dict(),
+                })
+            except OSError:
+                # замеры не должны ронять запрос, если лог недоступен
+                pass
+
+    def process_template_response(self, request, response):
+        # рендер TemplateResponse идёт после всех process_template_response, конец ловим post-render колбэком
+        profile = getattr(request, 'profile', None)
+        if profile is not None:
+            profile.start_template()
+            response.add_post_render_callback(lambda rendered: profile.finish_template())
+        return response
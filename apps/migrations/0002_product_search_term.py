@@ -0,0 +1,27 @@
+# Generated by Django 5.2.3 on 2026-10-18 05:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apps', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSearchTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('language_code', models.CharField(max_length=15)),
+                ('term', models.CharField(db_index=True, max_length=64)),
+                ('weight', models.SmallIntegerField(default=1)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_terms', to='apps.product')),
+            ],
+            options={
+                'unique_together': {('product', 'language_code', 'term')},
+            },
+        ),
+    ]
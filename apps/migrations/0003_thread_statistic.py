@@ -0,0 +1,49 @@
+# Generated by Django 5.2.3 on 2026-10-18 05:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+STATUS_FIELDS = {
+    'new': 'new_count',
+    'ready_to_delivery': 'ready_count',
+    'delivering': 'delivering_count',
+    'delivered': 'delivered_count',
+    'not_call': 'not_call_count',
+    'canceled': 'canceled_count',
+    'archived': 'archived_count',
+}
+
+
+def fill_statistics(apps, schema_editor):
+    Thread = apps.get_model('apps', 'Thread')
+    ThreadStatistic = apps.get_model('apps', 'ThreadStatistic')
+    counts = Thread.objects.annotate(**{
+        field: Count('orders', filter=Q(orders__status=status)) for status, field in STATUS_FIELDS.items()
+    }).values('pk', *STATUS_FIELDS.values())
+    ThreadStatistic.objects.bulk_create(
+        [ThreadStatistic(thread_id=row.pop('pk'), **row) for row in counts], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apps', '0002_product_search_term'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ThreadStatistic',
+            fields=[
+                ('thread', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='statistic', serialize=False, to='apps.thread')),
+                ('new_count', models.IntegerField(default=0)),
+                ('ready_count', models.IntegerField(default=0)),
+                ('delivering_count', models.IntegerField(default=0)),
+                ('delivered_count', models.IntegerField(default=0)),
+                ('not_call_count', models.IntegerField(default=0)),
+                ('canceled_count', models.IntegerField(default=0)),
+                ('archived_count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(fill_statistics, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.3 on 2026-10-18 05:19
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_scores(apps, schema_editor):
+    Order = apps.get_model('apps', 'Order')
+    SellerScore = apps.get_model('apps', 'SellerScore')
+    scores = Order.objects.filter(status='delivered', thread__isnull=False) \
+        .values('thread__owner_id').annotate(total=Count('pk'))
+    SellerScore.objects.bulk_create(
+        [SellerScore(seller_id=row['thread__owner_id'], delivered_count=row['total']) for row in scores],
+        batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apps', '0003_thread_statistic'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SellerScore',
+            fields=[
+                ('seller', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='score', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('delivered_count', models.IntegerField(db_index=True, default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='sitesettings',
+            name='competition_end',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='sitesettings',
+            name='competition_start',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.RunPython(fill_scores, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.3 on 2026-10-18 05:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apps', '0004_seller_score'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='order',
+            name='hold',
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='claimed_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.3 on 2026-10-18 05:21
+
+from django.db import migrations, models
+
+
+def deduplicate_slugs(apps, schema_editor):
+    for model_name in ('Category', 'Product'):
+        model = apps.get_model('apps', model_name)
+        rows = list(model.objects.order_by('pk').values_list('pk', 'slug'))
+        used = {slug for _pk, slug in rows}
+        seen = set()
+        for pk, slug in rows:
+            if slug and slug not in seen:
+                seen.add(slug)
+                continue
+            base = slug or model_name.lower()
+            suffix = 1
+            while f'{base}-{suffix}' in used:
+                suffix += 1
+            new_slug = f'{base}-{suffix}'
+            used.add(new_slug)
+            seen.add(new_slug)
+            model.objects.filter(pk=pk).update(slug=new_slug)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apps', '0006_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(deduplicate_slugs, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='category',
+            name='slug',
+            field=models.SlugField(unique=True),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='slug',
+            field=models.SlugField(unique=True),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.3 on 2026-10-18 05:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+
+
+def fill_rollups(apps, schema_editor):
+    Order = apps.get_model('apps', 'Order')
+    OrderDailyRollup = apps.get_model('apps', 'OrderDailyRollup')
+    counts = Order.objects.annotate(day=TruncDate('created_at')) \
+        .values('day', 'district_id', 'district__region_id', 'status') \
+        .annotate(total=Count('pk')).order_by()
+    OrderDailyRollup.objects.bulk_create(
+        [OrderDailyRollup(day=row['day'], district_id=row['district_id'], region_id=row['district__region_id'],
+                          status=row['status'], count=row['total']) for row in counts], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apps', '0007_unique_slugs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('status', models.CharField(max_length=20)),
+                ('count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='orderdailyrollup',
+            name='district',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='order_rollups', to='apps.district'),
+        ),
+        migrations.AddField(
+            model_name='orderdailyrollup',
+            name='region',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='order_rollups', to='apps.region'),
+        ),
+        migrations.AddIndex(
+            model_name='orderdailyrollup',
+            index=models.Index(fields=['day', 'status', 'region'], name='order_rollup_day_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='orderdailyrollup',
+            unique_together={('day', 'district', 'status')},
+        ),
+        migrations.RunPython(fill_rollups, migrations.RunPython.noop),
+    ]
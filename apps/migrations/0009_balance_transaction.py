@@ -0,0 +1,55 @@
+# Generated by Django 5.2.3 on 2026-10-18 05:35
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def open_balances(apps, schema_editor):
+    # текущие балансы становятся первой записью журнала
+    User = apps.get_model('apps', 'User')
+    BalanceTransaction = apps.get_model('apps', 'BalanceTransaction')
+    users = User.objects.exclude(balance=0).exclude(balance__isnull=True).values_list('pk', 'balance')
+    BalanceTransaction.objects.bulk_create(
+        [BalanceTransaction(user_id=user_id, amount=balance, balance_after=balance, kind='opening')
+         for user_id, balance in users.iterator(chunk_size=2000)], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apps', '0008_order_daily_rollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BalanceTransaction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=0, max_digits=10)),
+                ('balance_after', models.DecimalField(decimal_places=0, max_digits=10)),
+                ('kind', models.CharField(choices=[('opening', 'Opening'), ('withdraw', 'Withdraw'), ('refund', 'Refund'), ('credit', 'Credit'), ('adjustment', 'Adjustment')], max_length=20)),
+                ('comment', models.CharField(blank=True, default='', max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='balancetransaction',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balance_transactions', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='balancetransaction',
+            name='withdraw',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='balance_transactions', to='apps.withdraw'),
+        ),
+        migrations.AddIndex(
+            model_name='balancetransaction',
+            index=models.Index(fields=['user', '-created_at'], name='balance_tx_user_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='balancetransaction',
+            constraint=models.UniqueConstraint(condition=models.Q(('withdraw__isnull', False)), fields=('withdraw', 'kind'), name='balance_tx_once_per_withdraw'),
+        ),
+        migrations.RunPython(open_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.3 on 2026-10-18 06:15
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_rollups(apps, schema_editor):
+    # строки без района могли задвоиться: складываем счётчики в первую строку, остальные удаляем
+    rollup = apps.get_model('apps', 'OrderDailyRollup')
+    duplicates = rollup.objects.filter(district__isnull=True).values('day', 'status') \
+        .annotate(rows=Count('pk'), first=Min('pk'), total=Sum('count')).filter(rows__gt=1).order_by()
+    for row in duplicates:
+        same = rollup.objects.filter(district__isnull=True, day=row['day'], status=row['status'])
+        same.exclude(pk=row['first']).delete()
+        same.update(count=row['total'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apps', '0011_order_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_rollups, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='orderdailyrollup',
+            constraint=models.UniqueConstraint(condition=models.Q(('district__isnull', True)), fields=('day', 'status'), name='order_rollup_no_district_uniq'),
+        ),
+    ]
@@ -0,0 +1,177 @@
+import base64
+import datetime
+import json
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.core.exceptions import PermissionDenied, ValidationError, FieldDoesNotExist
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.db.models.fields.files import FieldFile
+from django.http import Http404, JsonResponse
+
+from apps.models import User
+from apps.utils import query_budget
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    # DjangoJSONEncoder режет микросекунды до миллисекунд: строки внутри одной миллисекунды
+    # при сортировке по created_at терялись бы или повторялись между страницами
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor, request, cursor_param):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.request = request
+        self.cursor_param = cursor_param
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def next_url(self):
+        if self.next_cursor is None:
+            return None
+        query = self.request.GET.copy()
+        query[self.cursor_param] = self.next_cursor
+        return f'?{query.urlencode()}'
+
+
+class KeysetPaginationMixin:
+    """Seek pagination: ?cursor=<token> continues after the last row of the previous page."""
+    paginate_by = 24
+    keyset_ordering = ('-created_at', '-id')
+    cursor_param = 'cursor'
+    json_fields = ('id',)
+
+    def get_keyset_ordering(self):
+        return self.keyset_ordering
+
+    @staticmethod
+    def encode_cursor(values):
+        raw = json.dumps(values, cls=CursorEncoder, separators=(',', ':'))
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+    @staticmethod
+    def decode_cursor(cursor):
+        try:
+            raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            values = json.loads(raw)
+        except (ValueError, TypeError):
+            raise Http404('Invalid cursor')
+        if not isinstance(values, list):
+            raise Http404('Invalid cursor')
+        return values
+
+    @staticmethod
+    def clean_cursor(queryset, ordering, values):
+        # курсор приходит от клиента: значение не того типа иначе упало бы 500 уже в фильтре
+        if len(values) != len(ordering):
+            raise Http404('Invalid cursor')
+        cleaned = []
+        for field, value in zip(ordering, values):
+            name = field.lstrip('-')
+            try:
+                annotation = queryset.query.annotations.get(name)
+                model_field = annotation.output_field if annotation is not None else \
+                    queryset.model._meta.get_field(name)
+                value = model_field.to_python(value) \
+                    if isinstance(value, (str, int)) and not isinstance(value, bool) else None
+            except (ValidationError, FieldDoesNotExist, TypeError, ValueError):
+                value = None
+            if value is None:
+                raise Http404('Invalid cursor')
+            cleaned.append(value)
+        return cleaned
+
+    def _seek_filter(self, ordering, values):
+        conditions = []
+        for i, (field, value) in enumerate(zip(ordering, values)):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            equal = {prev.lstrip('-'): prev_value for prev, prev_value in zip(ordering[:i], values[:i])}
+            conditions.append(Q(**equal, **{f'{name}__{lookup}': value}))
+        return reduce(or_, conditions)
+
+    def paginate_queryset(self, queryset, page_size):
+        ordering = list(self.get_keyset_ordering())
+        queryset = queryset.order_by(*ordering)
+
+        cursor = self.request.GET.get(self.cursor_param)
+        if cursor:
+            values = self.clean_cursor(queryset, ordering, self.decode_cursor(cursor))
+            queryset = queryset.filter(self._seek_filter(ordering, values))
+
+        object_list = list(queryset[:page_size + 1])
+        next_cursor = None
+        if len(object_list) > page_size:
+            object_list = object_list[:page_size]
+            last = object_list[-1]
+            next_cursor = self.encode_cursor([getattr(last, field.lstrip('-')) for field in ordering])
+
+        page = KeysetPage(object_list, next_cursor, self.request, self.cursor_param)
+        return None, page, object_list, page.has_next()
+
+    def get_json_item(self, obj):
+        item = {}
+        for field in self.json_fields:
+            value = obj
+            for attr in field.split('.'):
+                # пустой FieldFile на .url бросает ValueError — товар без картинки отдаём как null
+                if isinstance(value, FieldFile) and not value:
+                    value = None
+                    break
+                value = getattr(value, attr, None)
+                if value is None:
+                    break
+            item[field] = value
+        return item
+
+    def render_to_response(self, context, **response_kwargs):
+        if self.request.GET.get('format') != 'json':
+            return super().render_to_response(context, **response_kwargs)
+        page = context['page_obj']
+        return JsonResponse({
+            'results': [self.get_json_item(obj) for obj in page.object_list],
+            'next': page.next_url,
+        })
+
+
+class RenderProfileMixin:
+    """Eager-loads what the template touches per row and, in tests, enforces a fixed query budget."""
+    select_related = ()
+    prefetch_related = ()
+    query_budget = None
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.select_related:
+            queryset = queryset.select_related(*self.select_related)
+        if self.prefetch_related:
+            queryset = queryset.prefetch_related(*self.prefetch_related)
+        return queryset
+
+    def dispatch(self, request, *args, **kwargs):
+        if self.query_budget is None or not getattr(settings, 'QUERY_BUDGET_ENFORCE', False):
+            return super().dispatch(request, *args, **kwargs)
+        with query_budget(self.query_budget, label=self.__class__.__name__):
+            response = super().dispatch(request, *args, **kwargs)
+            if hasattr(response, 'render'):
+                response.render()
+        return response
+
+
+class OperatorRequiredMixin(LoginRequiredMixin):
+    """Operator pages: anonymous users go to login, other roles get 403."""
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.user.is_authenticated and request.user.role != User.RoleType.OPERATOR:
+            raise PermissionDenied
+        return super().dispatch(request, *args, **kwargs)
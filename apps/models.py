@@ -1,13 +1,17 @@
 from django.contrib.auth.hashers import make_password
 from django.db.models import Model, CharField, ImageField, DecimalField, TextField, ForeignKey, IntegerField, \
     DateTimeField, CASCADE, URLField, SlugField, SET_NULL, SmallIntegerField, TextChoices, BooleanField, DateField, \
-    EmailField
+    EmailField, OneToOneField, Q
 from django.contrib.auth.models import AbstractUser, UserManager
-from django.template.defaultfilters import slugify
 from parler.models import TranslatableModel, TranslatedFields
-from django.db import models
+from django.db import models, transaction, IntegrityError
+from django.utils import timezone
+from django.utils.functional import cached_property
 from django.utils.translation import gettext_lazy as _
 
+from apps.cache import get_wishlist_ids
+from apps.slugs import base_slug, has_base, unique_slug
+
 class CustomUserManager(UserManager):
     use_in_migrations = True
 
@@ -92,8 +96,10 @@ class User(AbstractUser):
     balance = DecimalField(default=0, null=True, blank=True, max_digits=10, decimal_places=0)
     role = CharField(choices=RoleType, max_length=20, default=RoleType.USER)
 
+    @cached_property
     def wishlist_products(self):
-        return list(self.wishlist.all().values_list('product__pk', flat=True))
+        # множество id товаров: один запрос (или кэш) на запрос, проверка `in` за O(1)
+        return get_wishlist_ids(self.pk)
 
 class Region(Model):
     name = CharField(max_length=255)
@@ -103,19 +109,25 @@ class District(Model):
     region = ForeignKey('apps.Region', CASCADE,related_name='districts')
 
 class BaseSlug(TranslatableModel):
-    slug = SlugField()
+    slug = SlugField(unique=True)
 
     class Meta:
         abstract = True
 
     def save(self, *args, **kwargs):
-        slug = slugify(self.name)
-        query = self.__class__.objects.filter(slug=slug)
-        while query.exists():
-            slug += '-1'
-
-        self.slug = slug
-        return super().save(*args, **kwargs)
+        base = base_slug(self, self.name)
+        if has_base(self.slug, base):
+            return super().save(*args, **kwargs)
+
+        for attempt in range(3):
+            self.slug = unique_slug(self.__class__, base, exclude_pk=self.pk)
+            try:
+                with transaction.atomic():
+                    return super().save(*args, **kwargs)
+            except IntegrityError:
+                # тот же слаг успел занять параллельный запрос
+                if attempt == 2:
+                    raise
 
 class Category(BaseSlug):
     icon = URLField()
@@ -137,6 +149,21 @@ class Product(BaseSlug):
     seller_prise = DecimalField(max_digits=100, decimal_places=0)
     message_id =CharField( max_length=255)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['-create_at', '-id'], name='product_newest_idx'),
+            models.Index(fields=['category', '-create_at', '-id'], name='product_category_newest_idx'),
+        ]
+
+class ProductSearchTerm(Model):
+    product = ForeignKey('apps.Product', CASCADE, related_name='search_terms')
+    language_code = CharField(max_length=15)
+    term = CharField(max_length=64, db_index=True)
+    weight = SmallIntegerField(default=1)
+
+    class Meta:
+        unique_together = ('product', 'language_code', 'term')
+
 class Order(Model):
     class StatusType(TextChoices):
         NEW = "new", _("New")
@@ -161,13 +188,50 @@ class Order(Model):
     thread = ForeignKey('apps.Thread',SET_NULL,null=True,blank=True, related_name='orders')
     operator = ForeignKey('apps.User',SET_NULL,null=True,blank=True, related_name='operator_orders')
     deliver = ForeignKey('apps.User',SET_NULL,null=True,blank=True, related_name='deliver_orders')
-    hold = BooleanField(default=False)
+    claimed_until = DateTimeField(null=True, blank=True)
+    # ключ из скрытого поля формы заказа: повторная отправка той же формы не создаёт второй заказ
+    idempotency_key = CharField(max_length=64, unique=True, null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # очередь новых заказов операторов
+            models.Index(fields=['created_at', 'id'], condition=Q(status='new'), name='order_new_queue_idx'),
+            models.Index(fields=['operator', 'status', 'created_at'], name='order_operator_status_idx'),
+            models.Index(fields=['customer', '-created_at', '-id'], name='order_customer_newest_idx'),
+            models.Index(fields=['status', 'created_at'], name='order_status_created_idx'),
+            models.Index(fields=['district', 'status'], name='order_district_status_idx'),
+            models.Index(fields=['thread', 'status'], name='order_thread_status_idx'),
+        ]
+
+    @property
+    def is_claimed(self):
+        return self.claimed_until is not None and self.claimed_until > timezone.now()
+
+
+class StockReservation(Model):
+    # сколько единиц товара сейчас списано со склада под заказ; 0 — возвращено
+    order = OneToOneField('apps.Order', CASCADE, primary_key=True, related_name='reservation')
+    product = ForeignKey('apps.Product', CASCADE, related_name='reservations')
+    quantity = IntegerField(default=0)
+    expires_at = DateTimeField(null=True, blank=True)
+    created_at = DateTimeField(auto_now_add=True)
+    updated_at = DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['expires_at'], condition=Q(quantity__gt=0), name='stock_reservation_expiry_idx'),
+        ]
 
 
 class WishList(Model):
     user = ForeignKey('apps.User', CASCADE, related_name='wishlist')
     product = ForeignKey('apps.Product', CASCADE, related_name='wishlist')
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'product'], name='wishlist_user_product_idx'),
+        ]
+
 class Thread(Model):
     owner = ForeignKey('apps.User', CASCADE, related_name='threads')
     product = ForeignKey('apps.Product', CASCADE, related_name='threads')
@@ -181,10 +245,45 @@ class Thread(Model):
     def discount_price(self):
         return self.product.price - self.discount
 
+class ThreadStatistic(Model):
+    thread = OneToOneField('apps.Thread', CASCADE, primary_key=True, related_name='statistic')
+    new_count = IntegerField(default=0)
+    ready_count = IntegerField(default=0)
+    delivering_count = IntegerField(default=0)
+    delivered_count = IntegerField(default=0)
+    not_call_count = IntegerField(default=0)
+    canceled_count = IntegerField(default=0)
+    archived_count = IntegerField(default=0)
+
+class OrderDailyRollup(Model):
+    # число заказов, созданных за день, по району и текущему статусу
+    day = DateField()
+    region = ForeignKey('apps.Region', CASCADE, null=True, blank=True, related_name='order_rollups')
+    district = ForeignKey('apps.District', CASCADE, null=True, blank=True, related_name='order_rollups')
+    status = CharField(max_length=20)
+    count = IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('day', 'district', 'status')
+        # NULL в district не равен другому NULL, unique_together заказы без района не покрывает
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'status'], condition=Q(district__isnull=True),
+                                    name='order_rollup_no_district_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['day', 'status', 'region'], name='order_rollup_day_idx'),
+        ]
+
+class SellerScore(Model):
+    seller = OneToOneField('apps.User', CASCADE, primary_key=True, related_name='score')
+    delivered_count = IntegerField(default=0, db_index=True)
+
 class SiteSettings(Model):
     delivery_price = DecimalField(max_digits=9, decimal_places=0)
     competition_thumbnail = ImageField(upload_to="site-settings/")
     discount_price = DecimalField(max_digits=9,decimal_places=0,default=0)
+    competition_start = DateField(null=True, blank=True)
+    competition_end = DateField(null=True, blank=True)
 
 class Withdraw(Model):
     class WithdrawStatus(TextChoices):
@@ -200,5 +299,28 @@ class Withdraw(Model):
     card_number = CharField(max_length=20)
     pay_at = DateTimeField(auto_now_add=True)
 
+class BalanceTransaction(Model):
+    # журнал только дописывается; User.balance — его кэшированная сумма
+    class Kind(TextChoices):
+        OPENING = 'opening', 'Opening'
+        WITHDRAW = 'withdraw', 'Withdraw'
+        REFUND = 'refund', 'Refund'
+        CREDIT = 'credit', 'Credit'
+        ADJUSTMENT = 'adjustment', 'Adjustment'
+
+    user = ForeignKey('apps.User', CASCADE, related_name='balance_transactions')
+    amount = DecimalField(max_digits=10, decimal_places=0)
+    balance_after = DecimalField(max_digits=10, decimal_places=0)
+    kind = CharField(choices=Kind, max_length=20)
+    withdraw = ForeignKey('apps.Withdraw', SET_NULL, null=True, blank=True, related_name='balance_transactions')
+    comment = CharField(max_length=255, default='', blank=True)
+    created_at = DateTimeField(auto_now_add=True)
 
-
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='balance_tx_user_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['withdraw', 'kind'], condition=Q(withdraw__isnull=False),
+                                    name='balance_tx_once_per_withdraw'),
+        ]
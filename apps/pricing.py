@@ -0,0 +1,44 @@
+from decimal import Decimal
+
+from apps.cache import get_site_settings
+from apps.models import Order
+
+
+def order_total(price, quantity, thread_discount=0, site_discount=0, delivery_price=0):
+    """(price - thread discount) * quantity - site discount, never below zero, plus delivery."""
+    unit_price = max(Decimal(price) - Decimal(thread_discount or 0), Decimal(0))
+    goods = max(unit_price * quantity - Decimal(site_discount or 0), Decimal(0))
+    return goods + Decimal(delivery_price or 0)
+
+
+def price_order(order, site=None):
+    # product и thread должны быть уже загружены (select_related), иначе это два лишних запроса
+    site = site or get_site_settings()
+    if order.product is None:
+        return order.total
+    return order_total(
+        order.product.price,
+        order.quantity,
+        thread_discount=order.thread.discount if order.thread is not None else 0,
+        site_discount=site.discount_price if site else 0,
+        delivery_price=site.delivery_price if site else 0,
+    )
+
+
+def reprice_orders(orders, site=None, batch_size=500):
+    """Recomputes totals for a queryset of orders in one pass; only changed rows are written."""
+    site = site or get_site_settings()
+    changed, updated = [], 0
+    for order in orders.select_related('product', 'thread').iterator(chunk_size=batch_size):
+        total = price_order(order, site)
+        if total != order.total:
+            order.total = total
+            changed.append(order)
+        if len(changed) >= batch_size:
+            Order.objects.bulk_update(changed, ['total'])
+            updated += len(changed)
+            changed = []
+    if changed:
+        Order.objects.bulk_update(changed, ['total'])
+        updated += len(changed)
+    return updated
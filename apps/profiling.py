@@ -0,0 +1,122 @@
+import json
+import math
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager, ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+_log_lock = threading.Lock()
+
+
+class Profile:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.finished = None
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self._template_started = None
+
+    def record_query(self, duration):
+        self.queries += 1
+        self.db_time += duration
+
+    def start_template(self):
+        self._template_started = time.perf_counter()
+
+    def finish_template(self):
+        if self._template_started is not None:
+            self.template_time += time.perf_counter() - self._template_started
+            self._template_started = None
+
+    def finish(self):
+        self.finished = time.perf_counter()
+
+    @property
+    def total_time(self):
+        return (self.finished or time.perf_counter()) - self.started
+
+    @property
+    def python_time(self):
+        # всё, что не БД и не шаблон: код вьюхи, middleware, сериализация
+        return max(self.total_time - self.db_time - self.template_time, 0.0)
+
+    def as_dict(self):
+        return {
+            'total_ms': round(self.total_time * 1000, 2),
+            'db_ms': round(self.db_time * 1000, 2),
+            'queries': self.queries,
+            'template_ms': round(self.template_time * 1000, 2),
+            'python_ms': round(self.python_time * 1000, 2),
+        }
+
+    def server_timing(self):
+        return ', '.join([
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries"',
+            f'tpl;dur={self.template_time * 1000:.1f}',
+            f'app;dur={self.python_time * 1000:.1f}',
+            f'total;dur={self.total_time * 1000:.1f}',
+        ])
+
+
+@contextmanager
+def measure():
+    """Counts queries and DB time on every connection inside the block: `with measure() as profile: ...`."""
+    profile = Profile()
+
+    def wrapper(execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            profile.record_query(time.perf_counter() - started)
+
+    with ExitStack() as stack:
+        # обёртка ставится и на ещё не открытые соединения: они открываются лениво внутри блока
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(wrapper))
+        try:
+            yield profile
+        finally:
+            profile.finish()
+
+
+def should_sample():
+    rate = getattr(settings, 'PERF_SAMPLE_RATE', 0)
+    return rate >= 1 or random.random() < rate
+
+
+def write_record(record, path=None):
+    path = str(path or settings.PERF_LOG_PATH)
+    max_bytes = getattr(settings, 'PERF_LOG_MAX_BYTES', 0)
+    line = json.dumps(record, separators=(',', ':')) + '\n'
+    with _log_lock:
+        # на диске не больше двух файлов: текущий и один предыдущий .1
+        try:
+            if max_bytes and os.path.getsize(path) >= max_bytes:
+                os.replace(path, f'{path}.1')
+        except FileNotFoundError:
+            pass
+        with open(path, 'a', encoding='utf-8') as fh:
+            fh.write(line)
+
+
+def read_records(path=None):
+    path = str(path or settings.PERF_LOG_PATH)
+    paths = [f'{path}.1', path] if os.path.exists(f'{path}.1') else [path]
+    for name in paths:
+        with open(name, encoding='utf-8') as fh:
+            for line in fh:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def percentile(values, fraction):
+    # nearest-rank по отсортированному списку
+    if not values:
+        return 0.0
+    return values[max(math.ceil(fraction * len(values)) - 1, 0)]
@@ -0,0 +1,189 @@
+import math
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.module_loading import import_string
+from django.utils.translation import gettext as _
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """'5/m', '100/h', '3/10m' -> (limit, window in seconds)."""
+    limit, period = rate.split('/')
+    multiplier = int(period[:-1] or 1)
+    return int(limit), multiplier * PERIODS[period[-1]]
+
+
+class LocalBackend:
+    """Exact sliding log in process memory; every worker counts on its own."""
+    sweep_interval = 60
+
+    def __init__(self):
+        self._hits = defaultdict(deque)
+        self._expires = {}
+        self._swept = time.monotonic()
+        self._lock = threading.Lock()
+
+    def sweep(self, now):
+        # ключи разовых клиентов иначе копились бы в памяти воркера бесконечно
+        for key in [key for key, expires in self._expires.items() if expires <= now]:
+            del self._expires[key]
+            self._hits.pop(key, None)
+        self._swept = now
+
+    def hit(self, key, limit, window):
+        now = time.monotonic()
+        with self._lock:
+            if now - self._swept >= self.sweep_interval:
+                self.sweep(now)
+            hits = self._hits[key]
+            while hits and hits[0] <= now - window:
+                hits.popleft()
+            if len(hits) >= limit:
+                return hits[0] + window - now
+            hits.append(now)
+            self._expires[key] = now + window
+            return None
+
+
+class CacheBackend:
+    """Sliding window counter in the Django cache: the current bucket plus a weighted share of the previous one."""
+
+    def hit(self, key, limit, window):
+        now = time.time()
+        bucket = int(now // window)
+        current_key, previous_key = f'rl:{key}:{bucket}', f'rl:{key}:{bucket - 1}'
+        # add + incr атомарны и в Redis, и в LocMem; ключ живёт два окна, пока нужен следующему
+        cache.add(current_key, 0, window * 2)
+        try:
+            current = cache.incr(current_key)
+        except ValueError:
+            cache.set(current_key, 1, window * 2)
+            current = 1
+        previous = cache.get(previous_key, 0)
+        elapsed = now - bucket * window
+        estimated = previous * (window - elapsed) / window + current
+        if estimated > limit:
+            return window - elapsed
+        return None
+
+
+class RedisBackend:
+    """Exact sliding log in a Redis sorted set, shared by all workers; needs the redis package."""
+
+    def __init__(self):
+        import redis
+
+        self.client = redis.Redis.from_url(settings.RATELIMIT_REDIS_URL)
+
+    def hit(self, key, limit, window):
+        now = time.time()
+        key = f'rl:{key}'
+        pipeline = self.client.pipeline()
+        pipeline.zremrangebyscore(key, 0, now - window)
+        pipeline.zadd(key, {uuid.uuid4().hex: now})
+        pipeline.zcard(key)
+        pipeline.zrange(key, 0, 0, withscores=True)
+        pipeline.expire(key, math.ceil(window))
+        _removed, _added, count, oldest, _expire = pipeline.execute()
+        if count > limit:
+            return oldest[0][1] + window - now if oldest else window
+        return None
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = import_string(settings.RATELIMIT_BACKEND)()
+    return _backend
+
+
+def client_ip(request):
+    if getattr(settings, 'RATELIMIT_TRUST_FORWARDED', False):
+        # за nginx REMOTE_ADDR — адрес прокси, реальный клиент первым в X-Forwarded-For
+        forwarded = request.headers.get('X-Forwarded-For', '')
+        if forwarded:
+            return forwarded.split(',')[0].strip()
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def client_phone(request):
+    digits = ''.join(ch for ch in request.POST.get('phone_number', '') if ch.isdigit())
+    return digits[-9:] or None
+
+
+def client_user(request):
+    user = getattr(request, 'user', None)
+    return str(user.pk) if user is not None and user.is_authenticated else None
+
+
+KEY_FUNCTIONS = {'ip': client_ip, 'phone': client_phone, 'user': client_user}
+
+
+def check_limits(request, group):
+    """Counts the request against every RATELIMITS[group] rule; seconds to wait if any is exceeded, else None."""
+    if not getattr(settings, 'RATELIMIT_ENABLED', True):
+        return None
+    retry_after = None
+    for kind, rate in settings.RATELIMITS.get(group, ()):
+        value = KEY_FUNCTIONS[kind](request)
+        if not value:
+            continue
+        limit, window = parse_rate(rate)
+        wait = get_backend().hit(f'{group}:{kind}:{value}', limit, window)
+        if wait is not None:
+            retry_after = max(retry_after or 0, wait)
+    return retry_after
+
+
+def limited_response(retry_after):
+    response = HttpResponse(_('Too many requests. Please try again later.'), status=429,
+                            content_type='text/plain; charset=utf-8')
+    response.headers['Retry-After'] = str(max(math.ceil(retry_after), 1))
+    return response
+
+
+def ratelimit(group, methods=('POST',)):
+    """View decorator: answers 429 once a RATELIMITS[group] window is full."""
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method in methods:
+                retry_after = check_limits(request, group)
+                if retry_after is not None:
+                    return limited_response(retry_after)
+            return view(request, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class RateLimitMixin:
+    ratelimit_group = None
+    ratelimit_methods = ('POST',)
+
+    def ratelimit_exempt(self, request):
+        """True for requests that must not use up the limit, e.g. a retry answered from an earlier result."""
+        return False
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method in self.ratelimit_methods and not self.ratelimit_exempt(request):
+            retry_after = check_limits(request, self.ratelimit_group)
+            if retry_after is not None:
+                return limited_response(retry_after)
+        return super().dispatch(request, *args, **kwargs)
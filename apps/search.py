@@ -0,0 +1,100 @@
+import re
+from collections import Counter
+
+from django.conf import settings
+from django.db.models import Case, When, Value, Max, Sum, Q, IntegerField
+from django.db.models.functions import Greatest
+from django.utils.html import strip_tags
+from django.utils.translation import get_language
+
+from apps.models import Product, ProductSearchTerm
+
+NAME_WEIGHT = 3
+CATEGORY_WEIGHT = 2
+DESCRIPTION_WEIGHT = 1
+
+MIN_TERM_LENGTH = 2
+MAX_TERM_LENGTH = 64
+
+# o‘, o’, oʻ, o` и o' пишут по-разному, в индексе апостроф убираем
+APOSTROPHES = re.compile(r"['`‘’ʻʼ]")
+WORD = re.compile(r'\w+')
+
+
+def tokenize(text):
+    text = APOSTROPHES.sub('', strip_tags(text or '').lower())
+    return [word[:MAX_TERM_LENGTH] for word in WORD.findall(text) if len(word) >= MIN_TERM_LENGTH]
+
+
+def _product_terms(product):
+    for translation in product.translations.all():
+        language_code = translation.language_code
+        weights = Counter()
+        for term in tokenize(translation.name):
+            weights[term] += NAME_WEIGHT
+        for term in tokenize(translation.description):
+            weights[term] += DESCRIPTION_WEIGHT
+        category_name = product.category.safe_translation_getter('name', language_code=language_code,
+                                                                  any_language=True)
+        for term in tokenize(category_name):
+            weights[term] += CATEGORY_WEIGHT
+
+        for term, weight in weights.items():
+            yield ProductSearchTerm(product_id=product.pk, language_code=language_code, term=term,
+                                    weight=min(weight, 32767))
+
+
+def index_products(products, batch_size=1000):
+    products = list(products.select_related('category').prefetch_related('translations', 'category__translations'))
+    ProductSearchTerm.objects.filter(product__in=products).delete()
+    terms = [term for product in products for term in _product_terms(product)]
+    ProductSearchTerm.objects.bulk_create(terms, batch_size=batch_size)
+    return len(terms)
+
+
+def index_product(product_id):
+    return index_products(Product.objects.filter(pk=product_id))
+
+
+def _search_languages(language_code):
+    languages = [language_code or get_language() or settings.LANGUAGE_CODE]
+    fallbacks = settings.PARLER_LANGUAGES.get('default', {}).get('fallbacks', [])
+    return list(dict.fromkeys([*languages, *fallbacks]))
+
+
+def rank_products(query, language_code=None, limit=None):
+    tokens = list(dict.fromkeys(tokenize(query)))
+    if not tokens:
+        return []
+
+    prefix = Q()
+    matches = {}
+    for i, token in enumerate(tokens):
+        prefix |= Q(term__startswith=token)
+        matches[f'match_{i}'] = Max(Case(When(term__startswith=token, then=Value(1)), default=Value(0),
+                                         output_field=IntegerField()))
+
+    # вес берём из лучше всего совпавшего языка: сумма по языкам поднимала бы товары с несколькими
+    # переводами над более точными совпадениями
+    languages = _search_languages(language_code)
+    weights = [Sum(Case(When(language_code=code, then='weight'), default=Value(0), output_field=IntegerField()))
+               for code in languages]
+    rank = weights[0] if len(weights) == 1 else Greatest(*weights)
+
+    ranked = ProductSearchTerm.objects.filter(prefix, language_code__in=languages) \
+        .values('product_id') \
+        .annotate(rank=rank, **matches) \
+        .filter(**{name: 1 for name in matches}) \
+        .order_by('-rank', '-product_id')
+
+    limit = limit or settings.SEARCH_RESULT_LIMIT
+    return list(ranked.values_list('product_id', flat=True)[:limit])
+
+
+def search_products(query, language_code=None, limit=None, queryset=None):
+    queryset = Product.objects.all() if queryset is None else queryset
+    product_ids = rank_products(query, language_code, limit)
+    if not product_ids:
+        return queryset.none()
+    ordering = Case(*[When(pk=pk, then=Value(position)) for position, pk in enumerate(product_ids)])
+    return queryset.filter(pk__in=product_ids).order_by(ordering)
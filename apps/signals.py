@@ -0,0 +1,160 @@
+import threading
+
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, post_init
+from django.dispatch import receiver
+from parler.cache import is_missing
+
+from apps.cache import invalidate_wishlist, invalidate_site_settings, invalidate_catalogue, invalidate_districts
+from apps.models import Product, Category, WishList, SiteSettings, Order, Thread, ThreadStatistic, Region, \
+    District, Withdraw, StockReservation
+from apps.search import index_product, index_products
+from apps.leaderboard import record_delivery_change, rebuild_leaderboard
+from apps.inventory import HOLDING_STATUSES, release_reservation, return_stock
+from apps.ledger import refund_withdraw
+from apps.stats import record_order_change, record_rollup_change
+from apps.thumbnails import warm_thumbnails
+
+
+_reindex = threading.local()
+
+
+def _pending_reindex():
+    if not hasattr(_reindex, 'product_ids'):
+        _reindex.product_ids = set()
+    return _reindex.product_ids
+
+
+def _reindex_once(product_id):
+    # товар и несколько его переводов в одной транзакции — одна переиндексация на коммит
+    pending = _pending_reindex()
+    if product_id in pending:
+        pending.discard(product_id)
+        index_product(product_id)
+
+
+def _translations_pending(product):
+    # parler сохраняет изменённые переводы сразу после товара, их post_save и переиндексирует
+    translations = product._translations_cache.get(Product._parler_meta.root_model, {}).values()
+    return any(not is_missing(translation) and (translation.pk is None or translation.is_modified)
+               for translation in translations)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Product._parler_meta.root_model)
+def reindex_product(sender, instance, **kwargs):
+    if sender is Product and _translations_pending(instance):
+        return
+    product_id = instance.pk if sender is Product else instance.master_id
+    _pending_reindex().add(product_id)
+    transaction.on_commit(lambda: _reindex_once(product_id))
+
+
+@receiver(post_save, sender=Category._parler_meta.root_model)
+def reindex_category_products(sender, instance, **kwargs):
+    category_id = instance.master_id
+    transaction.on_commit(lambda: index_products(Product.objects.filter(category_id=category_id)))
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Category._parler_meta.root_model)
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Product._parler_meta.root_model)
+def reset_catalogue_cache(sender, **kwargs):
+    transaction.on_commit(invalidate_catalogue)
+
+
+@receiver(post_save, sender=Product)
+def warm_product_thumbnails(sender, instance, **kwargs):
+    name = instance.image.name
+    transaction.on_commit(lambda: warm_thumbnails(name))
+
+
+@receiver(post_save, sender=SiteSettings)
+def warm_competition_thumbnails(sender, instance, **kwargs):
+    name = instance.competition_thumbnail.name
+    transaction.on_commit(lambda: warm_thumbnails(name))
+
+
+@receiver(post_save, sender=WishList)
+@receiver(post_delete, sender=WishList)
+def reset_wishlist_cache(sender, instance, **kwargs):
+    invalidate_wishlist(instance.user_id)
+
+
+@receiver(post_save, sender=SiteSettings)
+@receiver(post_delete, sender=SiteSettings)
+def reset_site_settings_cache(sender, **kwargs):
+    invalidate_site_settings()
+
+
+@receiver(post_save, sender=Region)
+@receiver(post_delete, sender=Region)
+@receiver(post_save, sender=District)
+@receiver(post_delete, sender=District)
+def reset_districts_cache(sender, **kwargs):
+    transaction.on_commit(invalidate_districts)
+
+
+@receiver(post_save, sender=SiteSettings)
+def recount_competition(sender, instance, **kwargs):
+    # окно конкурса могло поменяться — пересчитываем таблицу лидеров целиком
+    transaction.on_commit(lambda: rebuild_leaderboard(instance))
+
+
+TRACKED_ORDER_FIELDS = ('status', 'thread_id', 'delivered_date', 'district_id')
+
+
+@receiver(post_init, sender=Order)
+def remember_order_state(sender, instance, **kwargs):
+    # отложенные (only/defer) поля не запоминаем — их изменение не отследить
+    instance._initial_state = {field: instance.__dict__[field] for field in TRACKED_ORDER_FIELDS
+                               if field in instance.__dict__}
+
+
+@receiver(post_save, sender=Order)
+def track_order_changes(sender, instance, created, **kwargs):
+    initial = {} if created else instance._initial_state
+    if created or len(initial) == len(TRACKED_ORDER_FIELDS):
+        current = {field: getattr(instance, field) for field in TRACKED_ORDER_FIELDS}
+        record_order_change(initial.get('thread_id'), initial.get('status'), instance.thread_id, instance.status)
+        record_rollup_change(initial.get('district_id'), initial.get('status'), instance.district_id,
+                             instance.status, instance.created_at)
+        record_delivery_change(initial, current, instance.created_at)
+        if not created and instance.status != initial['status'] and instance.status not in HOLDING_STATUSES:
+            # отмена из админки или массовой правки тоже возвращает товар на склад
+            release_reservation(instance)
+    remember_order_state(sender, instance)
+
+
+@receiver(post_delete, sender=Order)
+def forget_order(sender, instance, **kwargs):
+    initial = instance._initial_state
+    record_order_change(initial.get('thread_id'), initial.get('status'), None, None)
+    record_rollup_change(initial.get('district_id'), initial.get('status'), None, None, instance.created_at)
+    record_delivery_change(initial, {}, instance.created_at)
+
+
+@receiver(post_delete, sender=StockReservation)
+def return_reserved_stock(sender, instance, **kwargs):
+    return_stock(instance.product_id, instance.quantity)
+
+
+@receiver(post_save, sender=Thread)
+def create_thread_statistic(sender, instance, created, **kwargs):
+    if created:
+        ThreadStatistic.objects.get_or_create(thread=instance)
+
+
+@receiver(post_init, sender=Withdraw)
+def remember_withdraw_status(sender, instance, **kwargs):
+    instance._initial_status = instance.__dict__.get('status')
+
+
+@receiver(post_save, sender=Withdraw)
+def refund_canceled_withdraw(sender, instance, created, **kwargs):
+    if not created and instance.status == Withdraw.WithdrawStatus.CANCEL and instance._initial_status != instance.status:
+        refund_withdraw(instance)
+    instance._initial_status = instance.status
@@ -0,0 +1,70 @@
+import re
+
+from django.db.models.functions import Length
+from django.template.defaultfilters import slugify
+
+# узбекская латиница для кириллицы (uz и ru): иначе slugify выбрасывает все буквы и слаг становится product-N
+CYRILLIC = str.maketrans({
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'yo', 'ж': 'j', 'з': 'z', 'и': 'i',
+    'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r', 'с': 's', 'т': 't',
+    'у': 'u', 'ф': 'f', 'х': 'x', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'щ': 'sh', 'ъ': '', 'ы': 'i', 'ь': '',
+    'э': 'e', 'ю': 'yu', 'я': 'ya', 'ў': 'o', 'қ': 'q', 'ғ': 'g', 'ҳ': 'h',
+})
+
+
+def transliterate(text):
+    return text.lower().translate(CYRILLIC)
+
+
+def base_slug(obj, text):
+    return slugify(transliterate(text or ''))[:40] or obj._meta.model_name
+
+
+def has_base(slug, base):
+    return slug == base or re.fullmatch(rf'{re.escape(base)}-\d+', slug or '') is not None
+
+
+def _exclude(queryset, exclude_pk):
+    return queryset.exclude(pk=exclude_pk) if exclude_pk is not None else queryset
+
+
+def _next_suffix(model, base, exclude_pk=None):
+    # одна строка с наибольшим хвостом: длиннее — значит больше, при равной длине решает строка.
+    # LIKE 'base-%' идёт по индексу slug, regex отсекает base-smth-2 от другой базы
+    slugs = _exclude(model.objects.filter(slug__startswith=f'{base}-', slug__regex=rf'^{base}-[1-9][0-9]*$'),
+                     exclude_pk)
+    last = slugs.order_by(Length('slug').desc(), '-slug').values_list('slug', flat=True).first()
+    return int(last.rpartition('-')[2]) + 1 if last else 1
+
+
+def _make_slug(base, suffix):
+    return base if suffix == 0 else f'{base}-{suffix}'
+
+
+def unique_slug(model, base, exclude_pk=None):
+    if not _exclude(model.objects.filter(slug=base), exclude_pk).exists():
+        return base
+    return _make_slug(base, _next_suffix(model, base, exclude_pk))
+
+
+def assign_slugs(model, objects, batch_size=200):
+    # слаги для bulk_create: один запрос на пачку баз, хвост запрашиваем только для уже занятых баз
+    pending = [obj for obj in objects if not obj.slug]
+    bases = {id(obj): base_slug(obj, obj.safe_translation_getter('name', any_language=True)) for obj in pending}
+    unique_bases = list(dict.fromkeys(bases.values()))
+    for start in range(0, len(unique_bases), batch_size):
+        chunk = set(unique_bases[start:start + batch_size])
+        taken = set(model.objects.filter(slug__in=chunk).values_list('slug', flat=True))
+        suffixes = {}
+        for obj in pending:
+            base = bases[id(obj)]
+            if base not in chunk:
+                continue
+            if base not in suffixes and base not in taken:
+                suffix = 0
+            else:
+                suffix = suffixes.get(base) or _next_suffix(model, base)
+            obj.slug = _make_slug(base, suffix)
+            # после самой базы следующему нужен хвост из БД: там может лежать base-7
+            suffixes[base] = suffix + 1 if suffix else 0
+    return objects
@@ -0,0 +1,108 @@
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from apps.models import Order, Thread, ThreadStatistic, OrderDailyRollup, District
+
+STATUS_FIELDS = {
+    Order.StatusType.NEW: 'new_count',
+    Order.StatusType.READY_TO_DELIVERY: 'ready_count',
+    Order.StatusType.DELIVERING: 'delivering_count',
+    Order.StatusType.DELIVERED: 'delivered_count',
+    Order.StatusType.NOT_CALL: 'not_call_count',
+    Order.StatusType.CANCELED: 'canceled_count',
+    Order.StatusType.ARCHIVED: 'archived_count',
+}
+
+
+def sum_statistics(statistics):
+    totals = dict.fromkeys(['visit_total', *(field.replace('_count', '_total') for field in STATUS_FIELDS.values())], 0)
+    for statistic in statistics:
+        totals['visit_total'] += statistic.thread.visit_count
+        for field in STATUS_FIELDS.values():
+            totals[field.replace('_count', '_total')] += getattr(statistic, field)
+    return totals
+
+
+@transaction.atomic
+def recount_thread(thread_id):
+    # считаем заново, а не прибавляем разницу: у двух операторов, открывших заказ одновременно,
+    # одинаковый старый статус, и обе разницы вычли бы его дважды.
+    # Строку статистики блокируем до подсчёта, иначе параллельные новые заказы перезапишут друг друга
+    statistic = ThreadStatistic.objects.filter(thread_id=thread_id)
+    if statistic.select_for_update().first() is None:
+        ThreadStatistic.objects.get_or_create(thread_id=thread_id)
+    counts = dict(Order.objects.filter(thread_id=thread_id).values('status').annotate(total=Count('pk'))
+                  .order_by().values_list('status', 'total'))
+    statistic.update(**{field: counts.get(status, 0) for status, field in STATUS_FIELDS.items()})
+
+
+def record_order_change(old_thread_id, old_status, new_thread_id, new_status):
+    """Recounts the threads an order left or joined, in the order's transaction.
+
+    Deleting a thread needs nothing: its statistic row goes with it and its orders keep no thread.
+    """
+    if (old_thread_id, old_status) == (new_thread_id, new_status):
+        return
+    # одинаковый порядок блокировок у всех транзакций — без взаимных блокировок
+    for thread_id in sorted({old_thread_id, new_thread_id} - {None}):
+        recount_thread(thread_id)
+
+
+@transaction.atomic
+def rebuild_thread_statistics(thread_ids=None):
+    threads = Thread.objects.all()
+    if thread_ids is not None:
+        threads = threads.filter(pk__in=thread_ids)
+    counts = threads.annotate(**{
+        field: Count('orders', filter=Q(orders__status=status)) for status, field in STATUS_FIELDS.items()
+    }).values('pk', *STATUS_FIELDS.values())
+
+    rows = [ThreadStatistic(thread_id=row.pop('pk'), **row) for row in counts]
+    ThreadStatistic.objects.filter(thread__in=threads).delete()
+    ThreadStatistic.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def _bump_rollup(day, district_id, status, delta):
+    if not status:
+        return
+    rollups = OrderDailyRollup.objects.filter(day=day, district_id=district_id, status=status)
+    if not rollups.update(count=F('count') + delta):
+        region_id = District.objects.filter(pk=district_id).values_list('region_id', flat=True).first()
+        OrderDailyRollup.objects.get_or_create(day=day, district_id=district_id, status=status,
+                                               defaults={'region_id': region_id})
+        rollups.update(count=F('count') + delta)
+
+
+def record_rollup_change(old_district_id, old_status, new_district_id, new_status, created_at):
+    if (old_district_id, old_status) == (new_district_id, new_status) or created_at is None:
+        return
+    day = timezone.localdate(created_at)
+    _bump_rollup(day, old_district_id, old_status, -1)
+    _bump_rollup(day, new_district_id, new_status, 1)
+
+
+def region_rollup_counts(start=None, end=None, statuses=None):
+    """[(region name, orders)] for orders created between start and end (inclusive), from the daily rollups."""
+    rollups = OrderDailyRollup.objects.filter(region__isnull=False)
+    if start:
+        rollups = rollups.filter(day__gte=start)
+    if end:
+        rollups = rollups.filter(day__lte=end)
+    if statuses:
+        rollups = rollups.filter(status__in=statuses)
+    return rollups.values('region_id').annotate(total=Sum('count'))
+
+
+@transaction.atomic
+def rebuild_order_rollups():
+    counts = Order.objects.annotate(day=TruncDate('created_at')) \
+        .values('day', 'district_id', 'district__region_id', 'status') \
+        .annotate(total=Count('pk')).order_by()
+    rows = [OrderDailyRollup(day=row['day'], district_id=row['district_id'], region_id=row['district__region_id'],
+                             status=row['status'], count=row['total']) for row in counts]
+    OrderDailyRollup.objects.all().delete()
+    OrderDailyRollup.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
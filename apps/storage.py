@@ -0,0 +1,62 @@
+import gzip
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE = ('.css', '.js', '.mjs', '.map', '.json', '.svg', '.txt', '.xml', '.html', '.ico', '.ttf', '.otf',
+                '.eot')
+# меньше этого сжатие не окупает лишний заголовок
+MIN_COMPRESS_SIZE = 512
+
+
+def compress(content):
+    yield '.gz', gzip.compress(content, compresslevel=9, mtime=0)
+    if brotli is not None:
+        yield '.br', brotli.compress(content, quality=11)
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """Hashed names plus .gz (and .br when brotli is installed) siblings for text assets."""
+    # битые url() во вложенных css вендоров не должны ронять collectstatic
+    manifest_strict = False
+
+    def post_process(self, paths, dry_run=False, **options):
+        # сжимаем окончательные версии: css после всех проходов замены url()
+        hashed_names = {}
+        for name, hashed_name, processed in super().post_process(paths, dry_run, **options):
+            if isinstance(hashed_name, str):
+                hashed_names[name] = hashed_name
+            yield name, hashed_name, processed
+        if not dry_run:
+            for hashed_name in hashed_names.values():
+                self.compress_file(hashed_name)
+
+    def compress_file(self, name):
+        if not name.endswith(COMPRESSIBLE):
+            return []
+        with self.open(name) as fh:
+            content = fh.read()
+        if len(content) < MIN_COMPRESS_SIZE:
+            return []
+        written = []
+        for extension, compressed in compress(content):
+            if len(compressed) >= len(content):
+                continue
+            target = f'{name}{extension}'
+            if self.exists(target):
+                self.delete(target)
+            self._save(target, ContentFile(compressed))
+            written.append(target)
+        return written
+
+    def hashed_name(self, name, content=None, filename=None):
+        try:
+            return super().hashed_name(name, content, filename)
+        except ValueError:
+            # css вендора ссылается на файл, которого нет в сборке — оставляем ссылку как есть
+            return name
@@ -0,0 +1,19 @@
+from django import template
+from django.utils.html import format_html
+
+from apps.thumbnails import get_thumbnails
+
+register = template.Library()
+
+
+@register.simple_tag
+def srcset(image, sizes='100vw'):
+    """<img {% srcset product.image %}> — src, srcset and sizes attributes with resized variants."""
+    if not image:
+        return ''
+    variants = get_thumbnails(image.name)
+    if len(variants) < 2:
+        return format_html('src="{}"', image.url)
+    storage = image.storage
+    candidates = ', '.join(f'{storage.url(name)} {width}w' for width, name in variants)
+    return format_html('src="{}" srcset="{}" sizes="{}"', storage.url(variants[0][1]), candidates, sizes)
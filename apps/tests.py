@@ -1,3 +1,1058 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+import time
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from PIL import Image
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.files.storage import default_storage
+from django.db import connection, transaction, IntegrityError
+from django.core.management import call_command
+from django.http import HttpResponse
+from django.test import TestCase, RequestFactory, override_settings
+from django.template import Context, Template
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone, translation
+
+from apps.cache import get_wishlist_ids, get_catalogue_version, get_categories, invalidate_districts, \
+    DISTRICTS_VERSION_KEY, get_site_settings, invalidate_site_settings, SITE_SETTINGS_VERSION_KEY
+from apps.catalogue import import_products
+from apps.claims import claim_order, claim_next
+from apps.middleware import StaticFilesMiddleware
+from apps.mixins import KeysetPaginationMixin
+from apps.pricing import order_total, reprice_orders
+from apps.profiling import read_records
+from apps.ratelimit import LocalBackend
+from apps.search import rank_products
+from apps.slugs import assign_slugs
+from apps.thumbnails import get_thumbnails
+from apps.visits import visit_buffer
+from apps.forms import ProfileModelForm, ChangePasswordForm
+from apps.management.commands.explain_hot_queries import Command as ExplainHotQueries
+from apps.leaderboard import rebuild_leaderboard
+from apps.inventory import reserve, expire_reservations, OutOfStock, reconcile as reconcile_stock
+from apps.ledger import debit, refund_withdraw, reconcile, InsufficientFunds
+from apps.models import User, Region, District, Category, Product, SiteSettings, Order, Withdraw, \
+    BalanceTransaction, Thread, ThreadStatistic, WishList, StockReservation, OrderDailyRollup, \
+    SellerScore
+
+
+def make_user(phone, role=User.RoleType.USER, **kwargs):
+    return User.objects.create_user(phone_number=phone, password='secret', role=role, **kwargs)
+
+
+def make_product(category=None, name='Smart watch', quantity=10, price=100_000):
+    if category is None:
+        category = Category(icon='https://alijahon.uz/static/icon.png')
+        category.set_current_language('en')
+        category.name = 'Watches'
+        category.save()
+    product = Product(category=category, price=price, seller_prise=10_000, quantity=quantity, message_id='1',
+                      image='products/download.jpeg')
+    product.set_current_language('en')
+    product.name = name
+    product.description = 'description'
+    product.save()
+    return product
+
+
+# PBKDF2 на каждого тестового пользователя — секунды впустую
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class MarketplaceTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.region = Region.objects.create(name='Toshkent')
+        cls.district = District.objects.create(name='Chilonzor', region=cls.region)
+        SiteSettings.objects.create(delivery_price=20_000, discount_price=0,
+                                    competition_thumbnail='site-settings/IMG_0025.jpeg')
+
+    def setUp(self):
+        # версии каталога, настройки сайта и окна лимитов живут в кэше
+        cache.clear()
+        # копии настроек и карты районов в памяти процесса пережили бы clear(): версии снова начинаются с 1
+        invalidate_site_settings()
+        invalidate_districts()
+        # reverse() вне запроса взял бы LANGUAGE_CODE en-us, а такого префикса в i18n_patterns нет
+        self.enterContext(translation.override('en'))
+
+    def make_order(self, product, **kwargs):
+        return Order.objects.create(**{'product': product, 'fullname': 'Mijoz', 'phone_number': '998901112233',
+                                       'total': 100, 'district': self.district, **kwargs})
+
+    def login(self, user):
+        self.client.force_login(user)
+        return user
+
+
+class CatalogueImportTest(MarketplaceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.category = make_product().category
+        self.import_dir = tempfile.mkdtemp()
+
+    def row(self, **values):
+        return {'slug': 'imported', 'category': self.category.slug, 'price': '1000', 'seller_prise': '100',
+                'quantity': '3', 'name_en': 'Imported', **values}
+
+    def test_rejects_image_paths_outside_import_dir(self):
+        secret = os.path.join(tempfile.mkdtemp(), 'secret.txt')
+        with open(secret, 'w') as fh:
+            fh.write('SECRET_KEY=x')
+        with override_settings(CATALOGUE_IMPORT_DIR=self.import_dir):
+            for image in (secret, '../secret.txt', 'nested/../../secret.txt'):
+                with self.assertRaises(ValueError):
+                    import_products([self.row(image=image)])
+        self.assertFalse(Product.objects.filter(slug='imported').exists())
+
+    def test_bad_number_is_value_error_and_rolls_back_the_file(self):
+        rows = [self.row(slug=f'ok-{i}') for i in range(3)] + [self.row(slug='broken', price='12abc')]
+        with self.assertRaisesMessage(ValueError, "'broken'"):
+            import_products(rows, chunk_size=2)
+        self.assertFalse(Product.objects.filter(slug__startswith='ok-').exists())
+
+    def test_missing_image_is_a_row_error_and_copies_are_removed(self):
+        with open(os.path.join(self.import_dir, 'watch.jpg'), 'wb') as fh:
+            fh.write(b'jpeg')
+        media = tempfile.mkdtemp()
+        rows = [self.row(slug='first', image='watch.jpg'), self.row(slug='second', image='missing.jpg')]
+        with override_settings(CATALOGUE_IMPORT_DIR=self.import_dir, MEDIA_ROOT=media):
+            with self.assertRaisesMessage(ValueError, "'missing.jpg' not found in the import directory for 'second'"):
+                import_products(rows)
+        self.assertFalse(Product.objects.filter(slug='first').exists())
+        self.assertEqual(os.listdir(os.path.join(media, 'products')), [])
+
+    def test_imports_valid_rows(self):
+        created, updated = import_products([self.row()])
+        self.assertEqual((created, updated), (1, 0))
+        self.assertEqual(Product.objects.get(slug='imported').price, Decimal(1000))
+
+
+class OrderClaimTest(MarketplaceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.first = make_user('998900000001', User.RoleType.OPERATOR)
+        self.second = make_user('998900000002', User.RoleType.OPERATOR)
+        self.product = make_product()
+        self.order = self.make_order(self.product)
+
+    def update_url(self, order_id=None):
+        return reverse('order-update', kwargs={'pk': order_id or self.order.pk})
+
+    def test_only_one_operator_holds_the_lease(self):
+        self.assertTrue(claim_order(self.first, self.order.pk))
+        self.assertFalse(claim_order(self.second, self.order.pk))
+        # своё закрепление продлевается
+        self.assertTrue(claim_order(self.first, self.order.pk))
+
+    def test_expired_lease_can_be_taken_over(self):
+        claim_order(self.first, self.order.pk)
+        Order.objects.filter(pk=self.order.pk).update(claimed_until=timezone.now() - timezone.timedelta(seconds=1))
+        self.assertTrue(claim_order(self.second, self.order.pk))
+
+    def test_processed_orders_stay_with_their_operator(self):
+        Order.objects.filter(pk=self.order.pk).update(status=Order.StatusType.DELIVERED, operator=self.first)
+        self.login(self.second)
+        response = self.client.get(self.update_url())
+        self.assertRedirects(response, reverse('operator-orders'), fetch_redirect_response=False)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.operator, self.first)
+        self.assertIsNone(self.order.claimed_until)
+        self.assertTrue(claim_order(self.first, self.order.pk))
+
+    def test_claim_next_batches_do_not_overlap(self):
+        for _ in range(5):
+            self.make_order(self.product)
+        first, second = claim_next(self.first, 4), claim_next(self.second, 4)
+        self.assertEqual(len(first), 4)
+        self.assertEqual(len(second), 2)
+        self.assertFalse(set(first) & set(second))
+
+    def test_post_is_refused_under_another_operators_lease(self):
+        claim_order(self.first, self.order.pk)
+        self.login(self.second)
+        response = self.client.post(self.update_url(), {'status': Order.StatusType.CANCELED})
+        self.assertRedirects(response, reverse('operator-orders'), fetch_redirect_response=False)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, Order.StatusType.NEW)
+        self.assertEqual(self.order.operator, self.first)
+
+    def test_non_operators_cannot_open_or_claim_orders(self):
+        for role in (User.RoleType.USER, User.RoleType.DELIVER):
+            self.login(make_user(f'99890000010{len(role)}', role))
+            self.assertEqual(self.client.get(self.update_url()).status_code, 403)
+            self.assertEqual(self.client.post(reverse('order-claim')).status_code, 403)
+        self.order.refresh_from_db()
+        self.assertIsNone(self.order.operator)
+
+    def test_missing_order_is_404(self):
+        self.login(self.first)
+        self.assertEqual(self.client.get(self.update_url(self.order.pk + 100)).status_code, 404)
+
+    def test_claim_count_is_clamped(self):
+        self.login(self.first)
+        response = self.client.post(reverse('order-claim'), {'count': '-5'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['claimed'], [self.order.pk])
+
+
+class LedgerTest(MarketplaceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.seller = make_user('998900000001', balance=1000)
+        BalanceTransaction.objects.create(user=self.seller, amount=1000, balance_after=1000,
+                                          kind=BalanceTransaction.Kind.OPENING)
+
+    def balance(self):
+        return User.objects.values_list('balance', flat=True).get(pk=self.seller.pk)
+
+    def test_debit_never_overdraws(self):
+        debit(self.seller.pk, 700, BalanceTransaction.Kind.WITHDRAW)
+        # второе списание видит уже уменьшенный остаток в условии UPDATE
+        with self.assertRaises(InsufficientFunds):
+            debit(self.seller.pk, 700, BalanceTransaction.Kind.WITHDRAW)
+        self.assertEqual(self.balance(), 300)
+        self.assertEqual(reconcile(), [])
+
+    def test_refund_is_applied_once(self):
+        withdraw = Withdraw.objects.create(user=self.seller, amount=400, card_number='8600')
+        debit(self.seller.pk, 400, BalanceTransaction.Kind.WITHDRAW, withdraw=withdraw)
+        refund_withdraw(withdraw)
+        refund_withdraw(withdraw)
+        self.assertEqual(self.balance(), 1000)
+        self.assertEqual(reconcile(), [])
+
+    def test_profile_and_password_saves_keep_the_ledger_balance(self):
+        stale = User.objects.get(pk=self.seller.pk)
+        debit(self.seller.pk, 600, BalanceTransaction.Kind.WITHDRAW)
+
+        form = ProfileModelForm({'first_name': 'Ali', 'district': self.district.pk}, instance=stale)
+        self.assertTrue(form.is_valid(), form.errors)
+        form.save()
+        form = ChangePasswordForm({'old_password': 'secret', 'new_password': 'n3w', 'confirm_password': 'n3w'})
+        self.assertTrue(form.is_valid(), form.errors)
+        form.update(stale)
+
+        self.seller.refresh_from_db()
+        self.assertEqual(self.seller.balance, 400)
+        self.assertEqual(self.seller.first_name, 'Ali')
+        self.assertTrue(self.seller.check_password('n3w'))
+
+
+class KeysetPaginationTest(MarketplaceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.login(make_user('998900000001', User.RoleType.OPERATOR))
+        product = make_product()
+        # 30 заказов внутри одной миллисекунды: курсор обязан помнить микросекунды
+        base = timezone.now().replace(microsecond=100_000)
+        self.order_ids = []
+        for i in range(30):
+            order = self.make_order(product)
+            Order.objects.filter(pk=order.pk).update(created_at=base + timezone.timedelta(microseconds=30 - i))
+            self.order_ids.append(order.pk)
+
+    def collect(self, url):
+        seen = []
+        # потерянные микросекунды зацикливали бы возрастающий список — ограничиваем число страниц
+        for _page in range(5):
+            if not url:
+                break
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            seen += [item['id'] for item in data['results']]
+            url = reverse('operator-orders') + data['next'] if data['next'] else None
+        return seen
+
+    def test_pages_cover_every_row_once(self):
+        seen = self.collect(reverse('operator-orders') + '?format=json')
+        self.assertEqual(sorted(seen), sorted(self.order_ids))
+        self.assertEqual(len(seen), len(set(seen)))
+
+    def test_json_pages_with_an_imageless_product(self):
+        product = make_product()
+        Product.objects.filter(pk=product.pk).update(image='')
+        user = self.login(make_user('998900000014'))
+        WishList.objects.create(user=user, product=product)
+        for name in ('home', 'product-list', 'market-list', 'wish-list'):
+            response = self.client.get(reverse(name), {'format': 'json'})
+            self.assertEqual(response.status_code, 200, name)
+            item = response.json()['results'][0]
+            self.assertIsNone(item.get('image.url', item.get('product.image.url')), name)
+
+    def test_malformed_cursor_is_404(self):
+        url = reverse('operator-orders') + '?format=json&cursor='
+        for values in (['not a date', 1], [timezone.now().isoformat(), 'abc'], [None, 1], [1]):
+            cursor = KeysetPaginationMixin.encode_cursor(values)
+            self.assertEqual(self.client.get(url + cursor).status_code, 404, values)
+        self.assertEqual(self.client.get(url + '%%%').status_code, 404)
+
+
+class PerformanceMiddlewareTest(MarketplaceTestCase):
+    def setUp(self):
+        super().setUp()
+        make_product()
+        self.log_path = os.path.join(tempfile.mkdtemp(), 'perf.jsonl')
+        self.enterContext(override_settings(PERF_ENABLED=True, PERF_SAMPLE_RATE=1, PERF_LOG_PATH=self.log_path,
+                                            PERF_LOG_MAX_BYTES=1024, DEBUG=False))
+        self.staff = make_user('998900000001', is_staff=True)
+
+    def test_server_timing_only_for_staff(self):
+        self.assertNotIn('Server-Timing', self.client.get(reverse('home')).headers)
+        self.login(self.staff)
+        self.assertIn('queries', self.client.get(reverse('home')).headers['Server-Timing'])
+
+    def test_log_is_rotated(self):
+        for _ in range(20):
+            self.client.get(reverse('home'))
+        self.assertLessEqual(os.path.getsize(self.log_path), 1024 + 512)
+        self.assertTrue(os.path.exists(f'{self.log_path}.1'))
+        # сводка читает и предыдущий файл
+        self.assertGreater(len(list(read_records(self.log_path))), sum(1 for _ in open(self.log_path)))
+
+    async def test_async_stack(self):
+        await self.async_client.aforce_login(self.staff)
+        response = await self.async_client.get(reverse('home'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Server-Timing', response.headers)
+        self.assertTrue(os.path.exists(self.log_path))
+
+
+@override_settings(QUERY_BUDGET_ENFORCE=True)
+class QueryBudgetTest(MarketplaceTestCase):
+    # по несколько строк на страницу: N+1 вышел бы за бюджет RenderProfileMixin
+    def setUp(self):
+        super().setUp()
+        self.seller = make_user('998900000002')
+        self.operator = make_user('998900000003', role=User.RoleType.OPERATOR)
+        category = make_product().category
+        for i in range(3):
+            product = make_product(category, name=f'Smart watch {i}')
+            thread = Thread.objects.create(owner=self.seller, product=product, discount=0, name=f'Thread {i}')
+            self.make_order(product, customer=self.seller, thread=thread)
+            WishList.objects.create(user=self.seller, product=product)
+
+    def assertWithinBudget(self, user, name, *queries):
+        self.login(user)
+        for query in ('', *queries):
+            response = self.client.get(reverse(name) + query)
+            self.assertEqual(response.status_code, 200, f'{name}{query}')
+
+    def test_seller_pages(self):
+        self.assertWithinBudget(self.seller, 'home', '?format=json')
+        self.assertWithinBudget(self.seller, 'product-list', f'?category_slug={Category.objects.first().slug}')
+        self.assertWithinBudget(self.seller, 'search', '?search=smart')
+        self.assertWithinBudget(self.seller, 'order-list')
+        self.assertWithinBudget(self.seller, 'wish-list')
+        self.assertWithinBudget(self.seller, 'market-list', '?category_slug=top')
+        self.assertWithinBudget(self.seller, 'thread-statistic')
+
+    def test_operator_pages(self):
+        self.assertWithinBudget(self.operator, 'operator-orders', '?status=new', '?format=json')
+
+
+class SeedMarketplaceTest(MarketplaceTestCase):
+    def test_append_reuses_the_geography(self):
+        options = {'users': 20, 'categories': 1, 'products': 2, 'threads': 2, 'orders': 5, 'wishlists': 1,
+                   'districts_per_region': 2, 'stdout': StringIO()}
+        call_command('seed_marketplace', **options)
+        regions, districts = Region.objects.count(), District.objects.count()
+        call_command('seed_marketplace', append=True, **options)
+        self.assertEqual((Region.objects.count(), District.objects.count()), (regions, districts))
+        self.assertEqual(Region.objects.filter(name='Toshkent').count(), 1)
+        self.assertEqual(Product.objects.count(), 4)
+
+
+@override_settings(SESSION_ENGINE='django.contrib.sessions.backends.cached_db')
+class PurgeSessionsTest(MarketplaceTestCase):
+    def setUp(self):
+        super().setUp()
+        now = timezone.now()
+        Session.objects.bulk_create(
+            [Session(session_key=f'expired{i}', session_data='', expire_date=now - timedelta(days=1)) for i in range(7)]
+            + [Session(session_key=f'live{i}', session_data='', expire_date=now + timedelta(days=1)) for i in range(2)])
+
+    def purge(self, **options):
+        output = StringIO()
+        call_command('purge_sessions', stdout=output, **options)
+        return output.getvalue()
+
+    def test_expired_rows_are_deleted_in_batches(self):
+        with CaptureQueriesContext(connection) as queries:
+            output = self.purge(batch_size=3)
+        deletes = [query['sql'] for query in queries.captured_queries if query['sql'].startswith('DELETE')]
+        self.assertEqual(len(deletes), 3)
+        self.assertIn('Deleted 7 expired sessions', output)
+        self.assertEqual(sorted(Session.objects.values_list('session_key', flat=True)), ['live0', 'live1'])
+
+    def test_cache_sessions_leave_the_table_alone(self):
+        with override_settings(SESSION_ENGINE='django.contrib.sessions.backends.cache'):
+            self.assertIn('nothing to purge', self.purge())
+        self.assertEqual(Session.objects.count(), 9)
+
+
+class BenchViewsTest(MarketplaceTestCase):
+    def setUp(self):
+        super().setUp()
+        seller = make_user('998900000004')
+        self.operator = make_user('998900000005', role=User.RoleType.OPERATOR)
+        product = make_product()
+        self.thread = Thread.objects.create(owner=seller, product=product, discount=0, name='Thread')
+        self.order = self.make_order(product, thread=self.thread)
+
+    def bench(self, **options):
+        output = StringIO()
+        call_command('bench_views', repeat=1, warmup=0, stdout=output, stderr=StringIO(), **options)
+        return output.getvalue()
+
+    def test_runs_every_page_without_changing_data(self):
+        path = os.path.join(tempfile.mkdtemp(), 'bench.json')
+        self.bench(output=path)
+        with open(path, encoding='utf-8') as fh:
+            results = json.load(fh)['results']
+        self.assertIn('home', results)
+        self.assertIn('operator-orders', results)
+        self.assertEqual({row['status'] for row in results.values()}, {200})
+        self.assertFalse({'thread', 'order-update', 'order-claim'} & {key.split('?')[0] for key in results})
+
+        self.order.refresh_from_db()
+        self.assertEqual(visit_buffer.pending(self.thread.pk), 0)
+        self.assertIsNone(self.order.operator)
+
+        self.assertIn('base ms', self.bench(compare=path, only=['home']))
+
+
+def write_files(root, files):
+    for name, content in files.items():
+        path = os.path.join(root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as fh:
+            fh.write(content)
+
+
+class StaticFilesTest(MarketplaceTestCase):
+    def setUp(self):
+        super().setUp()
+        root = tempfile.mkdtemp()
+        write_files(root, {
+            'css/app.1a2b3c.css': b'body{}', 'css/app.1a2b3c.css.gz': b'gz', 'css/app.1a2b3c.css.br': b'br',
+            'robots.txt': b'User-agent: *',
+            'staticfiles.json': json.dumps({'paths': {'css/app.css': 'css/app.1a2b3c.css'}, 'version': '1.1'})
+            .encode(),
+        })
+        self.enterContext(override_settings(SERVE_STATIC=True, STATIC_ROOT=root, STATIC_URL='/static/'))
+        self.middleware = StaticFilesMiddleware(lambda request: HttpResponse('view'))
+
+    def get(self, path, **headers):
+        return self.middleware(RequestFactory().get(path, headers=headers))
+
+    def test_disabled_without_serve_static(self):
+        with override_settings(SERVE_STATIC=False), self.assertRaises(MiddlewareNotUsed):
+            StaticFilesMiddleware(lambda request: HttpResponse())
+
+    def test_encoding_negotiation(self):
+        for accept, encoding, body in (('gzip, br', 'br', b'br'), ('br;q=0, gzip', 'gzip', b'gz'),
+                                       ('', None, b'body{}'), ('deflate', None, b'body{}')):
+            response = self.get('/static/css/app.1a2b3c.css', accept_encoding=accept)
+            self.assertEqual(response.headers.get('Content-Encoding'), encoding, accept)
+            self.assertEqual(b''.join(response.streaming_content), body)
+            self.assertEqual(response.headers['Content-Type'], 'text/css')
+            self.assertEqual(response.headers['Vary'], 'Accept-Encoding')
+
+    def test_cache_headers_and_not_modified(self):
+        response = self.get('/static/css/app.1a2b3c.css', accept_encoding='gzip')
+        self.assertEqual(response.headers['Cache-Control'], f'public, max-age={settings.STATIC_MAX_AGE}, immutable')
+        not_modified = self.get('/static/css/app.1a2b3c.css', accept_encoding='gzip',
+                                if_none_match=response.headers['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.headers['ETag'], response.headers['ETag'])
+        # ETag другого сжатия не совпадает
+        self.assertEqual(self.get('/static/css/app.1a2b3c.css', if_none_match=response.headers['ETag'])
+                         .status_code, 200)
+        self.assertEqual(self.get('/static/robots.txt', if_modified_since=response.headers['Last-Modified'])
+                         .status_code, 304)
+
+        response = self.get('/static/robots.txt')
+        self.assertEqual(response.headers['Cache-Control'], 'public, max-age=60')
+        self.assertNotIn('Vary', response.headers)
+        # сжатые копии и неизвестные пути отдаёт дальше по цепочке
+        for path in ('/static/css/app.1a2b3c.css.gz', '/static/missing.css', '/en/'):
+            self.assertEqual(self.get(path).content, b'view', path)
+
+
+class PruneStaticTest(MarketplaceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.base = tempfile.mkdtemp()
+        self.source = os.path.join(self.base, 'assets')
+        write_files(os.path.join(self.base, 'templates'), {
+            'page.html': b"{% load static %}<link href=\"{% static 'css/site.css' %}\">"
+                         b"<script src=\"/static/js/app.js\"><script src=\"{% static 'vendors/swiper/swiper.min.js' %}\">",
+        })
+        write_files(self.source, {
+            'css/site.css': b"@import 'base.css'; body{background:url('../img/bg.png')}",
+            'css/base.css': b'', 'img/bg.png': b'png',
+            'js/app.js': b'fetch("../data/items.json")', 'data/items.json': b'[]',
+            'vendors/swiper/swiper.min.js': b'', 'vendors/swiper/swiper.css': b'',
+            'img/unused.png': b'png', 'old/legacy.js': b'',
+        })
+        templates = [{**settings.TEMPLATES[0], 'DIRS': [os.path.join(self.base, 'templates')]}]
+        self.enterContext(override_settings(BASE_DIR=self.base, STATICFILES_DIRS=[self.source], TEMPLATES=templates))
+
+    def prune(self, *args, **options):
+        output = StringIO()
+        call_command('prune_static', *args, stdout=output, **options)
+        return output.getvalue()
+
+    def test_lists_only_unreferenced_files(self):
+        output = self.prune(verbosity=2)
+        listed = [line.split()[-1] for line in output.splitlines() if line.startswith(' ')]
+        self.assertEqual(listed, ['img/unused.png', 'old/legacy.js'])
+        self.assertIn('Would delete 2 of 9 files', output)
+
+    def test_delete_respects_keep(self):
+        self.prune('--delete', '--keep', 'old/')
+        self.assertFalse(os.path.exists(os.path.join(self.source, 'img/unused.png')))
+        self.assertTrue(os.path.exists(os.path.join(self.source, 'old/legacy.js')))
+        self.assertTrue(os.path.exists(os.path.join(self.source, 'vendors/swiper/swiper.css')))
+
+
+class ExplainHotQueriesTest(MarketplaceTestCase):
+    def test_every_view_is_explained(self):
+        operator = make_user('998900000007', role=User.RoleType.OPERATOR)
+        self.make_order(make_product())
+        output = StringIO()
+        call_command('explain_hot_queries', user=operator.phone_number, verbose_plans=True, stdout=output)
+        results = dict(line.split(': ', 1) for line in output.getvalue().splitlines() if ': ' in line)
+        for name, _view, _params in ExplainHotQueries().get_cases():
+            self.assertTrue(results[name] == 'ok' or results[name].startswith('sequential scan'), name)
+
+    def test_sequential_scans_are_found_in_both_plan_formats(self):
+        command = ExplainHotQueries()
+        with mock.patch.object(connection, 'vendor', 'postgresql'):
+            self.assertEqual(command.sequential_scans(
+                'Limit\n  ->  Seq Scan on apps_order\n  ->  Seq Scan on apps_region'), ['apps_order'])
+        with mock.patch.object(connection, 'vendor', 'sqlite'):
+            self.assertEqual(command.sequential_scans(
+                'SCAN apps_product\nSEARCH apps_thread USING INDEX x\nSCAN apps_wishlist USING INDEX y'),
+                ['apps_product'])
+
+
+@override_settings(RATELIMIT_ENABLED=False)
+class OrderDedupeTest(MarketplaceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.login(make_user('998900000006'))
+        self.product = make_product()
+
+    def post_order(self, product=None, key='form-1', **extra):
+        product = product or self.product
+        return self.client.post(reverse('product-detail', kwargs={'slug': product.slug}), {
+            'fullname': 'Mijoz', 'phone_number': '+998 90 111 22 33', 'product': product.pk,
+            'idempotency_key': key, **extra})
+
+    def test_same_form_posted_twice_places_one_order(self):
+        self.post_order()
+        response = self.post_order()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertNotContains(response, 'Yana buyurtma berish')
+
+    def test_key_is_scoped_to_the_product(self):
+        self.post_order()
+        other = make_product(self.product.category, name='Phone')
+        self.post_order(other)
+        self.assertEqual(Order.objects.filter(product=other).count(), 1)
+        self.assertIsNone(Order.objects.get(product=other).idempotency_key)
+
+    def test_same_buyer_is_asked_before_a_second_order(self):
+        self.post_order()
+        response = self.post_order(key='form-2')
+        self.assertContains(response, 'Yana buyurtma berish')
+        self.assertEqual(Order.objects.count(), 1)
+
+        self.post_order(key='form-2', repeat='1')
+        self.post_order(key='form-2', repeat='1')
+        self.assertEqual(Order.objects.count(), 2)
+
+
+class RateLimitTest(MarketplaceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.product = make_product()
+
+    def post_order(self, key, product=None, **extra):
+        return self.client.post(reverse('product-detail', kwargs={'slug': self.product.slug}), {
+            'fullname': 'Mijoz', 'phone_number': '998901112233', 'product': (product or self.product).pk,
+            'idempotency_key': key, **extra})
+
+    @override_settings(RATELIMITS={'order': [('phone', '2/10m')]})
+    def test_order_limit_by_phone(self):
+        self.login(make_user('998900000007'))
+        self.post_order('form-1')
+        self.post_order('form-2')
+        response = self.post_order('form-3')
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response.headers)
+
+    @override_settings(RATELIMITS={'order': [('phone', '1/10m')]})
+    def test_retries_of_a_placed_order_get_the_receipt(self):
+        self.login(make_user('998900000008'))
+        for _ in range(3):
+            self.assertEqual(self.post_order('form-1').status_code, 200)
+        self.assertEqual(Order.objects.count(), 1)
+
+    @override_settings(RATELIMITS={'order': [('phone', '1/10m')]})
+    def test_reused_key_with_another_product_is_counted(self):
+        self.login(make_user('998900000013'))
+        other = make_product(self.product.category, name='Phone')
+        self.post_order('form-1')
+        codes = [self.post_order('form-1', other, repeat='1').status_code for _ in range(2)]
+        self.assertEqual(codes, [429, 429])
+        self.assertEqual(Order.objects.count(), 1)
+
+    @override_settings(RATELIMITS={'claim': [('user', '2/m')]})
+    def test_claims_are_limited_per_operator(self):
+        self.login(make_user('998900000009', role=User.RoleType.OPERATOR))
+        codes = [self.client.post(reverse('order-claim')).status_code for _ in range(3)]
+        self.assertEqual(codes, [200, 200, 429])
+
+    def test_local_backend_forgets_idle_clients(self):
+        backend = LocalBackend()
+        self.assertIsNone(backend.hit('a', 1, 10))
+        self.assertIsNotNone(backend.hit('a', 1, 10))
+        backend.sweep(time.monotonic() + 11)
+        self.assertEqual(len(backend._hits), 0)
+        self.assertIsNone(backend.hit('a', 1, 10))
+
+
+class StockReservationTest(MarketplaceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.product = make_product(quantity=2)
+
+    def stock(self):
+        self.product.refresh_from_db()
+        return self.product.quantity
+
+    def reserved_order(self, **kwargs):
+        order = self.make_order(self.product, **kwargs)
+        reserve(order)
+        return order
+
+    def test_never_oversells(self):
+        self.reserved_order(quantity=2)
+        with self.assertRaises(OutOfStock):
+            self.reserved_order()
+        self.assertEqual(self.stock(), 0)
+
+    def test_sold_out_product_shows_form_error(self):
+        self.reserved_order(quantity=2)
+        self.login(make_user('998900000010'))
+        response = self.client.post(reverse('product-detail', kwargs={'slug': self.product.slug}), {
+            'fullname': 'Mijoz', 'phone_number': '998907776655', 'product': self.product.pk,
+            'idempotency_key': 'form-1'})
+        self.assertContains(response, 'out of stock')
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_cancel_and_delete_return_stock(self):
+        canceled = self.reserved_order()
+        deleted = self.reserved_order()
+        self.assertEqual(self.stock(), 0)
+        canceled.status = Order.StatusType.CANCELED
+        canceled.save()
+        self.assertEqual(self.stock(), 1)
+        deleted.delete()
+        self.assertEqual(self.stock(), 2)
+
+    def test_unconfirmed_orders_expire(self):
+        order = self.reserved_order()
+        StockReservation.objects.filter(order=order).update(expires_at=timezone.now() - timedelta(minutes=1))
+        self.assertEqual(expire_reservations(), 1)
+        self.assertEqual(self.stock(), 2)
+        self.assertEqual(reconcile_stock(), ([], []))
+
+    def test_reconcile_repairs_drift(self):
+        order = self.reserved_order()
+        order.status = Order.StatusType.READY_TO_DELIVERY
+        order.save()
+        StockReservation.objects.filter(order=order).update(quantity=0)
+        mismatches, failed = reconcile_stock(fix=True)
+        self.assertEqual(mismatches, [(order.pk, self.product.pk, 0, 1)])
+        self.assertEqual(failed, [])
+        self.assertEqual(StockReservation.objects.get(order=order).quantity, 1)
+        self.assertEqual(self.stock(), 0)
+        self.assertEqual(reconcile_stock(), ([], []))
+
+
+class SlugTest(MarketplaceTestCase):
+    def test_suffix_follows_the_highest_taken(self):
+        first = make_product()
+        category = first.category
+        self.assertEqual([first.slug, make_product(category).slug], ['smart-watch', 'smart-watch-1'])
+        Product.objects.filter(pk=first.pk).update(slug='smart-watch-9')
+        Product.objects.filter(pk=make_product(category).pk).update(slug='smart-watch-10')
+        self.assertEqual(make_product(category).slug, 'smart-watch')
+        self.assertEqual(make_product(category).slug, 'smart-watch-11')
+
+    def test_bulk_assignment_looks_up_suffixes_only_when_needed(self):
+        category = make_product().category
+        products = []
+        # запрос занятых баз плюс по одному хвосту для smart-watch и второго phone; tablet бесплатен
+        for name in ('Smart watch', 'Smart watch', 'Phone', 'Phone', 'Tablet'):
+            product = Product(category=category)
+            product.set_current_language('en')
+            product.name = name
+            products.append(product)
+        with self.assertNumQueries(3):
+            assign_slugs(Product, products)
+        self.assertEqual([product.slug for product in products],
+                         ['smart-watch-1', 'smart-watch-2', 'phone', 'phone-1', 'tablet'])
+
+    def test_cyrillic_names_are_transliterated(self):
+        self.assertEqual(make_product(name='Ақлли соат').slug, 'aqlli-soat')
+        self.assertEqual(make_product(name='Умные часы').slug, 'umnie-chasi')
+
+
+class ThumbnailTest(MarketplaceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.enterContext(override_settings(MEDIA_ROOT=tempfile.mkdtemp(), THUMBNAIL_WIDTHS=(480, 240, 960)))
+        os.makedirs(os.path.join(default_storage.location, 'products'))
+        Image.new('RGB', (600, 300), 'red').save(default_storage.path('products/watch.jpg'))
+
+    def test_variants_are_never_wider_than_the_original(self):
+        variants = get_thumbnails('products/watch.jpg')
+        self.assertEqual([width for width, _name in variants], [240, 480, 600])
+        self.assertEqual(variants[-1][1], 'products/watch.jpg')
+        for width, name in variants[:-1]:
+            with Image.open(default_storage.path(name)) as image:
+                self.assertEqual(image.size, (width, width // 2))
+
+    def test_variants_are_cached_and_broken_files_fall_back(self):
+        get_thumbnails('products/watch.jpg')
+        with mock.patch('apps.thumbnails.generate_thumbnails') as generate:
+            get_thumbnails('products/watch.jpg')
+        generate.assert_not_called()
+        self.assertEqual(get_thumbnails('products/missing.jpg'), [])
+
+    def test_srcset_tag(self):
+        product = make_product()
+        template = Template('{% load thumbnails %}<img {% srcset product.image "50vw" %}>')
+        product.image = 'products/watch.jpg'
+        html = template.render(Context({'product': product}))
+        self.assertIn('240w, ', html)
+        self.assertIn('/media/products/watch.jpg 600w', html)
+        self.assertIn('sizes="50vw"', html)
+        # без вариантов — обычный src
+        product.image = 'products/missing.jpg'
+        self.assertEqual(template.render(Context({'product': product})), '<img src="/media/products/missing.jpg">')
+
+
+class SiteSettingsCacheTest(MarketplaceTestCase):
+    def test_settings_are_read_once(self):
+        site = get_site_settings()
+        with self.assertNumQueries(0):
+            self.assertEqual(get_site_settings(), site)
+
+    def test_save_and_delete_reset_the_copy(self):
+        site = get_site_settings()
+        site.delivery_price = 30_000
+        site.save()
+        self.assertEqual(get_site_settings().delivery_price, 30_000)
+        site.delete()
+        self.assertIsNone(get_site_settings())
+
+    def test_other_workers_are_reset_by_the_version(self):
+        get_site_settings()
+        # update() без сигналов, как в другом процессе: копия живёт до смены версии
+        SiteSettings.objects.update(delivery_price=30_000)
+        self.assertEqual(get_site_settings().delivery_price, 20_000)
+        cache.incr(SITE_SETTINGS_VERSION_KEY)
+        self.assertEqual(get_site_settings().delivery_price, 30_000)
+
+    def test_copy_expires_after_the_ttl(self):
+        with override_settings(SITE_SETTINGS_TTL=0):
+            get_site_settings()
+            SiteSettings.objects.update(delivery_price=30_000)
+            self.assertEqual(get_site_settings().delivery_price, 30_000)
+
+
+class CatalogueCacheTest(MarketplaceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.product = make_product()
+
+    def rename(self, obj, name):
+        with self.captureOnCommitCallbacks(execute=True):
+            obj.name = name
+            obj.save()
+
+    def test_catalogue_changes_bump_the_version(self):
+        version = get_catalogue_version()
+        self.rename(self.product, 'Phone')
+        self.assertGreater(get_catalogue_version(), version)
+        version = get_catalogue_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.category.delete()
+        self.assertGreater(get_catalogue_version(), version)
+
+    def test_category_list_is_cached_until_renamed(self):
+        self.assertEqual([category.name for category in get_categories()], ['Watches'])
+        with self.assertNumQueries(0):
+            get_categories()
+        self.rename(self.product.category, 'Clocks')
+        self.assertEqual([category.name for category in get_categories()], ['Clocks'])
+
+    def test_product_cards_follow_the_version(self):
+        self.assertContains(self.client.get(reverse('home')), 'Smart watch')
+        # update() обходит сигналы — карточка остаётся в кэше
+        Product._parler_meta.root_model.objects.filter(master=self.product).update(name='Phone')
+        self.assertNotContains(self.client.get(reverse('home')), 'Phone')
+        self.rename(self.product, 'Phone')
+        self.assertContains(self.client.get(reverse('home')), 'Phone')
+
+
+class DistrictMapTest(MarketplaceTestCase):
+    async def districts(self, region_id):
+        response = await self.async_client.get(reverse('district_list'), {'region_id': region_id})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    async def test_district_view(self):
+        self.assertEqual(await self.districts(self.region.pk), [{'id': self.district.pk, 'name': 'Chilonzor'}])
+        self.assertEqual(await self.districts(self.region.pk + 100), [])
+        self.assertEqual(await self.districts('abc'), [])
+
+    async def test_map_is_reloaded_when_the_version_changes(self):
+        await self.districts(self.region.pk)
+        await District.objects.filter(pk=self.district.pk).aupdate(name='Yunusobod')
+        self.assertEqual((await self.districts(self.region.pk))[0]['name'], 'Chilonzor')
+        # другой воркер сохранил район
+        await cache.aincr(DISTRICTS_VERSION_KEY)
+        self.assertEqual((await self.districts(self.region.pk))[0]['name'], 'Yunusobod')
+
+    def test_saving_a_district_resets_the_map(self):
+        url = reverse('district_list') + f'?region_id={self.region.pk}'
+        self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            District.objects.create(name='Yunusobod', region=self.region)
+        self.assertEqual([row['name'] for row in self.client.get(url).json()], ['Chilonzor', 'Yunusobod'])
+
+
+class SearchTest(MarketplaceTestCase):
+    def translate(self, product, language_code, name, description='description'):
+        product.set_current_language(language_code)
+        product.name = name
+        product.description = description
+        product.save()
+
+    def test_rank_uses_the_best_language_not_the_sum(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            bilingual = make_product(name='Smart watch')
+            self.translate(bilingual, 'uz', 'Watch soat')
+            exact = make_product(bilingual.category)
+            self.translate(exact, 'en', 'Watch', 'watch strap')
+        self.assertEqual(rank_products('watch', 'uz'), [exact.pk, bilingual.pk])
+
+    def test_results_are_capped_by_setting(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            category = make_product().category
+            make_product(category)
+        self.assertEqual(len(rank_products('watch', 'en')), 2)
+        with override_settings(SEARCH_RESULT_LIMIT=1):
+            self.assertEqual(len(rank_products('watch', 'en')), 1)
+
+    def test_product_and_translations_reindex_once_per_commit(self):
+        product = make_product()
+        with mock.patch('apps.signals.index_product') as index_product:
+            with self.captureOnCommitCallbacks(execute=True):
+                product.price = 90_000
+                product.name = 'Smart watch 2'
+                product.save()
+                self.translate(product, 'uz', 'Aqlli soat')
+        index_product.assert_called_once_with(product.pk)
+
+        with mock.patch('apps.signals.index_product') as index_product:
+            with self.captureOnCommitCallbacks(execute=True):
+                product.price = 80_000
+                product.save()
+        index_product.assert_called_once_with(product.pk)
+
+
+class ThreadStatisticTest(MarketplaceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.thread = Thread.objects.create(owner=make_user('998900000011'), product=make_product(), discount=0,
+                                            name='Thread')
+
+    def counts(self, thread=None):
+        statistic = ThreadStatistic.objects.get(thread=thread or self.thread)
+        return {field: getattr(statistic, field) for field in ('new_count', 'ready_count', 'canceled_count')}
+
+    def test_concurrent_edits_do_not_drift(self):
+        order = self.make_order(self.thread.product, thread=self.thread)
+        first, second = Order.objects.get(pk=order.pk), Order.objects.get(pk=order.pk)
+        first.status = Order.StatusType.READY_TO_DELIVERY
+        first.save()
+        second.status = Order.StatusType.CANCELED
+        second.save()
+        self.assertEqual(self.counts(), {'new_count': 0, 'ready_count': 0, 'canceled_count': 1})
+
+    def test_moving_and_deleting_orders(self):
+        other = Thread.objects.create(owner=self.thread.owner, product=self.thread.product, discount=0, name='Other')
+        order = self.make_order(self.thread.product, thread=self.thread)
+        self.make_order(self.thread.product, thread=self.thread)
+        order.thread = other
+        order.save()
+        self.assertEqual(self.counts()['new_count'], 1)
+        self.assertEqual(self.counts(other)['new_count'], 1)
+        order.delete()
+        self.assertEqual(self.counts(other)['new_count'], 0)
+
+        self.thread.delete()
+        self.assertFalse(ThreadStatistic.objects.filter(thread_id=self.thread.pk).exists())
+        self.assertEqual(self.counts(other)['new_count'], 0)
+
+
+class WishListToggleTest(MarketplaceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.login(make_user('998900000012'))
+        self.product = make_product()
+        self.url = reverse('wishlist', kwargs={'pk': self.product.pk})
+
+    def wishlist_queries(self):
+        with CaptureQueriesContext(connection) as captured:
+            self.client.get(self.url)
+        return [query['sql'].split()[0] for query in captured.captured_queries if 'apps_wishlist' in query['sql']]
+
+    def test_toggle_is_one_statement_and_resets_the_cache(self):
+        self.assertEqual(get_wishlist_ids(self.user.pk), frozenset())
+        self.assertEqual(self.wishlist_queries(), ['DELETE', 'INSERT'])
+        self.assertEqual(get_wishlist_ids(self.user.pk), {self.product.pk})
+        self.assertEqual(self.wishlist_queries(), ['DELETE'])
+        self.assertEqual(get_wishlist_ids(self.user.pk), frozenset())
+
+
+class OrderRollupTest(MarketplaceTestCase):
+    def test_orders_without_district_share_one_row(self):
+        product = make_product()
+        for _ in range(2):
+            Order.objects.create(product=product, fullname='Mijoz', phone_number='998901112233', total=100)
+        rollup = OrderDailyRollup.objects.get(district__isnull=True)
+        self.assertEqual(rollup.count, 2)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            OrderDailyRollup.objects.create(day=rollup.day, status=rollup.status, count=1)
+
+
+class SellerScoreTest(MarketplaceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.today = timezone.localdate()
+        self.site = SiteSettings.objects.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.site.competition_start = self.today - timedelta(days=10)
+            self.site.competition_end = self.today
+            self.site.save()
+        self.seller, self.other = make_user('998900000001'), make_user('998900000002')
+        product = make_product()
+        self.thread = Thread.objects.create(owner=self.seller, product=product, discount=0, name='Thread')
+        self.order = self.make_order(product, thread=self.thread)
+
+    def scores(self):
+        return dict(SellerScore.objects.filter(delivered_count__gt=0).values_list('seller_id', 'delivered_count'))
+
+    def change(self, **fields):
+        for name, value in fields.items():
+            setattr(self.order, name, value)
+        self.order.save()
+
+    def assertScores(self, expected):
+        self.assertEqual(self.scores(), expected)
+        # счётчики по сигналам совпадают с полным пересчётом
+        rebuild_leaderboard()
+        self.assertEqual(self.scores(), expected)
+
+    def test_entering_and_leaving_the_window(self):
+        self.change(status=Order.StatusType.DELIVERED, delivered_date=self.today - timedelta(days=20))
+        self.assertScores({})
+        self.change(delivered_date=self.today)
+        self.assertScores({self.seller.pk: 1})
+        self.change(delivered_date=self.today + timedelta(days=1))
+        self.assertScores({})
+        self.change(delivered_date=self.today - timedelta(days=1))
+        self.change(thread=Thread.objects.create(owner=self.other, product=self.order.product, discount=0, name='T'))
+        self.assertScores({self.other.pk: 1})
+        self.change(status=Order.StatusType.CANCELED)
+        self.assertScores({})
+        self.change(status=Order.StatusType.DELIVERED)
+        self.order.delete()
+        self.assertScores({})
+
+    def test_moving_the_window_rebuilds_the_scores(self):
+        self.change(status=Order.StatusType.DELIVERED, delivered_date=self.today - timedelta(days=20))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.site.competition_start = self.today - timedelta(days=30)
+            self.site.save()
+        self.assertEqual(self.scores(), {self.seller.pk: 1})
+
+
+class PricingTest(MarketplaceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.product = make_product(price=100_000)
+
+    def test_order_total(self):
+        self.assertEqual(order_total(100_000, 3, thread_discount=10_000, delivery_price=20_000), 290_000)
+        # скидка потока больше цены — товар бесплатный, доставка остаётся
+        self.assertEqual(order_total(100_000, 2, thread_discount=150_000, delivery_price=20_000), 20_000)
+        self.assertEqual(order_total(100_000, 1, site_discount=250_000, delivery_price=20_000), 20_000)
+        self.assertEqual(order_total(100_000, 2, site_discount=50_000), 150_000)
+
+    def test_operator_edits_do_not_grow_the_total(self):
+        operator = self.login(make_user('998900000015', User.RoleType.OPERATOR))
+        order = self.make_order(self.product)
+        reserve(order)
+        url = reverse('order-update', kwargs={'pk': order.pk})
+        for _ in range(3):
+            self.client.get(url)
+            response = self.client.post(url, {'quantity': 2, 'district': self.district.pk,
+                                              'status': Order.StatusType.READY_TO_DELIVERY,
+                                              'delivered_date': timezone.localdate().isoformat()})
+            self.assertRedirects(response, reverse('operator-orders'), fetch_redirect_response=False)
+            order.refresh_from_db()
+            self.assertEqual(order.total, 220_000)
+        self.assertEqual(order.operator, operator)
+
+    def test_reprice_orders_writes_only_changed_rows(self):
+        stale = self.make_order(self.product)
+        current = self.make_order(self.product, total=120_000)
+        delivered = self.make_order(self.product, status=Order.StatusType.DELIVERED)
+        with CaptureQueriesContext(connection) as captured:
+            self.assertEqual(reprice_orders(Order.objects.filter(status=Order.StatusType.NEW)), 1)
+        updates = [query['sql'] for query in captured.captured_queries if query['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+        # bulk_update пишет по одной ветке CASE на строку: только stale
+        self.assertEqual(updates[0].count(' THEN '), 1)
+        stale.refresh_from_db()
+        self.assertEqual(stale.total, 120_000)
+
+        call_command('reprice_orders', status=[Order.StatusType.DELIVERED], stdout=StringIO())
+        for order, total in ((stale, 120_000), (current, 120_000), (delivered, 120_000)):
+            order.refresh_from_db()
+            self.assertEqual(order.total, total)
+
+    def test_reprice_command_defaults_to_new_orders(self):
+        delivered = self.make_order(self.product, status=Order.StatusType.DELIVERED)
+        call_command('reprice_orders', stdout=StringIO())
+        delivered.refresh_from_db()
+        self.assertEqual(delivered.total, 100)
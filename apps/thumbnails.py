@@ -0,0 +1,100 @@
+import hashlib
+import io
+import threading
+
+from PIL import Image, ImageOps, features
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+THUMBNAILS_KEY = 'thumbs:{}:{}:{}'
+THUMBNAIL_DIR = 'thumbs'
+# битый или отсутствующий файл не читаем заново на каждом запросе
+FAILED_TIMEOUT = 300
+
+
+def get_widths():
+    return tuple(getattr(settings, 'THUMBNAIL_WIDTHS', (240, 480, 960)))
+
+
+def get_format():
+    # собранный без libwebp Pillow не умеет писать WebP
+    return 'WEBP' if features.check('webp') else 'JPEG'
+
+
+def _content_hash(content):
+    return hashlib.sha1(content).hexdigest()[:16]
+
+
+def _thumbnail_name(digest, width, fmt):
+    extension = 'webp' if fmt == 'WEBP' else 'jpg'
+    return f'{THUMBNAIL_DIR}/{digest[:2]}/{digest}-{width}.{extension}'
+
+
+def _resize(image, width, fmt):
+    height = round(image.height * width / image.width)
+    resized = image.resize((width, height), Image.Resampling.LANCZOS)
+    if fmt == 'JPEG' and resized.mode != 'RGB':
+        resized = resized.convert('RGB')
+    elif resized.mode not in ('RGB', 'RGBA'):
+        resized = resized.convert('RGBA' if 'A' in resized.getbands() else 'RGB')
+    options = {'method': 4} if fmt == 'WEBP' else {'optimize': True, 'progressive': True}
+    buffer = io.BytesIO()
+    resized.save(buffer, fmt, quality=getattr(settings, 'THUMBNAIL_QUALITY', 80), **options)
+    return buffer.getvalue()
+
+
+def generate_thumbnails(name):
+    """Returns [(width, storage name)] for an original in default_storage, creating missing variants.
+
+    The original itself is the last entry, so the list is a complete srcset.
+    """
+    with default_storage.open(name, 'rb') as fh:
+        content = fh.read()
+    digest = _content_hash(content)
+    fmt = get_format()
+
+    image = ImageOps.exif_transpose(Image.open(io.BytesIO(content)))
+    variants = []
+    # больше оригинала не растягиваем
+    for width in sorted(set(get_widths())):
+        if width >= image.width:
+            break
+        thumbnail = _thumbnail_name(digest, width, fmt)
+        if not default_storage.exists(thumbnail):
+            default_storage.save(thumbnail, ContentFile(_resize(image, width, fmt)))
+        variants.append((width, thumbnail))
+    variants.append((image.width, name))
+    return variants
+
+
+def _cache_key(name):
+    # смена размеров или формата в настройках — новые ключи
+    return THUMBNAILS_KEY.format(name, get_format(), ','.join(map(str, sorted(set(get_widths())))))
+
+
+def get_thumbnails(name):
+    # имя оригинала не меняется: новая загрузка получает новое имя, поэтому кэшируем без срока
+    if not name:
+        return []
+    key = _cache_key(name)
+    variants = cache.get(key)
+    if variants is not None:
+        return variants
+    try:
+        variants = generate_thumbnails(name)
+    except OSError:
+        cache.set(key, [], FAILED_TIMEOUT)
+        return []
+    cache.set(key, variants, None)
+    return variants
+
+
+def warm_thumbnails(name):
+    # при загрузке режем превью в фоне, чтобы первый посетитель не ждал
+    if not name or cache.get(_cache_key(name)) is not None:
+        return None
+    thread = threading.Thread(target=get_thumbnails, args=(name,), daemon=True)
+    thread.start()
+    return thread
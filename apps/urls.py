@@ -8,7 +8,7 @@ from django.conf.urls.static import static
 from apps.views import HomeListView, AuthFormView, ProductListView, ProfileUpdateView, district_view, \
     UserChangePassword, SearchProductListView, ProductDetailView, OrderListView, wishlist_view, WishListView, \
     MarketListView, ThreadCreateView, ThreadTListView, ThreadDetailView, StatisticListView, CompetitionListView, \
-    WithdrawCreateView, OperatorOrderListView, OrderUpdateView, region_order_counts, OrderDiagramView
+    WithdrawCreateView, OperatorOrderListView, OrderUpdateView, region_order_counts, OrderDiagramView, claim_orders_view
 
 urlpatterns = [
     path('', HomeListView.as_view(), name='home'),
@@ -32,6 +32,7 @@ urlpatterns = [
     path('withdraw-form', WithdrawCreateView.as_view(), name='withdraw-form'),
     path('operator/order/list', OperatorOrderListView.as_view(), name='operator-orders'),
     path('operator/order/update/<int:pk>', OrderUpdateView.as_view(), name='order-update'),
+    path('operator/order/claim', claim_orders_view, name='order-claim'),
     path('order/diagram/', OrderDiagramView.as_view(), name='order_diagram'),
     path('order/diagram/data/', region_order_counts, name='region_order_counts'),
 
@@ -2,38 +2,60 @@ from itertools import product
 from re import search
 from tracemalloc import Statistic
 
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.hashers import check_password
 from django.contrib.sites.models import Site
+from django.db import transaction, IntegrityError
 from django.db.models import Q, Sum, Count, F
 from django.utils.translation import gettext as _
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import login, logout
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.http import JsonResponse
+from django.http import JsonResponse, Http404
 from django.shortcuts import render, redirect, get_object_or_404
 from django.urls import reverse_lazy
+from django.utils.dateparse import parse_date
 from django.views.generic import ListView, FormView, View, UpdateView, DetailView, CreateView, TemplateView
 
+from apps.cache import invalidate_wishlist, get_categories, aget_districts
+from apps.claims import claim_order, claim_next, unclaimed
 from apps.forms import AuthForm, ProfileModelForm, ChangePasswordForm, OrderModelForm, ThreadModelForm, \
     WithdrawModelForm, OrderUpdateModelForm
-from apps.models import Category, Product, User, Region, District, Order, WishList, Thread, SiteSettings, \
-    Withdraw
+from apps.mixins import KeysetPaginationMixin, RenderProfileMixin, OperatorRequiredMixin
+from apps.pricing import price_order
+from apps.ratelimit import RateLimitMixin, ratelimit
+from apps.models import Product, User, Region, Order, WishList, Thread, \
+    Withdraw, ThreadStatistic
+from apps.leaderboard import top_sellers
+from apps.dedupe import new_idempotency_key, order_fingerprint, order_by_key, is_resubmission, recent_order, \
+    remember_order
+from apps.inventory import reserve, sync_reservation, OutOfStock
+from apps.ledger import withdraw_funds, InsufficientFunds
+from apps.search import search_products
+from apps.stats import sum_statistics, region_rollup_counts
+from apps.visits import visit_buffer
 
 
 # Create your views here.
-class HomeListView(ListView):
-    queryset = Category.objects.all()
+class HomeListView(RenderProfileMixin, KeysetPaginationMixin, ListView):
+    queryset = Product.objects.all()
     template_name = 'apps/home.html'
-    context_object_name = 'categories'
+    context_object_name = 'products'
+    select_related = ('category',)
+    prefetch_related = ('translations', 'category__translations')
+    query_budget = 10
+    keyset_ordering = ('-create_at', '-id')
+    json_fields = ('id', 'slug', 'name', 'price', 'image.url', 'category.name')
 
     def get_context_data(self, *args, **kwargs):
         data = super().get_context_data(*args, **kwargs)
-        data['products'] = Product.objects.all()
+        data['categories'] = get_categories()
         return data
 
 
-class AuthFormView(FormView):
+class AuthFormView(RateLimitMixin, FormView):
+    ratelimit_group = 'auth'
     form_class = AuthForm
     success_url = reverse_lazy('home')
     template_name = 'apps/auth/auth-page.html'
@@ -55,10 +77,15 @@ class LoginView(View):
         return redirect('auth')
 
 
-class ProductListView(ListView):
+class ProductListView(RenderProfileMixin, KeysetPaginationMixin, ListView):
     queryset = Product.objects.all()
     template_name = 'apps/product-list.html'
     context_object_name = 'products'
+    select_related = ('category',)
+    prefetch_related = ('translations', 'category__translations')
+    query_budget = 10
+    keyset_ordering = ('-create_at', '-id')
+    json_fields = ('id', 'slug', 'name', 'price', 'image.url', 'category.name')
 
     def get_queryset(self):
         c_slug = self.request.GET.get('category_slug')
@@ -69,7 +96,7 @@ class ProductListView(ListView):
 
     def get_context_data(self, *args, **kwargs):
         data = super().get_context_data(*args, **kwargs)
-        data['categories'] = Category.objects.all()
+        data['categories'] = get_categories()
         data['c_slug'] = self.request.GET.get('category_slug')
         return data
 
@@ -91,11 +118,12 @@ class ProfileUpdateView(LoginRequiredMixin, UpdateView):
         return data
 
 
-def district_view(request):
-    region_id = request.GET.get('region_id')
-    districts = District.objects.filter(region_id=region_id).values('id', 'name')
-    data = [{"id": district.get('id'), 'name': district.get('name')} for district in districts]
-    return JsonResponse(data, safe=False)
+async def district_view(request):
+    region_id = request.GET.get('region_id', '')
+    if not region_id.isdigit():
+        return JsonResponse([], safe=False)
+    districts = await aget_districts(int(region_id))
+    return JsonResponse(districts, safe=False)
 
 
 class UserChangePassword(LoginRequiredMixin, FormView):
@@ -118,22 +146,28 @@ class UserChangePassword(LoginRequiredMixin, FormView):
         return super().form_invalid(form)
 
 
-class SearchProductListView(ListView):
+class SearchProductListView(RenderProfileMixin, ListView):
     queryset = Product.objects.all()
     template_name = 'apps/search-product-list.html'
     context_object_name = 'products'
+    select_related = ('category',)
+    prefetch_related = ('translations', 'category__translations')
+    query_budget = 10
 
     def get_queryset(self):
+        queryset = super().get_queryset()
         search = self.request.GET.get('search', '')
-        query = Product.objects.translated().filter(
-            Q(translations__name__icontains=search) |
-            Q(translations__description__icontains=search) |
-            Q(category__translations__name__icontains=search)
-        ).distinct()
-        return query
+        if not search.strip():
+            return queryset
+        return search_products(search, queryset=queryset)
+
 
+def _posted_id(value):
+    return int(value) if value and value.isdigit() else None
 
-class ProductDetailView(CreateView):
+
+class ProductDetailView(RateLimitMixin, CreateView):
+    ratelimit_group = 'order'
     queryset = Product.objects.all()
     form_class = OrderModelForm
     template_name = 'apps/order/order-form.html'
@@ -143,20 +177,68 @@ class ProductDetailView(CreateView):
         product_slug = self.kwargs.get('slug')
         data = super().get_context_data(**kwargs)
         data['product'] = Product.objects.get(slug=product_slug)
+        data['idempotency_key'] = new_idempotency_key()
         return data
 
+    def ratelimit_exempt(self, request):
+        # повтор уже принятой формы получит свою квитанцию в form_valid и не тратит лимит телефона.
+        # Проверка та же, что в form_valid, и товар из формы должен совпадать с товаром страницы:
+        # иначе чужой ключ с другим product давал бы заказы без лимита
+        product_id, thread_id = (_posted_id(request.POST.get(field)) for field in ('product', 'thread'))
+        order = order_by_key(request.POST.get('idempotency_key'))
+        return is_resubmission(order, product_id, thread_id) \
+            and Product.objects.filter(pk=product_id, slug=self.kwargs.get('slug')).exists()
+
     def form_valid(self, form):
-        form.instance.total = form.cleaned_data['product'].price
+        # повтор той же формы (двойной клик, ретрай) получает страницу уже принятого заказа
+        key = form.cleaned_data.get('idempotency_key') or None
+        product_id, thread_id = form.instance.product_id, form.instance.thread_id
+        taken = order_by_key(key)
+        if is_resubmission(taken, product_id, thread_id):
+            return self.render_receipt(taken)
+        if taken is not None:
+            # ключ от формы другого товара — это не повтор, заказ оформляем без ключа
+            key = None
+
+        # тот же покупатель только что заказал то же самое из новой формы: показываем прежний заказ
+        # и даём оформить ещё один, а не молча теряем его
+        fingerprint = order_fingerprint(form.cleaned_data.get('phone_number'), product_id, thread_id)
+        if not form.cleaned_data.get('repeat'):
+            previous = recent_order(fingerprint)
+            if previous is not None:
+                return self.render_receipt(previous, repeat_form=form)
+
+        form.instance.idempotency_key = key
+        form.instance.total = price_order(form.instance)
         form.instance.customer = self.request.user  # Вот здесь указываем текущего пользователя как заказчика
-        self.object = form.save()
-        site = SiteSettings.objects.first()
-        return render(self.request, 'apps/order/order-receive.html', context={'order': self.object, 'site': site})
-
-
-class OrderListView(LoginRequiredMixin, ListView):
+        try:
+            with transaction.atomic():
+                self.object = form.save()
+                reserve(self.object)
+        except OutOfStock:
+            form.add_error(None, _('This product is out of stock.'))
+            return self.form_invalid(form)
+        except IntegrityError:
+            # параллельный запрос с тем же ключом успел вставить заказ между проверкой и нашей вставкой
+            duplicate = order_by_key(key)
+            if not is_resubmission(duplicate, product_id, thread_id):
+                raise
+            return self.render_receipt(duplicate)
+        remember_order(fingerprint, self.object)
+        return self.render_receipt(self.object)
+
+    def render_receipt(self, order, repeat_form=None):
+        return render(self.request, 'apps/order/order-receive.html',
+                      context={'order': order, 'repeat_form': repeat_form})
+
+
+class OrderListView(LoginRequiredMixin, RenderProfileMixin, KeysetPaginationMixin, ListView):
     queryset = Order.objects.all()
     template_name = 'apps/order/order-list.html'
     context_object_name = 'orders'
+    select_related = ('district__region',)
+    query_budget = 5
+    json_fields = ('id', 'fullname', 'phone_number', 'status', 'total', 'created_at')
 
     def get_queryset(self):
         query = super().get_queryset().filter(customer=self.request.user)
@@ -165,10 +247,11 @@ class OrderListView(LoginRequiredMixin, ListView):
 
 @login_required
 def wishlist_view(request, pk):
-    query = WishList.objects.filter(user=request.user, product_id=pk)
-
-    if query.exists():
-        query.delete()
+    # из-за post_delete-приёмника queryset.delete() сначала выбирает строки; _raw_delete — один DELETE
+    # без сигналов, поэтому кэш сбрасываем сами. Добавление сбросит кэш через post_save
+    wishlist = WishList.objects.filter(user=request.user, product_id=pk)
+    if wishlist._raw_delete(wishlist.db):
+        invalidate_wishlist(request.user.pk)
     else:
         WishList.objects.create(user=request.user, product_id=pk)
 
@@ -176,33 +259,47 @@ def wishlist_view(request, pk):
     return redirect(next_url)
 
 
-class WishListView(ListView):
+class WishListView(RenderProfileMixin, KeysetPaginationMixin, ListView):
     queryset = WishList.objects.all()
     template_name = 'apps/auth/wishlist.html'
     context_object_name = 'wishlists'
+    select_related = ('product__category',)
+    prefetch_related = ('product__translations', 'product__category__translations')
+    query_budget = 8
+    keyset_ordering = ('-id',)
+    json_fields = ('id', 'product.id', 'product.slug', 'product.name', 'product.price', 'product.image.url')
 
     def get_queryset(self):
         query = super().get_queryset().filter(user=self.request.user)
         return query
 
 
-class MarketListView(ListView):
+class MarketListView(RenderProfileMixin, KeysetPaginationMixin, ListView):
     queryset = Product.objects.all()
     template_name = 'apps/market/market-list.html'
     context_object_name = 'products'
+    prefetch_related = ('translations',)
+    query_budget = 8
+    keyset_ordering = ('-create_at', '-id')
+    json_fields = ('id', 'slug', 'name', 'price', 'seller_prise', 'quantity', 'image.url', 'message_id')
+
+    def get_keyset_ordering(self):
+        if self.request.GET.get('category_slug') == 'top':
+            return '-order_count', '-id'
+        return super().get_keyset_ordering()
 
     def get_queryset(self):
         category_slug = self.request.GET.get('category_slug')
         query = super().get_queryset()
         if category_slug == 'top':
-            query = query.annotate(order_count=Count('orders')).order_by('-orders')
+            query = query.annotate(order_count=Count('orders'))
         elif category_slug:
             query = query.filter(category__slug=category_slug)
         return query
 
     def get_context_data(self, *args, **kwargs):
         data = super().get_context_data(*args, **kwargs)
-        data['categories'] = Category.objects.all()
+        data['categories'] = get_categories()
         data['c_slug'] = self.request.GET.get('category_slug')
         return data
 
@@ -215,8 +312,8 @@ class ThreadCreateView(CreateView):
 
     def get_context_data(self, **kwargs):
         data = super().get_context_data(**kwargs)
-        data['categories'] = Category.objects.all()
-        data['products'] = Product.objects.all()
+        data['categories'] = get_categories()
+        data['products'] = Product.objects.prefetch_related('translations')
         return data
 
     def form_valid(self, form):
@@ -250,66 +347,36 @@ class ThreadDetailView(DetailView):
     def get_context_data(self, **kwargs):
         data = super().get_context_data(**kwargs)
         thread = data.get('thread')
-        thread.visit_count += 1
-        thread.save()
+        visit_buffer.record(thread.pk)
+        thread.visit_count += visit_buffer.pending(thread.pk)
         data['product'] = self.object.product
+        data['idempotency_key'] = new_idempotency_key()
         return data
 
 
-class StatisticListView(ListView):
-    queryset = Thread.objects.all()
+class StatisticListView(LoginRequiredMixin, RenderProfileMixin, ListView):
+    queryset = ThreadStatistic.objects.all()
     template_name = 'apps/market/statistics.html'
-    context_object_name = 'threads'
+    context_object_name = 'statistics'
+    select_related = ('thread__product',)
+    prefetch_related = ('thread__product__translations',)
+    query_budget = 6
 
     def get_queryset(self):
-        query = super().get_queryset().filter(owner=self.request.user).annotate(
-            new_count=Count('orders', filter=Q(orders__status=Order.StatusType.NEW)),
-            ready_count=Count('orders', filter=Q(orders__status=Order.StatusType.READY_TO_DELIVERY)),
-            delivering_count=Count('orders', filter=Q(orders__status=Order.StatusType.DELIVERING)),
-            delivered_count=Count('orders', filter=Q(orders__status=Order.StatusType.DELIVERED)),
-            not_call_count=Count('orders', filter=Q(orders__status=Order.StatusType.NOT_CALL)),
-            canceled_count=Count('orders', filter=Q(orders__status=Order.StatusType.CANCELED)),
-            archived_count=Count('orders', filter=Q(orders__status=Order.StatusType.ARCHIVED)),
-        ).values(
-            'visit_count', 'product__translations__name', 'name',
-            'new_count', 'ready_count', 'delivering_count',
-            'delivered_count', 'not_call_count', 'canceled_count', 'archived_count'
-        )
-        return query
+        return super().get_queryset().filter(thread__owner=self.request.user).order_by('-thread__created_at')
 
     def get_context_data(self, *args, **kwargs):
-        tmp = self.get_queryset().aggregate(
-            visit_total=Sum('visit_count'),
-            new_total=Sum('new_count'),
-            ready_total=Sum('ready_count'),
-            delivering_total=Sum('delivering_count'),
-            delivered_total=Sum('delivered_count'),
-            not_call_total=Sum('not_call_count'),
-            canceled_total=Sum('canceled_count'),
-            archived_total=Sum('archived_count'),
-        )
-        data = super().get_context_data()
-        data.update(tmp)
+        data = super().get_context_data(*args, **kwargs)
+        data.update(sum_statistics(data['statistics']))
         return data
 
 
 class CompetitionListView(ListView):
-    queryset = User.objects.all()
     template_name = "apps/market/competition.html"
     context_object_name = "sellers"
 
     def get_queryset(self):
-        query = super().get_queryset().annotate(
-            order_count=Count('threads__orders',
-            filter=Q(threads__orders__status=Order.StatusType.DELIVERED))).filter(
-            order_count__gt=1).values('order_count', 'first_name', 'last_name')
-
-        return query
-
-    def get_context_data(self, *args, **kwargs):
-        data =super().get_context_data(*args, **kwargs)
-        data['site'] = SiteSettings.objects.first()
-        return data
+        return top_sellers(limit=settings.LEADERBOARD_SIZE)
 
 
 class WithdrawCreateView(LoginRequiredMixin,CreateView):
@@ -329,10 +396,14 @@ class WithdrawCreateView(LoginRequiredMixin,CreateView):
         return context
 
     def form_valid(self, form):
-        user = self.request.user
-        user.balance -= form.instance.amount
-        user.save()
-        return super().form_valid(form)
+        try:
+            with transaction.atomic():
+                self.object = form.save()
+                withdraw_funds(self.object)
+        except InsufficientFunds:
+            form.add_error('amount', _("You don't have enough money."))
+            return self.form_invalid(form)
+        return redirect(self.get_success_url())
 
     def form_invalid(self, form):
         for error in form.errors.values():
@@ -342,33 +413,37 @@ class WithdrawCreateView(LoginRequiredMixin,CreateView):
 
 
 
-class OperatorOrderListView(ListView):
+class OperatorOrderListView(OperatorRequiredMixin, RenderProfileMixin, KeysetPaginationMixin, ListView):
     queryset = Order.objects.all()
     template_name ='apps/operator/operator-page.html'
     context_object_name = 'orders'
+    select_related = ('product', 'thread', 'district__region')
+    prefetch_related = ('product__translations',)
+    query_budget = 10
+    keyset_ordering = ('created_at', 'id')
+    json_fields = ('id', 'product.name', 'total', 'quantity', 'status', 'district.name', 'created_at')
 
     def get_queryset(self):
         status = self.request.GET.get('status','new')
         category_id = self.request.GET.get('category_id')
         district_id = self.request.GET.get('district_id')
         query = super().get_queryset()
-        Order.objects.filter(operator=self.request.user).update(hold=False)
         if category_id:
-            query = Order.objects.filter(product__category_id=category_id)
+            query = query.filter(product__category_id=category_id)
         if district_id:
-            query = Order.objects.filter(district_id=district_id)
+            query = query.filter(district_id=district_id)
 
 
         if status!='new':
             query = query.filter(operator=self.request.user,status=status)
         else:
-            query = query.filter(status=status)
+            query = query.filter(unclaimed() | Q(operator=self.request.user), status=status)
         return query
 
     def get_context_data(self,*args, **kwargs):
         data = super().get_context_data(*args, **kwargs)
         data['status']=Order.StatusType.values
-        data['categories']=Category.objects.all()
+        data['categories']=get_categories()
         data['regions']=Region.objects.all()
         category_id = self.request.GET.get('category_id')
         district_id = self.request.GET.get('district_id')
@@ -382,8 +457,8 @@ class OperatorOrderListView(ListView):
 
 
 
-class OrderUpdateView(UpdateView):
-    queryset = Order.objects.all()
+class OrderUpdateView(OperatorRequiredMixin, UpdateView):
+    queryset = Order.objects.select_related('product', 'thread')
     template_name = 'apps/operator/order-change.html'
     context_object_name = 'order'
     pk_url_kwarg = 'pk'
@@ -391,10 +466,33 @@ class OrderUpdateView(UpdateView):
     success_url = reverse_lazy('operator-orders')
 
     def get(self,request,*args,**kwargs):
-        return_data = super().get(request,*args,**kwargs)
-        self.object.hold=True
-        self.object.save()
-        return return_data
+        return self.refuse_unclaimed(request, kwargs) or super().get(request,*args,**kwargs)
+
+    def post(self, request, *args, **kwargs):
+        # сохранение тоже только под своим закреплением: аренду мог перехватить другой оператор
+        return self.refuse_unclaimed(request, kwargs) or super().post(request, *args, **kwargs)
+
+    def refuse_unclaimed(self, request, kwargs):
+        order_id = kwargs.get(self.pk_url_kwarg)
+        if claim_order(request.user, order_id):
+            return None
+        if not Order.objects.filter(pk=order_id).exists():
+            raise Http404
+        messages.error(request, _('This order is already taken by another operator.'))
+        return redirect('operator-orders')
+
+    def form_valid(self, form):
+        # одна запись: итог, снятие закрепления и поля формы
+        form.instance.total = price_order(form.instance)
+        form.instance.claimed_until = None
+        try:
+            with transaction.atomic():
+                self.object = form.save()
+                sync_reservation(self.object)
+        except OutOfStock:
+            form.add_error('quantity', _("The quantity is incorrect."))
+            return self.form_invalid(form)
+        return redirect(self.get_success_url())
     def get_form_kwargs(self):
         kwargs = super().get_form_kwargs()
         kwargs['order'] = self.object
@@ -409,14 +507,48 @@ class OrderUpdateView(UpdateView):
         data['regions'] = Region.objects.all()
         return data
 
+@login_required
+@ratelimit('claim')
+def claim_orders_view(request):
+    if request.method != 'POST':
+        return JsonResponse({'error': 'POST required'}, status=405)
+    if request.user.role != User.RoleType.OPERATOR:
+        return JsonResponse({'error': 'Operators only'}, status=403)
+    try:
+        count = max(min(int(request.POST.get('count', settings.ORDER_CLAIM_BATCH)), 100), 1)
+    except ValueError:
+        count = settings.ORDER_CLAIM_BATCH
+    return JsonResponse({'claimed': claim_next(request.user, count)})
+
+
 class OrderDiagramView(TemplateView):
     template_name = 'apps/market/diagram.html'
-
-def region_order_counts(request):
-    regions = Region.objects.annotate(order_count=Count('districts__orders'))
+    extra_context = {'statuses': Order.StatusType.choices}
+
+def _parse_day(value):
+    if not value:
+        return None
+    day = parse_date(value)
+    if day is None:
+        raise ValueError(value)
+    return day
+
+
+async def region_order_counts(request):
+    # ?start=YYYY-MM-DD&end=YYYY-MM-DD&status=new,delivered — ответ из дневных сводок, без обхода заказов
+    statuses = [status for value in request.GET.getlist('status') for status in value.split(',') if status]
+    try:
+        start, end = _parse_day(request.GET.get('start')), _parse_day(request.GET.get('end'))
+    except ValueError:
+        return JsonResponse({'error': 'Dates must be YYYY-MM-DD'}, status=400)
+    if not set(statuses) <= set(Order.StatusType.values):
+        return JsonResponse({'error': 'Unknown status'}, status=400)
+
+    totals = {row['region_id']: row['total'] async for row in region_rollup_counts(start, end, statuses)}
+    regions = [region async for region in Region.objects.order_by('pk').values('id', 'name')]
 
     data = {
-        "regions": [region.name for region in regions],
-        "numbers": [region.order_count for region in regions]
+        "regions": [region['name'] for region in regions],
+        "numbers": [totals.get(region['id'], 0) for region in regions]
     }
     return JsonResponse(data)
\ No newline at end of file
@@ -0,0 +1,83 @@
+import atexit
+import threading
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import F
+
+
+class VisitBuffer:
+    def __init__(self, interval=None):
+        self.interval = interval
+        self._counts = Counter()
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def get_interval(self):
+        if self.interval is not None:
+            return self.interval
+        return getattr(settings, 'VISIT_FLUSH_INTERVAL', 5)
+
+    def record(self, thread_id, count=1):
+        with self._lock:
+            self._counts[thread_id] += count
+            if self._timer is None:
+                self._schedule()
+
+    def pending(self, thread_id):
+        with self._lock:
+            return self._counts.get(thread_id, 0)
+
+    def flush(self):
+        from apps.models import Thread
+
+        with self._lock:
+            counts, self._counts = self._counts, Counter()
+
+        # одно UPDATE на каждое уникальное значение прироста
+        groups = defaultdict(list)
+        for thread_id, count in counts.items():
+            groups[count].append(thread_id)
+
+        flushed = []
+        try:
+            for count, thread_ids in groups.items():
+                Thread.objects.filter(pk__in=thread_ids).update(visit_count=F('visit_count') + count)
+                flushed.append(count)
+        except Exception:
+            with self._lock:
+                for count, thread_ids in groups.items():
+                    if count in flushed:
+                        continue
+                    for thread_id in thread_ids:
+                        self._counts[thread_id] += count
+            raise
+        return sum(counts.values())
+
+    def _schedule(self):
+        self._timer = threading.Timer(self.get_interval(), self._run)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _run(self):
+        try:
+            self.flush()
+        finally:
+            # каждый сброс идёт в новом потоке Timer со своим соединением — закрываем, иначе по одному на интервал
+            connections.close_all()
+            with self._lock:
+                self._timer = None
+                if self._counts:
+                    self._schedule()
+
+    def stop(self):
+        with self._lock:
+            timer, self._timer = self._timer, None
+        if timer is not None:
+            timer.cancel()
+        self.flush()
+
+
+visit_buffer = VisitBuffer()
+atexit.register(visit_buffer.stop)